@@ -0,0 +1,182 @@
+"""
+Async facade over database.py for FastAPI handlers and background loops.
+Writes are queued to one dedicated DB worker thread, so they run in submission
+order. Reads go to a small pool of reader threads with their own pooled
+connections; under WAL they don't wait for a scrape save in progress.
+Either way, SQLite work never blocks the event loop.
+"""
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# Single writer = FIFO request queue with one pooled connection (see database.get_connection)
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-worker")
+# Readers: one pooled connection each, reading the last committed state
+READ_WORKERS = 2
+_read_executor = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix="db-reader")
+
+# Pending time-based log flush (see add_log)
+_flush_timer: Optional[threading.Timer] = None
+_flush_timer_lock = threading.Lock()
+
+
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    """Run a synchronous database callable on the DB worker thread and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+async def run_db_read(func: Callable, *args, **kwargs) -> Any:
+    """Run a read-only database callable on a reader thread (never queued behind writes)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_read_executor, functools.partial(func, *args, **kwargs))
+
+
+def _log_failure(future) -> None:
+    exc = future.exception()
+    if exc is not None:
+        logger.warning(f"Background DB write failed: {exc}")
+
+
+def _submit_log_flush() -> None:
+    try:
+        _executor.submit(database.flush_logs).add_done_callback(_log_failure)
+    except RuntimeError:
+        # Worker already shut down - write inline rather than lose the entries
+        database.flush_logs()
+
+
+def _flush_timer_fired() -> None:
+    global _flush_timer
+    with _flush_timer_lock:
+        _flush_timer = None
+    _submit_log_flush()
+
+
+def add_log(level: str, message: str) -> None:
+    """
+    Buffer a log entry without waiting for it (safe from sync and async code).
+    The buffer is written by the DB worker once LOG_FLUSH_MAX_ENTRIES are waiting or
+    LOG_FLUSH_INTERVAL seconds after the first unflushed entry, whichever comes first.
+    get_logs() flushes before reading, so it always sees every entry added before it.
+    """
+    global _flush_timer
+    if database.buffer_log(level, message) >= database.LOG_FLUSH_MAX_ENTRIES:
+        _submit_log_flush()
+        return
+    with _flush_timer_lock:
+        if _flush_timer is None:
+            _flush_timer = threading.Timer(database.LOG_FLUSH_INTERVAL, _flush_timer_fired)
+            _flush_timer.daemon = True
+            _flush_timer.start()
+
+
+async def shutdown() -> None:
+    """Flush buffered logs, drain queued work, close pooled connections and stop the worker."""
+    global _flush_timer
+    with _flush_timer_lock:
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+    _read_executor.shutdown(wait=True)
+    await run_db(database.flush_logs)
+    await run_db(database.close_all_connections)
+    _executor.shutdown(wait=True)
+
+
+def _writer(func: Callable) -> Callable:
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+    return wrapper
+
+
+def _reader(func: Callable) -> Callable:
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db_read(func, *args, **kwargs)
+    return wrapper
+
+
+# Awaitable versions of the database accessors (same names and signatures).
+# Anything that writes - including get_logs, which flushes the log buffer first - is a _writer.
+
+# Legacy / logs
+save_scraped_data = _writer(database.save_scraped_data)
+get_latest_scraped_data = _reader(database.get_latest_scraped_data)
+get_all_scraped_data = _reader(database.get_all_scraped_data)
+get_scraped_data_by_id = _reader(database.get_scraped_data_by_id)
+get_scraped_data_history = _reader(database.get_scraped_data_history)
+get_logs = _writer(database.get_logs)
+clear_logs = _writer(database.clear_logs)
+add_scrape_history = _writer(database.add_scrape_history)
+get_scrape_history = _reader(database.get_scrape_history)
+
+# Bills & documents
+upsert_bill = _writer(database.upsert_bill)
+get_all_bills = _reader(database.get_all_bills)
+get_bill_by_id = _reader(database.get_bill_by_id)
+upsert_bill_document = _writer(database.upsert_bill_document)
+get_bill_document = _reader(database.get_bill_document)
+get_all_bill_documents_with_periods = _reader(database.get_all_bill_documents_with_periods)
+get_latest_bill_id_with_document = _reader(database.get_latest_bill_id_with_document)
+delete_bill_document = _writer(database.delete_bill_document)
+migrate_legacy_pdf = _writer(database.migrate_legacy_pdf)
+
+# Payments
+upsert_payment = _writer(database.upsert_payment)
+get_all_payments = _reader(database.get_all_payments)
+get_latest_payment = _reader(database.get_latest_payment)
+get_payments_for_bill = _reader(database.get_payments_for_bill)
+get_payment_by_id = _reader(database.get_payment_by_id)
+update_payment_bill = _writer(database.update_payment_bill)
+update_payment_order = _writer(database.update_payment_order)
+clear_payment_manual_audit = _writer(database.clear_payment_manual_audit)
+get_most_recent_bill_payment_count = _reader(database.get_most_recent_bill_payment_count)
+get_payments_by_user = _reader(database.get_payments_by_user)
+get_all_bills_with_payments = _reader(database.get_all_bills_with_payments)
+auto_assign_expired_pending_payments = _writer(database.auto_assign_expired_pending_payments)
+wipe_bills_and_payments = _writer(database.wipe_bills_and_payments)
+reassign_payment_bills = _writer(database.reassign_payment_bills)
+
+# Balance
+record_account_balance = _writer(database.record_account_balance)
+get_current_balance = _reader(database.get_current_balance)
+
+# Payees & cards
+create_payee_user = _writer(database.create_payee_user)
+get_payee_users = _reader(database.get_payee_users)
+get_default_payee = _reader(database.get_default_payee)
+delete_payee_user = _writer(database.delete_payee_user)
+update_payee_user = _writer(database.update_payee_user)
+update_payee_responsibilities = _writer(database.update_payee_responsibilities)
+calculate_all_payee_balances = _reader(database.calculate_all_payee_balances)
+get_bill_payee_summary = _reader(database.get_bill_payee_summary)
+get_all_bill_summaries = _reader(database.get_all_bill_summaries)
+add_user_card = _writer(database.add_user_card)
+get_user_by_card = _reader(database.get_user_by_card)
+get_user_cards = _reader(database.get_user_cards)
+update_user_card = _writer(database.update_user_card)
+delete_user_card = _writer(database.delete_user_card)
+
+# Attribution
+attribute_payment = _writer(database.attribute_payment)
+clear_payment_attribution = _writer(database.clear_payment_attribution)
+get_unverified_payments = _reader(database.get_unverified_payments)
+
+# Sync & ledger
+sync_from_scrape = _writer(database.sync_from_scrape)
+get_ledger_data = _reader(database.get_ledger_data)
+
+# MQTT outbox
+enqueue_mqtt_messages = _writer(database.enqueue_mqtt_messages)
+get_mqtt_outbox = _reader(database.get_mqtt_outbox)
+delete_mqtt_outbox = _writer(database.delete_mqtt_outbox)
+get_mqtt_outbox_stats = _reader(database.get_mqtt_outbox_stats)
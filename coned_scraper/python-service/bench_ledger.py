@@ -0,0 +1,165 @@
+"""
+Benchmark ledger reads: query count and latency at 10, 100 and 1,000 bills.
+Compares the grouped implementations of get_ledger_data and get_all_bills_with_payments
+against the old per-bill (N+1) loops they replaced.
+
+Usage: python bench_ledger.py [--payments-per-bill 3] [--runs 20]
+Uses a throwaway DATA_DIR, never the real database.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="coned_bench_")
+
+import database  # noqa: E402  (must import after DATA_DIR is set)
+from database import db_connection, get_connection  # noqa: E402
+
+BILL_COUNTS = [10, 100, 1000]
+
+
+def seed(bill_count: int, payments_per_bill: int) -> None:
+    """Replace bills/payments with bill_count synthetic bills and their payments."""
+    with db_connection() as conn:
+        conn.execute('DELETE FROM payments')
+        conn.execute('DELETE FROM bills')
+        conn.execute('DELETE FROM payee_users')
+        conn.execute("INSERT INTO payee_users (name, is_default, created_at) VALUES ('Bench', 1, '2020-01-01')")
+        user_id = conn.execute('SELECT id FROM payee_users').fetchone()[0]
+        for i in range(bill_count):
+            year, month = 2000 + i // 12, i % 12 + 1
+            cycle = f"{month}/15/{year}"
+            cur = conn.execute(
+                'INSERT INTO bills (bill_cycle_date, bill_cycle_iso, month_range, bill_total, first_scraped_at, '
+                'last_scraped_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (cycle, database.parse_us_date_to_sortable(cycle), f"bench {i}", "$100.00", "2020-01-01", "2020-01-01"),
+            )
+            bill_id = cur.lastrowid
+            conn.executemany(
+                'INSERT INTO payments (bill_id, payment_date, payment_date_iso, amount, description, payment_hash, '
+                'payee_user_id, first_scraped_at, last_scraped_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(bill_id, f"{month}/{20 + j}/{year}", f"{year}-{month:02d}-{20 + j}", "$50.00", "Payment",
+                  f"{i}-{j}", user_id, "2020-01-01", "2020-01-01") for j in range(payments_per_bill)],
+            )
+
+
+def legacy_get_all_bills_with_payments():
+    """Previous implementation: one payments query per bill."""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM bills')
+        bills = [dict(row) for row in cursor.fetchall()]
+        for bill in bills:
+            cursor.execute('''
+                SELECT p.*, u.name as payee_name FROM payments p
+                LEFT JOIN payee_users u ON p.payee_user_id = u.id
+                WHERE p.bill_id = ?
+                ORDER BY
+                    CASE WHEN p.manual_order IS NOT NULL THEN 1 ELSE 0 END,
+                    p.payment_date_iso DESC,
+                    p.first_scraped_at DESC,
+                    p.manual_order ASC
+            ''', (bill['id'],))
+            bill['payments'] = [dict(row) for row in cursor.fetchall()]
+        cursor.execute('''
+            SELECT p.*, u.name as payee_name FROM payments p
+            LEFT JOIN payee_users u ON p.payee_user_id = u.id
+            WHERE p.bill_id IS NULL
+            ORDER BY p.payment_date_iso DESC
+        ''')
+        orphan_payments = [dict(row) for row in cursor.fetchall()]
+        return {'bills': database.sort_bills_by_date(bills, desc=True), 'orphan_payments': orphan_payments}
+
+
+def legacy_get_ledger_data():
+    """Previous ledger view: first 50 bills, sorted in Python, one payments query per bill."""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        balance = database.get_current_balance()
+        cursor.execute('SELECT * FROM bills LIMIT 50')
+        bills = database.sort_bills_by_date([dict(row) for row in cursor.fetchall()], desc=True)
+        cursor.execute('SELECT bill_id FROM bill_documents')
+        bills_with_pdf = {row['bill_id'] for row in cursor.fetchall()}
+        for bill in bills:
+            bill['pdf_exists'] = bill['id'] in bills_with_pdf
+            cursor.execute('''
+                SELECT p.*, u.name as payee_name FROM payments p
+                LEFT JOIN payee_users u ON p.payee_user_id = u.id
+                WHERE p.bill_id = ?
+                ORDER BY
+                    CASE WHEN p.manual_order IS NOT NULL THEN 1 ELSE 0 END,
+                    p.payment_date DESC,
+                    p.first_scraped_at DESC,
+                    p.manual_order ASC
+            ''', (bill['id'],))
+            bill['payments'] = [dict(row) for row in cursor.fetchall()]
+        cursor.execute('''
+            SELECT p.*, u.name as payee_name FROM payments p
+            LEFT JOIN payee_users u ON p.payee_user_id = u.id
+            WHERE p.bill_id IS NULL
+            ORDER BY
+                CASE WHEN p.manual_order IS NOT NULL THEN 0 ELSE 1 END,
+                p.manual_order ASC,
+                p.payment_date DESC,
+                p.first_scraped_at ASC
+        ''')
+        orphan_payments = [dict(row) for row in cursor.fetchall()]
+        return {
+            'account_balance': balance['balance'] if balance else None,
+            'balance_updated_at': balance['scraped_at'] if balance else None,
+            'latest_payment': database.get_latest_payment(),
+            'latest_bill': bills[0] if bills else None,
+            'bills': bills,
+            'orphan_payments': orphan_payments,
+        }
+
+
+def measure(func, runs: int):
+    """Return (queries per call, median ms, p95 ms)."""
+    conn = get_connection()
+    queries = []
+
+    def count(statement):
+        if statement.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE")):
+            queries.append(statement)
+
+    conn.set_trace_callback(count)
+    func()
+    conn.set_trace_callback(None)
+    query_count = len(queries)
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return query_count, statistics.median(timings), p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--payments-per-bill", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    cases = [
+        ("get_ledger_data", database.get_ledger_data),
+        ("legacy get_ledger_data (N+1)", legacy_get_ledger_data),
+        ("get_all_bills_with_payments", database.get_all_bills_with_payments),
+        ("legacy bills_with_payments (N+1)", legacy_get_all_bills_with_payments),
+    ]
+    print(f"{'bills':>6}  {'function':<34} {'queries':>7} {'median ms':>10} {'p95 ms':>8}")
+    for bill_count in BILL_COUNTS:
+        seed(bill_count, args.payments_per_bill)
+        for name, func in cases:
+            queries, median, p95 = measure(func, args.runs)
+            print(f"{bill_count:>6}  {name:<34} {queries:>7} {median:>10.2f} {p95:>8.2f}")
+    database.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
-from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 import asyncio
 import logging
 import time
-from database import add_log, save_scraped_data
+from async_database import add_log, save_scraped_data
+from browser_manager import get_browser_manager
+from page_waits import get_wait_strategy
+from request_policy import RequestBlocker
+from ledger_capture import LedgerCaptureState, LedgerResponseCapture, parse_ledger_json
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,6 +17,27 @@ SCREENSHOT_FILENAME = "account_balance.png"
 # Live preview screenshot for console display
 LIVE_PREVIEW_FILENAME = "live_preview.png"
 
+ACCOUNT_URL = "https://www.coned.com/en/accounts-billing/my-account"
+# Present on the account page only when logged in
+BALANCE_CARD_SELECTOR = '[class*="overview-bill-card__price"]'
+# ConEd's own MFA code field (see the full list in _login_with_credentials)
+MFA_FIELD_SELECTOR = 'input#form-login-mta-code, input[name="LoginMFACode"], input[id*="mta"]'
+LOGIN_ERROR_PHRASES = [
+    'password match', 'no email address', 'password you entered is incorrect',
+    'email address or password', 'incorrect. please try again'
+]
+# JS predicate: a login error message is on the page
+LOGIN_ERROR_JS = "phrases => phrases.some(p => document.body && document.body.innerText.toLowerCase().includes(p))"
+PAYMENT_ITEM_SELECTOR = '.billing-payment-item--received, .js-payment-item'
+
+def _is_account_url(url: str) -> bool:
+    return "accounts-billing" in url or "my-account" in url
+
+BROWSER_CONTEXT_OPTIONS = {
+    "viewport": {'width': 1920, 'height': 1080},
+    "user_agent": 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+}
+
 async def type_text_slowly(page, selector: str, text: str, delay: int = 50):
     """
     Type text character by character to simulate human typing.
@@ -63,332 +88,356 @@ async def take_live_preview(page, step_name: str = ""):
         logger.debug(f"Failed to take live preview: {str(e)}")
         # Don't raise - preview failures shouldn't stop scraping
 
-async def perform_login(username: str, password: str, totp_code: str):
+async def _login_with_credentials(page, username: str, password: str, totp_code) -> tuple:
     """
-    Perform ConEd login automation using headless browser.
-    Types all values character by character, never pastes.
+    Full ConEd login: types username, password and TOTP character by character, never pastes.
+    totp_code may be a callable, so the code is generated only when the MFA prompt shows.
+    Returns (is_success, final_url).
     """
-    import time
-    from pathlib import Path
-    
     coned_url = "https://www.coned.com/en/login"
+
+    add_log("info", f"Starting ConEd scraper - Navigating to {coned_url}")
+    logger.info(f"Navigating to {coned_url}")
+    waits = get_wait_strategy()
+    await page.goto(coned_url, wait_until="domcontentloaded", timeout=30000)
+    await waits.wait_for(page, "login_form",
+                         selector='input[name="username"], input[name="email"], input[type="email"], input[type="password"]')
+    add_log("info", "Page loaded successfully")
+    await take_live_preview(page, "Page loaded")
     
-    async with async_playwright() as p:
-        # Force headless mode - check environment variable or default to True
-        import os
-        headless_mode = os.getenv('PLAYWRIGHT_HEADLESS', 'true').lower() == 'true'
-        
-        browser = await p.chromium.launch(
-            headless=headless_mode,  # Run in headless mode
-            args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
-        )
-        
-        context = await browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        )
-        
-        page = await context.new_page()
-        
+    # Wait for and type username
+    logger.info("Looking for username field...")
+    username_selectors = [
+        'input[name="username"]',
+        'input[name="email"]',
+        'input[type="email"]',
+        'input[id*="username"]',
+        'input[id*="email"]',
+        'input[placeholder*="username" i]',
+        'input[placeholder*="email" i]'
+    ]
+    
+    username_field = None
+    for selector in username_selectors:
         try:
-            add_log("info", f"Starting ConEd scraper - Navigating to {coned_url}")
-            logger.info(f"Navigating to {coned_url}")
-            await page.goto(coned_url, wait_until="networkidle", timeout=30000)
-            await asyncio.sleep(2)  # Wait for page to fully load
-            add_log("info", "Page loaded successfully")
-            await take_live_preview(page, "Page loaded")
-            
-            # Wait for and type username
-            logger.info("Looking for username field...")
-            username_selectors = [
-                'input[name="username"]',
-                'input[name="email"]',
-                'input[type="email"]',
-                'input[id*="username"]',
-                'input[id*="email"]',
-                'input[placeholder*="username" i]',
-                'input[placeholder*="email" i]'
-            ]
-            
-            username_field = None
-            for selector in username_selectors:
-                try:
-                    loc = page.locator(selector).first
-                    if await loc.count() > 0 and await loc.is_visible():
-                        username_field = selector
-                        break
-                except Exception:
-                    continue
-            
-            if not username_field:
-                raise Exception("Could not find username field")
-            
-            logger.info(f"Found username field: {username_field}")
-            add_log("info", f"Found username field: {username_field}")
-            await type_text_slowly(page, username_field, username, delay=50)
-            await asyncio.sleep(0.5)
-            add_log("success", "Username entered successfully")
-            await take_live_preview(page, "Username entered")
-            
-            # Wait for and type password
-            logger.info("Looking for password field...")
-            password_selectors = [
-                'input[name="password"]',
-                'input[type="password"]',
-                'input[id*="password"]',
-                'input[placeholder*="password" i]'
-            ]
-            
-            password_field = None
-            for selector in password_selectors:
-                try:
-                    loc = page.locator(selector).first
-                    if await loc.count() > 0 and await loc.is_visible():
-                        password_field = selector
-                        break
-                except Exception:
-                    continue
-            
-            if not password_field:
-                raise Exception("Could not find password field")
-            
-            logger.info(f"Found password field: {password_field}")
-            add_log("info", f"Found password field: {password_field}")
-            await type_text_slowly(page, password_field, password, delay=50)
-            await asyncio.sleep(0.5)
-            add_log("success", "Password entered successfully")
-            await take_live_preview(page, "Password entered")
-            
-            # Brief delay before submit to allow any blur/validation handlers to complete
-            await asyncio.sleep(0.3)
-            
-            # Click login/submit button (only after email and password are fully typed)
-            logger.info("Looking for submit button...")
-            submit_selectors = [
-                'button[type="submit"]',
-                'button:has-text("Sign In")',
-                'button:has-text("Log In")',
-                'button:has-text("Login")',
-                'input[type="submit"]',
-                'button[id*="submit"]',
-                'button[id*="login"]'
-            ]
-            
-            submit_button = None
-            for selector in submit_selectors:
-                try:
-                    loc = page.locator(selector).first
-                    if await loc.count() > 0 and await loc.is_visible():
-                        submit_button = selector
-                        break
-                except Exception:
-                    continue
-            
-            if not submit_button:
-                raise Exception("Could not find submit button")
-            
-            logger.info(f"Found submit button: {submit_button}")
-            add_log("info", f"Found submit button: {submit_button}")
-            await page.locator(submit_button).first.click()
-            add_log("info", "Login form submitted")
-            await asyncio.sleep(3)  # Wait for potential redirect or TOTP field
-            await take_live_preview(page, "Login form submitted")
-            
-            # Check for login error (invalid credentials) - fail fast before TOTP
+            loc = page.locator(selector).first
+            if await loc.count() > 0 and await loc.is_visible():
+                username_field = selector
+                break
+        except Exception:
+            continue
+    
+    if not username_field:
+        raise Exception("Could not find username field")
+    
+    logger.info(f"Found username field: {username_field}")
+    add_log("info", f"Found username field: {username_field}")
+    await type_text_slowly(page, username_field, username, delay=50)
+    add_log("success", "Username entered successfully")
+    await take_live_preview(page, "Username entered")
+    
+    # Wait for and type password
+    logger.info("Looking for password field...")
+    password_selectors = [
+        'input[name="password"]',
+        'input[type="password"]',
+        'input[id*="password"]',
+        'input[placeholder*="password" i]'
+    ]
+    
+    password_field = None
+    for selector in password_selectors:
+        try:
+            loc = page.locator(selector).first
+            if await loc.count() > 0 and await loc.is_visible():
+                password_field = selector
+                break
+        except Exception:
+            continue
+    
+    if not password_field:
+        raise Exception("Could not find password field")
+    
+    logger.info(f"Found password field: {password_field}")
+    add_log("info", f"Found password field: {password_field}")
+    await type_text_slowly(page, password_field, password, delay=50)
+    add_log("success", "Password entered successfully")
+    await take_live_preview(page, "Password entered")
+    
+    # Let blur/validation handlers enable the submit button
+    await waits.wait_for(page, "submit_enabled", selector='button[type="submit"]:enabled, input[type="submit"]:enabled',
+                         default_ms=3000, optional=True)
+    
+    # Click login/submit button (only after email and password are fully typed)
+    logger.info("Looking for submit button...")
+    submit_selectors = [
+        'button[type="submit"]',
+        'button:has-text("Sign In")',
+        'button:has-text("Log In")',
+        'button:has-text("Login")',
+        'input[type="submit"]',
+        'button[id*="submit"]',
+        'button[id*="login"]'
+    ]
+    
+    submit_button = None
+    for selector in submit_selectors:
+        try:
+            loc = page.locator(selector).first
+            if await loc.count() > 0 and await loc.is_visible():
+                submit_button = selector
+                break
+        except Exception:
+            continue
+    
+    if not submit_button:
+        raise Exception("Could not find submit button")
+    
+    logger.info(f"Found submit button: {submit_button}")
+    add_log("info", f"Found submit button: {submit_button}")
+    await page.locator(submit_button).first.click()
+    add_log("info", "Login form submitted")
+    # Whichever comes first: TOTP prompt, redirect to the account, or an error message
+    await waits.wait_for(page, "login_submitted", selector=MFA_FIELD_SELECTOR, url=_is_account_url,
+                         function=f"() => ({LOGIN_ERROR_JS})({LOGIN_ERROR_PHRASES!r})")
+    await take_live_preview(page, "Login form submitted")
+    
+    # Check for login error (invalid credentials) - fail fast before TOTP
+    try:
+        content = (await page.content()).lower()
+        if any(phrase in content for phrase in LOGIN_ERROR_PHRASES):
+            raise Exception(
+                "Login failed: Email and/or password incorrect. "
+                "Please verify your credentials in Settings > Credentials."
+            )
+    except Exception as e:
+        if "Login failed" in str(e):
+            raise
+    
+    # Check if TOTP field appears (ConEd-specific first, then generic)
+    logger.info("Checking for TOTP/MFA field...")
+    totp_selectors = [
+        'input#form-login-mta-code',           # ConEd exact ID
+        'input[name="LoginMFACode"]',           # ConEd MFA field name
+        'input[id*="mta"]',                     # ConEd form-login-mta-code
+        'input[name*="totp"]',
+        'input[name*="mfa"]',
+        'input[name*="MFA"]',
+        'input[name*="code"]',
+        'input[name*="verification"]',
+        'input[type="tel"][id*="code"]',        # ConEd uses type="tel"
+        'input[type="text"][placeholder*="code" i]',
+        'input[type="text"][placeholder*="verification" i]',
+        'input[id*="totp"]',
+        'input[id*="mfa"]',
+        'input[id*="code"]'
+    ]
+    
+    totp_field = None
+    for selector in totp_selectors:
+        try:
+            loc = page.locator(selector).first
+            if await loc.count() > 0 and await loc.is_visible():
+                totp_field = selector
+                break
+        except Exception:
+            continue
+    
+    if totp_field:
+        logger.info(f"Found TOTP field: {totp_field}")
+        add_log("info", f"Found TOTP field: {totp_field}")
+        if callable(totp_code):
+            totp_code = totp_code()
+        await type_text_slowly(page, totp_field, totp_code, delay=50)
+        add_log("success", "TOTP code entered successfully")
+        await take_live_preview(page, "TOTP code entered")
+    
+        # Submit TOTP - wait for button to be visible and enabled
+        submit_totp_selectors = [
+            'button[type="submit"]',
+            'button:has-text("Verify")',
+            'button:has-text("Submit")',
+            'button:has-text("Continue")',
+            'button:has-text("Sign In")',
+            'button:has-text("Log In")'
+        ]
+    
+        totp_submitted = False
+        for selector in submit_totp_selectors:
             try:
-                content = (await page.content()).lower()
-                if any(phrase in content for phrase in [
-                    'password match', 'no email address', 'password you entered is incorrect',
-                    'email address or password', 'incorrect. please try again'
-                ]):
-                    raise Exception(
-                        "Login failed: Email and/or password incorrect. "
-                        "Please verify your credentials in Settings > Credentials."
-                    )
-            except Exception as e:
-                if "Login failed" in str(e):
-                    raise
-            
-            # Check if TOTP field appears (ConEd-specific first, then generic)
-            logger.info("Checking for TOTP/MFA field...")
-            totp_selectors = [
-                'input#form-login-mta-code',           # ConEd exact ID
-                'input[name="LoginMFACode"]',           # ConEd MFA field name
-                'input[id*="mta"]',                     # ConEd form-login-mta-code
-                'input[name*="totp"]',
-                'input[name*="mfa"]',
-                'input[name*="MFA"]',
-                'input[name*="code"]',
-                'input[name*="verification"]',
-                'input[type="tel"][id*="code"]',        # ConEd uses type="tel"
-                'input[type="text"][placeholder*="code" i]',
-                'input[type="text"][placeholder*="verification" i]',
-                'input[id*="totp"]',
-                'input[id*="mfa"]',
-                'input[id*="code"]'
-            ]
-            
-            totp_field = None
-            for selector in totp_selectors:
-                try:
-                    loc = page.locator(selector).first
-                    if await loc.count() > 0 and await loc.is_visible():
-                        totp_field = selector
-                        break
-                except Exception:
-                    continue
-            
-            if totp_field:
-                logger.info(f"Found TOTP field: {totp_field}")
-                add_log("info", f"Found TOTP field: {totp_field}")
-                await type_text_slowly(page, totp_field, totp_code, delay=50)
-                await asyncio.sleep(0.5)
-                add_log("success", "TOTP code entered successfully")
-                await take_live_preview(page, "TOTP code entered")
-                
-                # Submit TOTP - wait for button to be visible and enabled
-                submit_totp_selectors = [
-                    'button[type="submit"]',
-                    'button:has-text("Verify")',
-                    'button:has-text("Submit")',
-                    'button:has-text("Continue")',
-                    'button:has-text("Sign In")',
-                    'button:has-text("Log In")'
-                ]
-                
-                totp_submitted = False
-                for selector in submit_totp_selectors:
-                    try:
-                        button = page.locator(selector).first
-                        if await button.count() > 0:
-                            # Wait for button to be visible and enabled
-                            await button.wait_for(state="visible", timeout=5000)
-                            # Check if button is enabled
-                            is_disabled = await button.get_attribute("disabled")
-                            if is_disabled is None:
-                                await button.click()
-                                add_log("info", f"Clicked TOTP submit button: {selector}")
-                                totp_submitted = True
-                                break
-                    except Exception as e:
-                        logger.debug(f"TOTP submit selector {selector} failed: {str(e)}")
-                        continue
-                
-                if not totp_submitted:
-                    # Try pressing Enter as fallback
-                    try:
-                        await page.keyboard.press("Enter")
-                        add_log("info", "Pressed Enter to submit TOTP")
+                button = page.locator(selector).first
+                if await button.count() > 0:
+                    # Wait for button to be visible and enabled
+                    await button.wait_for(state="visible", timeout=5000)
+                    # Check if button is enabled
+                    is_disabled = await button.get_attribute("disabled")
+                    if is_disabled is None:
+                        await button.click()
+                        add_log("info", f"Clicked TOTP submit button: {selector}")
                         totp_submitted = True
-                    except Exception as e:
-                        logger.warning(f"Failed to submit TOTP via Enter: {str(e)}")
-                
-                # Wait for navigation or page update after TOTP submission
-                if totp_submitted:
-                    try:
-                        # Wait for navigation to start and complete
-                        add_log("info", "Waiting for navigation after TOTP submission...")
-                        # Wait for DOM to be ready first
-                        await page.wait_for_load_state("domcontentloaded", timeout=15000)
-                        # Then wait for network to be idle
-                        await page.wait_for_load_state("networkidle", timeout=15000)
-                        await asyncio.sleep(2)  # Additional wait for dynamic content
-                        add_log("info", "Navigation completed after TOTP submission")
-                        await take_live_preview(page, "After TOTP submission")
-                    except Exception as e:
-                        logger.debug(f"Navigation wait timeout (may be normal): {str(e)}")
-                        # Try waiting for load state with longer timeout
-                        try:
-                            await page.wait_for_load_state("load", timeout=10000)
-                            await asyncio.sleep(3)  # Fallback wait
-                        except:
-                            await asyncio.sleep(5)  # Final fallback
-            
-            # Check if login was successful
-            # Wait for page to be stable before accessing content
-            try:
-                add_log("info", "Waiting for page to stabilize before checking login status...")
-                await page.wait_for_load_state("domcontentloaded", timeout=10000)
-                await page.wait_for_load_state("networkidle", timeout=10000)
-                await take_live_preview(page, "Page stabilized")
+                        break
             except Exception as e:
-                logger.debug(f"Page stabilization wait: {str(e)}")
-                await asyncio.sleep(2)
-                await take_live_preview(page, "After stabilization wait")
-            
-            current_url = page.url
-            
-            # Check for success by looking at page content, not just URL
-            # Wrap content access in try-except to handle navigation errors
-            page_content = None
-            page_text = ""
-            
+                logger.debug(f"TOTP submit selector {selector} failed: {str(e)}")
+                continue
+    
+        if not totp_submitted:
+            # Try pressing Enter as fallback
             try:
-                # Ensure page is not navigating before accessing content
-                await page.wait_for_load_state("domcontentloaded", timeout=5000)
-                page_content = await page.content()
-                page_text = await page.locator("body").inner_text()
+                await page.keyboard.press("Enter")
+                add_log("info", "Pressed Enter to submit TOTP")
+                totp_submitted = True
             except Exception as e:
-                # If content access fails, try again after waiting
-                logger.warning(f"Failed to get page content (may be navigating): {str(e)}")
-                try:
-                    await asyncio.sleep(3)
-                    await page.wait_for_load_state("load", timeout=10000)
-                    page_content = await page.content()
-                    page_text = await page.locator("body").inner_text()
-                except Exception as e2:
-                    # If still failing, use URL as fallback
-                    logger.warning(f"Still unable to get page content: {str(e2)}")
-                    page_text = ""  # Will rely on URL check only
-            
-            # Check for errors first (only if we have page text)
-            has_error = False
-            if page_text:
-                error_keywords = [
-                    'invalid username or password',
-                    'incorrect password',
-                    'authentication failed',
-                    'login failed',
-                    'try again',
-                    'error signing in',
-                    'invalid code',
-                    'verification failed'
-                ]
-                has_error = any(keyword in page_text.lower() for keyword in error_keywords)
-            
-            if has_error:
-                raise Exception("Login failed - error detected on page")
-            
-            # Check for success indicators (only if we have page text)
+                logger.warning(f"Failed to submit TOTP via Enter: {str(e)}")
+    
+        # Wait for the redirect to the account after TOTP submission
+        if totp_submitted:
+            add_log("info", "Waiting for navigation after TOTP submission...")
+            if await waits.wait_for(page, "mfa_submitted", url=_is_account_url, selector=BALANCE_CARD_SELECTOR,
+                                    default_ms=30000):
+                add_log("info", "Navigation completed after TOTP submission")
+            else:
+                logger.debug("No account page after TOTP submission (checking page for errors)")
+            await take_live_preview(page, "After TOTP submission")
+    
+    # Check if login was successful
+    # Wait for page to be stable before accessing content
+    # Ready to judge once the account (or a login/TOTP form or error) is showing
+    add_log("info", "Waiting for page to stabilize before checking login status...")
+    await waits.wait_for(page, "login_result",
+                         selector=f'{BALANCE_CARD_SELECTOR}, input[type="password"], {MFA_FIELD_SELECTOR}',
+                         function=f"() => ({LOGIN_ERROR_JS})({LOGIN_ERROR_PHRASES!r})", default_ms=10000)
+    await take_live_preview(page, "Page stabilized")
+    
+    current_url = page.url
+    
+    # Check for success by looking at page content, not just URL
+    # Wrap content access in try-except to handle navigation errors
+    page_content = None
+    page_text = ""
+    
+    try:
+        # Ensure page is not navigating before accessing content
+        await page.wait_for_load_state("domcontentloaded", timeout=5000)
+        page_content = await page.content()
+        page_text = await page.locator("body").inner_text()
+    except Exception as e:
+        # If content access fails, try again after waiting
+        logger.warning(f"Failed to get page content (may be navigating): {str(e)}")
+        try:
+            await page.wait_for_load_state("load", timeout=10000)
+            page_content = await page.content()
+            page_text = await page.locator("body").inner_text()
+        except Exception as e2:
+            # If still failing, use URL as fallback
+            logger.warning(f"Still unable to get page content: {str(e2)}")
+            page_text = ""  # Will rely on URL check only
+    
+    # Check for errors first (only if we have page text)
+    has_error = False
+    if page_text:
+        error_keywords = [
+            'invalid username or password',
+            'incorrect password',
+            'authentication failed',
+            'login failed',
+            'try again',
+            'error signing in',
+            'invalid code',
+            'verification failed'
+        ]
+        has_error = any(keyword in page_text.lower() for keyword in error_keywords)
+    
+    if has_error:
+        raise Exception("Login failed - error detected on page")
+    
+    # Check for success indicators (only if we have page text)
+    is_success = False
+    if page_text:
+        success_indicators = [
+            'my account',
+            'account snapshot',
+            'outstanding balance',
+            'pay bill',
+            'bill history',
+            'energy use'
+        ]
+        is_success = any(indicator in page_text.lower() for indicator in success_indicators)
+    
+    # Also check URL as fallback
+    if not is_success:
+        url_indicators = ['account', 'dashboard', 'my-account', 'accounts-billing']
+        is_success = any(indicator in current_url.lower() for indicator in url_indicators)
+    
+    # If still not sure, check if we can see account elements
+    if not is_success:
+        try:
+            # Try to find account-related elements
+            account_elements = await page.locator('[class*="account"], [class*="balance"], [class*="bill"]').count()
+            if account_elements > 0:
+                is_success = True
+        except:
+            pass
+    
+    logger.info(f"Login process completed. Final URL: {current_url}")
+    add_log("success", f"Login process completed. Final URL: {current_url}")
+    
+    return is_success, current_url
+
+async def _session_is_valid(page) -> bool:
+    """
+    Cheap probe for a restored session: open the account page and see whether
+    ConEd shows the account (balance card) or bounces to the login form.
+    """
+    try:
+        await page.goto(ACCOUNT_URL, wait_until="domcontentloaded", timeout=30000)
+        await get_wait_strategy().wait_for(page, "session_probe", selector=f'{BALANCE_CARD_SELECTOR}, input[type="password"]')
+    except Exception as e:
+        logger.debug(f"Session probe wait: {str(e)}")
+    try:
+        if "login" in page.url.lower() or await page.locator('input[type="password"]').first.is_visible():
+            return False
+        return await page.locator(BALANCE_CARD_SELECTOR).first.is_visible()
+    except Exception as e:
+        logger.debug(f"Session probe failed: {str(e)}")
+        return False
+
+async def perform_login(username: str, password: str, totp_code, cipher=None):
+    """
+    Perform ConEd login automation using headless browser, then scrape.
+    With a cipher, the logged-in session (cookies + localStorage) is saved encrypted
+    and restored next time; the full login only runs when that session has expired.
+    """
+    from browser_session import load_session_state, save_session_state, clear_session_state
+    
+    # Shared, already-running Chromium; each scrape gets its own context
+    async with get_browser_manager().lease() as browser:
+        # Skip images, fonts and trackers; counts carry over if the context is replaced
+        blocker = RequestBlocker()
+        storage_state = load_session_state(cipher)
+        context = await browser.new_context(storage_state=storage_state, **BROWSER_CONTEXT_OPTIONS)
+        await blocker.install(context)
+        page = await context.new_page()
+        
+        try:
             is_success = False
-            if page_text:
-                success_indicators = [
-                    'my account',
-                    'account snapshot',
-                    'outstanding balance',
-                    'pay bill',
-                    'bill history',
-                    'energy use'
-                ]
-                is_success = any(indicator in page_text.lower() for indicator in success_indicators)
-            
-            # Also check URL as fallback
-            if not is_success:
-                url_indicators = ['account', 'dashboard', 'my-account', 'accounts-billing']
-                is_success = any(indicator in current_url.lower() for indicator in url_indicators)
-            
-            # If still not sure, check if we can see account elements
-            if not is_success:
-                try:
-                    # Try to find account-related elements
-                    account_elements = await page.locator('[class*="account"], [class*="balance"], [class*="bill"]').count()
-                    if account_elements > 0:
-                        is_success = True
-                except:
-                    pass
+            if storage_state:
+                add_log("info", "Checking saved ConEd session...")
+                is_success = await _session_is_valid(page)
+                if is_success:
+                    add_log("success", "Saved session is still valid - skipping login")
+                    await take_live_preview(page, "Session restored")
+                else:
+                    add_log("info", "Saved session expired - logging in")
+                    clear_session_state()
+                    await context.close()
+                    context = await browser.new_context(**BROWSER_CONTEXT_OPTIONS)
+                    await blocker.install(context)
+                    page = await context.new_page()
             
-            logger.info(f"Login process completed. Final URL: {current_url}")
-            add_log("success", f"Login process completed. Final URL: {current_url}")
+            if is_success:
+                current_url = page.url
+            else:
+                is_success, current_url = await _login_with_credentials(page, username, password, totp_code)
             
             # Scrape data after successful login
             scraped_data = {}
@@ -396,13 +445,11 @@ async def perform_login(username: str, password: str, totp_code: str):
                 try:
                     add_log("info", "Starting data scraping...")
                     # Navigate to account page if not already there
-                    account_url = "https://www.coned.com/en/accounts-billing/my-account"
-                    if account_url not in current_url:
-                        add_log("info", f"Navigating to account page: {account_url}")
-                        await page.goto(account_url, wait_until="networkidle", timeout=30000)
-                        await asyncio.sleep(3)  # Wait for page to load
+                    if ACCOUNT_URL not in current_url:
+                        add_log("info", f"Navigating to account page: {ACCOUNT_URL}")
+                        await page.goto(ACCOUNT_URL, wait_until="domcontentloaded", timeout=30000)
                     
-                    scraped_data = await scrape_account_data(page, context)
+                    scraped_data = await scrape_account_data(page, context, blocker)
                     
                     # Scrape bill history ledger
                     bill_history = await scrape_bill_history(page)
@@ -414,15 +461,18 @@ async def perform_login(username: str, password: str, totp_code: str):
                     
                     add_log("success", f"Data scraping completed successfully")
                     
-                    save_scraped_data(scraped_data, "success", None, SCREENSHOT_FILENAME)
+                    await save_scraped_data(scraped_data, "success", None, SCREENSHOT_FILENAME)
                 except Exception as e:
                     error_msg = f"Data scraping failed: {str(e)}"
                     add_log("error", error_msg)
                     logger.error(error_msg)
-                    save_scraped_data({}, "error", error_msg, None)
-            
-            await browser.close()
-            add_log("info", "Browser closed")
+                    await save_scraped_data({}, "error", error_msg, None)
+                
+                # Keep the (possibly refreshed) session for the next run
+                try:
+                    save_session_state(cipher, await context.storage_state())
+                except Exception as e:
+                    add_log("warning", f"Could not save browser session: {str(e)}")
             
             return {
                 "success": is_success,
@@ -435,18 +485,26 @@ async def perform_login(username: str, password: str, totp_code: str):
             error_msg = f"Timeout error: {str(e)}"
             logger.error(error_msg)
             add_log("error", error_msg)
-            save_scraped_data({}, "error", error_msg, None)
-            await browser.close()
+            await save_scraped_data({}, "error", error_msg, None)
             raise Exception(f"Login timeout: {str(e)}")
         except Exception as e:
             error_msg = f"Login error: {str(e)}"
             logger.error(error_msg)
             add_log("error", error_msg)
-            save_scraped_data({}, "error", error_msg, None)
-            await browser.close()
+            await save_scraped_data({}, "error", error_msg, None)
             raise
+        finally:
+            get_wait_strategy().save()
+            if blocker.enabled:
+                stats = blocker.stats()
+                add_log("info", f"Blocked {stats['blocked_total']} requests {stats['blocked']}, allowed {stats['allowed']}")
+            try:
+                await context.close()
+                add_log("info", "Browser context closed")
+            except Exception as e:
+                logger.debug(f"Closing browser context: {str(e)}")
 
-async def scrape_account_data(page, context):
+async def scrape_account_data(page, context, blocker: RequestBlocker = None):
     """
     Scrape account data from ConEd account page.
     Extracts Account Balance only.
@@ -462,8 +520,7 @@ async def scrape_account_data(page, context):
     try:
         # Wait for page to load
         add_log("info", "Waiting for account page to load...")
-        await page.wait_for_load_state("networkidle", timeout=15000)
-        await asyncio.sleep(2)  # Additional wait for dynamic content
+        await get_wait_strategy().wait_for(page, "account_balance", selector=BALANCE_CARD_SELECTOR)
         
         # Scrape Account Balance
         add_log("info", "Looking for Account Balance...")
@@ -507,7 +564,14 @@ async def scrape_account_data(page, context):
                 screenshot_dir = DATA_DIR
                 screenshot_dir.mkdir(parents=True, exist_ok=True)
                 screenshot_path = screenshot_dir / SCREENSHOT_FILENAME
-                await page.screenshot(path=str(screenshot_path), full_page=False)
+                if blocker is not None and blocker.screenshot_assets:
+                    # Opted in: reload with images/fonts so the screenshot looks like the real page
+                    with blocker.allow_visuals():
+                        await page.reload(wait_until="load", timeout=30000)
+                        await get_wait_strategy().wait_for(page, "account_balance", selector=BALANCE_CARD_SELECTOR)
+                        await page.screenshot(path=str(screenshot_path), full_page=False)
+                else:
+                    await page.screenshot(path=str(screenshot_path), full_page=False)
                 add_log("info", f"Screenshot saved: {SCREENSHOT_FILENAME}")
             except Exception as e:
                 add_log("warning", f"Failed to save screenshot: {str(e)}")
@@ -576,12 +640,12 @@ async def scrape_pdf_bill_url(page, context):
         add_log("info", "Looking for View Current Bill link...")
         
         # Make sure we're on the account page
-        account_url = "https://www.coned.com/en/accounts-billing/my-account"
+        waits = get_wait_strategy()
         current_url = page.url
-        if account_url not in current_url:
-            add_log("info", f"Navigating to account page for PDF: {account_url}")
-            await page.goto(account_url, wait_until="networkidle", timeout=30000)
-            await asyncio.sleep(3)
+        if ACCOUNT_URL not in current_url:
+            add_log("info", f"Navigating to account page for PDF: {ACCOUNT_URL}")
+            await page.goto(ACCOUNT_URL, wait_until="domcontentloaded", timeout=30000)
+            await waits.wait_for(page, "account_balance", selector=BALANCE_CARD_SELECTOR)
         
         await take_live_preview(page, "Looking for PDF link")
         
@@ -658,6 +722,7 @@ async def scrape_pdf_bill_url(page, context):
         
         # Set up network request interception to capture the PDF URL
         captured_pdf_url = None
+        pdf_captured = asyncio.Event()
         
         async def handle_request(request):
             nonlocal captured_pdf_url
@@ -668,6 +733,7 @@ async def scrape_pdf_bill_url(page, context):
                 '.pdf' in url or
                 'viewbill' in url):
                 captured_pdf_url = request.url
+                pdf_captured.set()
                 add_log("success", f"Intercepted PDF URL: {request.url[:100]}...")
         
         async def handle_response(response):
@@ -678,6 +744,7 @@ async def scrape_pdf_bill_url(page, context):
                 'cecony-bill' in url or 
                 '.pdf' in url):
                 captured_pdf_url = response.url
+                pdf_captured.set()
                 add_log("success", f"Captured PDF URL from response: {response.url[:100]}...")
         
         # Listen for network requests
@@ -700,31 +767,22 @@ async def scrape_pdf_bill_url(page, context):
                 new_page.on("request", handle_request)
                 new_page.on("response", handle_response)
                 
-                # Wait for URL to change or network request to be captured
-                max_wait_time = 30
-                wait_interval = 2
-                elapsed = 0
+                def is_pdf_url(url: str) -> bool:
+                    if not url or url in ["about:blank", "about:srcdoc"]:
+                        return False
+                    url_lower = url.lower()
+                    return ('blob.core.windows.net' in url_lower or 
+                            'cecony-bill' in url_lower or 
+                            '.pdf' in url_lower or
+                            len(url) > 100)
                 
-                while elapsed < max_wait_time and not captured_pdf_url:
-                    await asyncio.sleep(wait_interval)
-                    elapsed += wait_interval
-                    
-                    # Check if new page URL changed
-                    try:
-                        current_url = new_page.url
-                        if current_url and current_url not in ["about:blank", "", "about:srcdoc"]:
-                            url_lower = current_url.lower()
-                            if ('blob.core.windows.net' in url_lower or 
-                                'cecony-bill' in url_lower or 
-                                '.pdf' in url_lower or
-                                len(current_url) > 100):
-                                captured_pdf_url = current_url
-                                add_log("success", f"PDF URL from new tab: {current_url[:100]}...")
-                                break
-                    except:
-                        pass
-                    
-                    add_log("info", f"Waiting for PDF URL ({elapsed}s)... Current: {new_page.url[:50] if new_page.url else 'blank'}")
+                # Wait for the new tab to land on the PDF or a request to be captured
+                if captured_pdf_url is None:
+                    add_log("info", "Waiting for PDF URL...")
+                    await waits.wait_for(new_page, "pdf_url", url=is_pdf_url, event=pdf_captured, default_ms=30000)
+                if captured_pdf_url is None and is_pdf_url(new_page.url):
+                    captured_pdf_url = new_page.url
+                    add_log("success", f"PDF URL from new tab: {captured_pdf_url[:100]}...")
                 
                 # Close the new tab
                 try:
@@ -734,8 +792,7 @@ async def scrape_pdf_bill_url(page, context):
                     
             except Exception as e:
                 add_log("info", f"New tab approach failed: {str(e)}, checking if URL was captured via network...")
-                # Wait a bit more for network capture
-                await asyncio.sleep(5)
+                await waits.wait_for(page, "pdf_capture", event=pdf_captured, default_ms=5000, optional=True)
             
             if captured_pdf_url:
                 pdf_url = captured_pdf_url
@@ -769,35 +826,125 @@ async def scrape_pdf_bill_url(page, context):
     
     return pdf_url
 
+# Raw text/attributes of every ledger row in one round-trip; cleaned up in _parse_ledger_dom
+LEDGER_DOM_JS = """
+({paymentSelector, billSelector}) => {
+    const text = (item, sel) => { const el = item.querySelector(sel); return el ? el.innerText : null; };
+    const attr = (item, sel, name) => { const el = item.querySelector(sel); return el ? el.getAttribute(name) : null; };
+    const cycle = '.billing-payment-item__date .billing-payment-item__focus';
+    return {
+        payments: [...document.querySelectorAll(paymentSelector)].map(item => ({
+            cycle: text(item, cycle),
+            received: text(item, '.billing-payment-item__received'),
+            payment_date: attr(item, 'a[data-payment-date]', 'data-payment-date'),
+            amount: text(item, '.billing-payment-item__total-received'),
+        })),
+        bills: [...document.querySelectorAll(billSelector)].map(item => ({
+            cycle: text(item, cycle),
+            months: text(item, '.billing-payment-item__months'),
+            total: text(item, '.billing-payment-item__total-amount'),
+            bill_date: attr(item, 'a.js-bill-link[data-bill-date]', 'data-bill-date'),
+        })),
+    };
+}
+"""
+BILL_ITEM_SELECTOR = '.js-bill-item, .billing-payment-item--bill'
+
+
+def _clean_cycle_date(text):
+    text = text.replace('Bill Cycle:', '').replace('visually-hidden', '').strip()
+    return ' '.join(text.split()).strip()
+
+
+async def _parse_ledger_dom(page):
+    """Ledger entries parsed from the rendered bill history rows"""
+    import re
+    rows = await page.evaluate(LEDGER_DOM_JS, {"paymentSelector": PAYMENT_ITEM_SELECTOR, "billSelector": BILL_ITEM_SELECTOR})
+    add_log("info", f"Found {len(rows['payments'])} payment items and {len(rows['bills'])} bill items")
+    ledger = []
+    
+    for row in rows["payments"]:
+        item_data = {"type": "payment"}
+        if row["cycle"] is not None:
+            item_data["bill_cycle_date"] = _clean_cycle_date(row["cycle"])
+        if row["received"] is not None:
+            description_text = row["received"].strip()
+            item_data["description"] = description_text
+            # Try to extract payment date from description (e.g., "Payment Received 1/23/2026")
+            date_match = re.search(r'(\d{1,2}/\d{1,2}/\d{4})', description_text)
+            if date_match:
+                item_data["payment_date"] = date_match.group(1)
+        else:
+            item_data["description"] = "Payment Received"
+        if row["payment_date"]:
+            item_data["payment_date"] = row["payment_date"]
+        if row["amount"] is not None:
+            item_data["amount"] = row["amount"].strip()
+        
+        if item_data.get("bill_cycle_date") or item_data.get("amount"):
+            ledger.append(item_data)
+            payment_info = f"Added payment: {item_data.get('amount')}"
+            if item_data.get("payment_date"):
+                payment_info += f" on {item_data.get('payment_date')}"
+            elif item_data.get("bill_cycle_date"):
+                payment_info += f" (bill cycle: {item_data.get('bill_cycle_date')})"
+            add_log("info", payment_info)
+    
+    for row in rows["bills"]:
+        item_data = {"type": "bill"}
+        if row["cycle"] is not None:
+            item_data["bill_cycle_date"] = _clean_cycle_date(row["cycle"])
+        if row["months"] is not None:
+            item_data["month_range"] = row["months"].strip()
+        if row["total"] is not None:
+            item_data["bill_total"] = row["total"].strip()
+        if row["bill_date"]:
+            item_data["bill_date"] = row["bill_date"]
+        
+        if item_data.get("bill_cycle_date") or item_data.get("bill_total"):
+            ledger.append(item_data)
+            add_log("info", f"Added bill: {item_data.get('bill_total')} for {item_data.get('month_range')}")
+    
+    return ledger
+
+
 async def scrape_bill_history(page):
     """
     Scrape bill history ledger from ConEd bill history page.
-    Navigates to bill history page, clicks Payments checkbox, and parses ledger.
+    Navigates to bill history page and clicks the Payments checkbox. The ledger
+    is taken from the page's own JSON responses once that parser has been
+    verified against the DOM (see ledger_capture); otherwise from the DOM.
     """
     import time
     bill_history = {
         "ledger": [],
         "scraped_at": time.strftime("%Y-%m-%d %H:%M:%S")
     }
+    capture = LedgerResponseCapture()
+    capture_state = LedgerCaptureState()
     
     try:
         bill_history_url = "https://www.coned.com/en/accounts-billing/my-account/bill-history-assistance"
         add_log("info", f"Navigating to bill history page: {bill_history_url}")
         
-        await page.goto(bill_history_url, wait_until="networkidle", timeout=30000)
-        await asyncio.sleep(3)  # Wait for page to load
+        waits = get_wait_strategy()
+        # Listen before navigating so the ledger API calls made on load are captured too
+        capture.attach(page)
+        await page.goto(bill_history_url, wait_until="domcontentloaded", timeout=30000)
+        # Ledger controls rendered (bills load with the page; payments come with the checkbox)
+        await waits.wait_for(page, "bill_history_page",
+                             selector=f'input#payments-check, input[name="paymentscheck"], .js-check-payments, {BILL_ITEM_SELECTOR}')
         
-        # Click the Payments checkbox using xpath
         add_log("info", "Looking for Payments checkbox...")
         try:
-            # Try xpath first
+            # Stable selectors first; the absolute xpath breaks on any layout change
             payments_checkbox_xpath = '/html/body/div[3]/div[3]/div[3]/div[5]/div/div[1]/div/div/div/div/div[2]/div/label[1]'
             checkbox_selectors = [
-                f'xpath={payments_checkbox_xpath}',
                 'input#payments-check',
                 'input[name="paymentscheck"]',
+                '.js-check-payments',
                 'label:has-text("Payments")',
-                '.js-check-payments'
+                f'xpath={payments_checkbox_xpath}',
             ]
             
             checkbox_found = False
@@ -823,113 +970,26 @@ async def scrape_bill_history(page):
                 add_log("warning", "Could not find Payments checkbox")
                 return bill_history
             
-            # Wait for ledger to load after clicking checkbox
-            await asyncio.sleep(3)
-            await page.wait_for_load_state("networkidle", timeout=10000)
+            # Wait for payment rows to render after clicking checkbox (an account may have none)
+            await waits.wait_for(page, "payments_loaded", selector=PAYMENT_ITEM_SELECTOR, default_ms=10000, optional=True)
             
-            # Parse the ledger items
             add_log("info", "Parsing bill history ledger...")
-            
-            # Find all ledger items - both payments and bills
-            # Use more specific selectors based on the HTML structure
-            payment_items = await page.locator('.billing-payment-item--received, .js-payment-item').all()
-            bill_items = await page.locator('.js-bill-item, .billing-payment-item--bill').all()
-            
-            add_log("info", f"Found {len(payment_items)} payment items and {len(bill_items)} bill items")
-            
-            # Process payment items
-            for item in payment_items:
-                try:
-                    item_data = {"type": "payment"}
-                    
-                    # Get bill cycle date
-                    date_element = item.locator('.billing-payment-item__date .billing-payment-item__focus').first
-                    if await date_element.count() > 0:
-                        date_text = await date_element.inner_text()
-                        date_text = date_text.replace('Bill Cycle:', '').replace('visually-hidden', '').strip()
-                        # Clean up - remove any hidden text
-                        date_text = ' '.join(date_text.split()).strip()
-                        item_data["bill_cycle_date"] = date_text
-                    
-                    # Get payment description and extract payment date
-                    received_element = item.locator('.billing-payment-item__received').first
-                    if await received_element.count() > 0:
-                        description_text = (await received_element.inner_text()).strip()
-                        item_data["description"] = description_text
-                        
-                        # Try to extract payment date from description (e.g., "Payment Received 1/23/2026")
-                        import re
-                        date_match = re.search(r'(\d{1,2}/\d{1,2}/\d{4})', description_text)
-                        if date_match:
-                            item_data["payment_date"] = date_match.group(1)
+            await capture.settle()
+            json_ledger = parse_ledger_json(capture.payloads)
+            
+            if json_ledger and capture_state.use_json():
+                bill_history["ledger"] = json_ledger
+                bill_history["source"] = "json"
+                capture_state.json_used()
+                add_log("info", f"Ledger read from {len(capture.payloads)} captured JSON responses")
+            else:
+                bill_history["ledger"] = await _parse_ledger_dom(page)
+                bill_history["source"] = "dom"
+                if json_ledger:
+                    if capture_state.verify(json_ledger, bill_history["ledger"]):
+                        add_log("info", "Captured JSON ledger matches the page - using it on the next scrapes")
                     else:
-                        item_data["description"] = "Payment Received"
-                    
-                    # Try to get payment date from data attribute if available
-                    payment_link = item.locator('a[data-payment-date]').first
-                    if await payment_link.count() > 0:
-                        payment_date = await payment_link.get_attribute('data-payment-date')
-                        if payment_date:
-                            item_data["payment_date"] = payment_date
-                    
-                    # Get payment amount
-                    amount_element = item.locator('.billing-payment-item__total-received').first
-                    if await amount_element.count() > 0:
-                        amount_text = await amount_element.inner_text()
-                        item_data["amount"] = amount_text.strip()
-                    
-                    if item_data.get("bill_cycle_date") or item_data.get("amount"):
-                        bill_history["ledger"].append(item_data)
-                        payment_info = f"Added payment: {item_data.get('amount')}"
-                        if item_data.get("payment_date"):
-                            payment_info += f" on {item_data.get('payment_date')}"
-                        elif item_data.get("bill_cycle_date"):
-                            payment_info += f" (bill cycle: {item_data.get('bill_cycle_date')})"
-                        add_log("info", payment_info)
-                        
-                except Exception as e:
-                    add_log("warning", f"Error parsing payment item: {str(e)}")
-                    continue
-            
-            # Process bill items
-            for item in bill_items:
-                try:
-                    item_data = {"type": "bill"}
-                    
-                    # Get bill cycle date
-                    date_element = item.locator('.billing-payment-item__date .billing-payment-item__focus').first
-                    if await date_element.count() > 0:
-                        date_text = await date_element.inner_text()
-                        date_text = date_text.replace('Bill Cycle:', '').replace('visually-hidden', '').strip()
-                        date_text = ' '.join(date_text.split()).strip()
-                        item_data["bill_cycle_date"] = date_text
-                    
-                    # Get month range
-                    months_element = item.locator('.billing-payment-item__months').first
-                    if await months_element.count() > 0:
-                        months_text = await months_element.inner_text()
-                        item_data["month_range"] = months_text.strip()
-                    
-                    # Get bill total amount
-                    total_element = item.locator('.billing-payment-item__total-amount').first
-                    if await total_element.count() > 0:
-                        total_text = await total_element.inner_text()
-                        item_data["bill_total"] = total_text.strip()
-                    
-                    # Get bill date from data attribute if available
-                    bill_link = item.locator('a.js-bill-link[data-bill-date]').first
-                    if await bill_link.count() > 0:
-                        bill_date = await bill_link.get_attribute('data-bill-date')
-                        if bill_date:
-                            item_data["bill_date"] = bill_date
-                    
-                    if item_data.get("bill_cycle_date") or item_data.get("bill_total"):
-                        bill_history["ledger"].append(item_data)
-                        add_log("info", f"Added bill: {item_data.get('bill_total')} for {item_data.get('month_range')}")
-                        
-                except Exception as e:
-                    add_log("warning", f"Error parsing bill item: {str(e)}")
-                    continue
+                        add_log("info", f"Captured JSON ledger differs from the page ({capture_state.data['last_mismatch']}) - staying on DOM parsing")
             
             add_log("success", f"Parsed {len(bill_history['ledger'])} ledger entries")
             
@@ -944,5 +1004,7 @@ async def scrape_bill_history(page):
         add_log("error", error_msg)
         logger.error(error_msg)
         bill_history["error"] = str(e)
+    finally:
+        capture.detach(page)
     
     return bill_history
@@ -0,0 +1,159 @@
+"""
+Long-lived Chromium shared by all scrapes.
+The browser is launched once (at startup or on first use) and each scrape
+leases it to open its own context, so only the first scrape pays the
+cold start. A crashed or disconnected browser is relaunched on the next
+lease, and an idle browser is shut down after BROWSER_IDLE_TIMEOUT seconds
+to give the memory back.
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+IDLE_TIMEOUT = float(os.getenv("BROWSER_IDLE_TIMEOUT", "900"))  # 0 = never shut down
+LAUNCH_ARGS = ['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
+
+
+class BrowserManager:
+    """Owns the Playwright driver and one Chromium; hands out leases per scrape"""
+
+    def __init__(self, idle_timeout: float = IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._playwright = None
+        self._browser = None
+        self._lock = asyncio.Lock()
+        self._leases = 0
+        self._last_used = time.monotonic()
+        self._idle_task: Optional[asyncio.Task] = None
+        self._launched_at: Optional[float] = None
+        self.launches = 0
+        self.crashes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._browser is not None and self._browser.is_connected()
+
+    def _on_disconnected(self, _browser):
+        # Fires on crash as well as on our own close(); only the former leaves _browser set
+        if self._browser is not None:
+            self.crashes += 1
+            logger.warning("Chromium disconnected unexpectedly - it will be relaunched on next use")
+
+    async def _launch(self):
+        from playwright.async_api import async_playwright
+        headless = os.getenv('PLAYWRIGHT_HEADLESS', 'true').lower() == 'true'
+        start = time.perf_counter()
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=headless, args=LAUNCH_ARGS)
+        self._browser.on("disconnected", self._on_disconnected)
+        self._launched_at = time.monotonic()
+        self.launches += 1
+        logger.info(f"Chromium {self._browser.version} launched in {(time.perf_counter() - start) * 1000:.0f} ms")
+        if self.idle_timeout > 0 and (self._idle_task is None or self._idle_task.done()):
+            self._idle_task = asyncio.create_task(self._idle_watch())
+
+    async def _close(self):
+        browser, playwright = self._browser, self._playwright
+        self._browser = self._playwright = None
+        self._launched_at = None
+        if browser is not None:
+            try:
+                await browser.close()
+            except Exception as e:
+                logger.debug(f"Closing Chromium: {e}")
+        if playwright is not None:
+            try:
+                await playwright.stop()
+            except Exception as e:
+                logger.debug(f"Stopping Playwright: {e}")
+
+    async def start(self):
+        """Launch Chromium if it isn't running (relaunching after a crash)"""
+        async with self._lock:
+            if self.running:
+                return self._browser
+            if self._browser is not None or self._playwright is not None:
+                await self._close()  # Dead browser left over from a crash
+            await self._launch()
+            return self._browser
+
+    async def health_check(self) -> bool:
+        """Open and close a blank context; relaunch once if the browser is unusable"""
+        for attempt in range(2):
+            try:
+                browser = await self.start()
+                context = await browser.new_context()
+                await context.close()
+                return True
+            except Exception as e:
+                logger.warning(f"Chromium health check failed: {e}")
+                async with self._lock:
+                    await self._close()
+        return False
+
+    @asynccontextmanager
+    async def lease(self):
+        """
+        Use the shared browser for one scrape. Contexts opened on it are the caller's
+        to close; the browser itself stays up for the next scrape.
+        """
+        browser = await self.start()
+        self._leases += 1
+        try:
+            yield browser
+        finally:
+            self._leases -= 1
+            self._last_used = time.monotonic()
+
+    async def _idle_watch(self):
+        while True:
+            await asyncio.sleep(min(60.0, self.idle_timeout))
+            async with self._lock:
+                if self._browser is None:
+                    return
+                if self._leases == 0 and time.monotonic() - self._last_used >= self.idle_timeout:
+                    logger.info(f"Chromium idle for {self.idle_timeout:.0f}s - shutting it down")
+                    await self._close()
+                    return
+
+    async def shutdown(self):
+        if self._idle_task is not None:
+            self._idle_task.cancel()
+            self._idle_task = None
+        async with self._lock:
+            await self._close()
+
+    def status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "running": self.running,
+            "active_leases": self._leases,
+            "uptime_seconds": round(now - self._launched_at) if self._launched_at else 0,
+            "idle_seconds": round(now - self._last_used) if self._leases == 0 else 0,
+            "idle_timeout": self.idle_timeout,
+            "launches": self.launches,
+            "crashes": self.crashes,
+        }
+
+
+_browser_manager: Optional[BrowserManager] = None
+
+
+def get_browser_manager() -> BrowserManager:
+    """Application-wide browser manager (created on first use)"""
+    global _browser_manager
+    if _browser_manager is None:
+        _browser_manager = BrowserManager()
+    return _browser_manager
+
+
+async def shutdown_browser_manager():
+    global _browser_manager
+    if _browser_manager is not None:
+        await _browser_manager.shutdown()
+        _browser_manager = None
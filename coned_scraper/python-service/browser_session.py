@@ -0,0 +1,46 @@
+"""
+Saved ConEd browser session (Playwright storage state: cookies + localStorage).
+Stored encrypted with the app's Fernet key so a scrape can skip the
+username/password/TOTP login while the session is still valid.
+"""
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from data_config import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+SESSION_STATE_FILE = DATA_DIR / "browser_session.enc"
+
+
+def load_session_state(cipher) -> Optional[Dict[str, Any]]:
+    """Decrypted storage state, or None if there is none (or it can't be read)"""
+    if cipher is None or not SESSION_STATE_FILE.exists():
+        return None
+    try:
+        return json.loads(cipher.decrypt(SESSION_STATE_FILE.read_bytes()))
+    except Exception as e:
+        # Key rotated or file corrupt - a fresh login will replace it
+        logger.warning(f"Discarding unreadable browser session: {e!r}")
+        clear_session_state()
+        return None
+
+
+def save_session_state(cipher, state: Dict[str, Any]):
+    """Encrypt and store a context.storage_state() dict"""
+    if cipher is None:
+        return
+    tmp = SESSION_STATE_FILE.with_suffix(".tmp")
+    tmp.write_bytes(cipher.encrypt(json.dumps(state).encode()))
+    os.chmod(tmp, 0o600)
+    tmp.replace(SESSION_STATE_FILE)
+
+
+def clear_session_state():
+    """Forget the saved session (expired, or credentials changed)"""
+    try:
+        SESSION_STATE_FILE.unlink()
+    except FileNotFoundError:
+        pass
@@ -3,7 +3,7 @@ Change detection for sensor values
 """
 import json
 from typing import Optional, Dict, Any, Tuple
-from database import get_latest_scraped_data
+from database import get_latest_scraped_data, parse_us_date_to_sortable
 
 def extract_numeric_value(value_str: str) -> float:
     """Extract numeric value from string like '$123.45'"""
@@ -16,52 +16,141 @@ def get_account_balance(data: Dict[str, Any]) -> Optional[str]:
     """Extract account balance from scraped data"""
     return data.get("account_balance")
 
-def get_bills(data: Dict[str, Any]) -> list:
-    """Extract bills from scraped data, sorted by date (newest first)"""
-    bills = []
-    bill_history = data.get("bill_history", {})
-    ledger = bill_history.get("ledger", [])
+def _entry_date(entry: Dict[str, Any]) -> Tuple[str, str]:
+    """Sort key: parsed M/D/YYYY as YYYY-MM-DD (raw string as fallback)"""
+    raw = entry.get("bill_cycle_date") or entry.get("bill_date") or ""
+    return (parse_us_date_to_sortable(raw), raw)
+
+def bill_key(entry: Dict[str, Any]) -> tuple:
+    """Identity of a bill across scrapes (same as the bills table UNIQUE key)"""
+    return (entry.get("bill_cycle_date", ""), entry.get("month_range", ""))
+
+class LedgerView:
+    """
+    One scrape's ledger, partitioned and sorted once (newest first).
+    Build one per snapshot and reuse it instead of the get_* helpers.
+    """
+    
+    def __init__(self, data: Optional[Dict[str, Any]]):
+        data = data or {}
+        self.account_balance = data.get("account_balance")
+        ledger = (data.get("bill_history") or {}).get("ledger", [])
+        self.bills = sorted((e for e in ledger if e.get("type") == "bill"), key=_entry_date, reverse=True)
+        self.payments = sorted((e for e in ledger if e.get("type") == "payment"), key=_entry_date, reverse=True)
+    
+    @property
+    def most_recent_bill(self) -> Optional[Dict[str, Any]]:
+        return self.bills[0] if self.bills else None
+    
+    @property
+    def previous_bill(self) -> Optional[Dict[str, Any]]:
+        return self.bills[1] if len(self.bills) > 1 else None
     
-    for entry in ledger:
-        if entry.get("type") == "bill":
-            bills.append(entry)
+    @property
+    def last_payment(self) -> Optional[Dict[str, Any]]:
+        return self.payments[0] if self.payments else None
     
-    # Sort by bill_cycle_date or bill_date (newest first)
-    bills.sort(key=lambda x: x.get("bill_cycle_date") or x.get("bill_date") or "", reverse=True)
-    return bills
+    def bills_by_key(self) -> Dict[tuple, Dict[str, Any]]:
+        return {bill_key(bill): bill for bill in self.bills}
+    
+    def payments_by_key(self) -> Dict[tuple, Dict[str, Any]]:
+        """
+        Payments keyed by (date, amount, description, n); n tells apart
+        identical same-day payments (counted oldest first, so new ones get the next n).
+        """
+        keyed = {}
+        seen: Dict[tuple, int] = {}
+        for payment in reversed(self.payments):
+            base = (payment.get("bill_cycle_date", ""), payment.get("amount", ""), payment.get("description", ""))
+            n = seen.get(base, 0)
+            seen[base] = n + 1
+            keyed[base + (n,)] = payment
+        return keyed
+
+def get_bills(data: Dict[str, Any]) -> list:
+    """Extract bills from scraped data, sorted by date (newest first)"""
+    return LedgerView(data).bills
 
 def get_payments(data: Dict[str, Any]) -> list:
     """Extract payments from scraped data, sorted by date (newest first)"""
-    payments = []
-    bill_history = data.get("bill_history", {})
-    ledger = bill_history.get("ledger", [])
-    
-    for entry in ledger:
-        if entry.get("type") == "payment":
-            payments.append(entry)
-    
-    # Sort by bill_cycle_date (newest first)
-    payments.sort(key=lambda x: x.get("bill_cycle_date") or "", reverse=True)
-    return payments
+    return LedgerView(data).payments
 
 def get_most_recent_bill(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """Get the most recent bill"""
-    bills = get_bills(data)
-    return bills[0] if bills else None
+    return LedgerView(data).most_recent_bill
 
 def get_previous_bill(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """Get the previous (second most recent) bill"""
-    bills = get_bills(data)
-    return bills[1] if len(bills) > 1 else None
+    return LedgerView(data).previous_bill
 
 def get_last_payment(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """Get the last (most recent) payment"""
-    payments = get_payments(data)
-    return payments[0] if payments else None
+    return LedgerView(data).last_payment
+
+# ==========================================
+# FIELD-LEVEL LEDGER DIFF
+# ==========================================
+
+def diff_fields(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Tuple[Any, Any]]:
+    """{field: (old_value, new_value)} for every field that differs"""
+    return {field: (old.get(field), new.get(field))
+            for field in old.keys() | new.keys()
+            if old.get(field) != new.get(field)}
 
-def detect_changes(new_data: Dict[str, Any], timestamp: str) -> Dict[str, bool]:
+def diff_entries(old: Dict[tuple, Dict[str, Any]], new: Dict[tuple, Dict[str, Any]]) -> Dict[str, list]:
+    """Compare two keyed entry maps: added / removed entries and changed ones with their fields"""
+    changed = []
+    for key in old.keys() & new.keys():
+        fields = diff_fields(old[key], new[key])
+        if fields:
+            changed.append({"key": key, "old": old[key], "new": new[key], "fields": fields})
+    return {
+        "added": [entry for key, entry in new.items() if key not in old],
+        "removed": [entry for key, entry in old.items() if key not in new],
+        "changed": changed,
+    }
+
+def diff_ledgers(old: LedgerView, new: LedgerView) -> Dict[str, Any]:
+    """
+    Exactly what changed between two scrapes.
+    Returns {'account_balance': (old, new) or None, 'bills': {...}, 'payments': {...}, 'has_changes': bool}
+    where bills/payments are diff_entries() results.
+    """
+    bills = diff_entries(old.bills_by_key(), new.bills_by_key())
+    payments = diff_entries(old.payments_by_key(), new.payments_by_key())
+    balance = (old.account_balance, new.account_balance) if old.account_balance != new.account_balance else None
+    return {
+        "account_balance": balance,
+        "bills": bills,
+        "payments": payments,
+        "has_changes": balance is not None or any(bills.values()) or any(payments.values()),
+    }
+
+def get_previous_scrape() -> Optional[Dict[str, Any]]:
+    """Data of the scrape before the latest saved one, or None"""
+    entries = get_latest_scraped_data(2)
+    return entries[1].get("data", {}) if len(entries) > 1 else None
+
+def get_previous_successful_scrape(limit: int = 5) -> Optional[Dict[str, Any]]:
+    """Data of the last successful scrape before the latest one (error scrapes skipped), or None"""
+    successful = [e for e in get_latest_scraped_data(limit) if e.get("status") == "success" and e.get("data")]
+    return successful[1]["data"] if len(successful) > 1 else None
+
+def _entry_date_changed(new_entry: Optional[Dict[str, Any]], old_entry: Optional[Dict[str, Any]], *fields: str) -> bool:
+    """New entry appeared, or its first present date field differs from the old one"""
+    if not new_entry:
+        return False
+    if not old_entry:
+        return True
+    new_date = next((new_entry.get(f) for f in fields if new_entry.get(f)), None)
+    old_date = next((old_entry.get(f) for f in fields if old_entry.get(f)), None)
+    return new_date != old_date
+
+def detect_changes(new_data: Dict[str, Any], timestamp: str,
+                   previous_data: Optional[Dict[str, Any]] = None) -> Dict[str, bool]:
     """
     Detect changes in sensor values by comparing with previous data.
+    previous_data defaults to the scrape before the latest saved one.
     Returns a dict indicating which sensors changed.
     """
     changes = {
@@ -72,61 +161,26 @@ def detect_changes(new_data: Dict[str, Any], timestamp: str) -> Dict[str, bool]:
     }
     
     try:
-        # Get previous data (latest 2 entries)
-        previous_entries = get_latest_scraped_data(2)
+        new_view = LedgerView(new_data)
+        if previous_data is None:
+            previous_data = get_previous_scrape()
         
-        if len(previous_entries) < 2:
+        if previous_data is None:
             # First or second scrape - all values are "new"
             changes["account_balance"] = True
-            if get_most_recent_bill(new_data):
-                changes["most_recent_bill"] = True
-            if get_previous_bill(new_data):
-                changes["previous_bill"] = True
-            if get_last_payment(new_data):
-                changes["last_payment"] = True
+            changes["most_recent_bill"] = new_view.most_recent_bill is not None
+            changes["previous_bill"] = new_view.previous_bill is not None
+            changes["last_payment"] = new_view.last_payment is not None
             return changes
         
-        # Compare with previous data (second entry is the previous scrape)
-        previous_data = previous_entries[1].get("data", {})
-        
-        # Check account balance change
-        new_balance = get_account_balance(new_data)
-        old_balance = get_account_balance(previous_data)
-        if new_balance != old_balance:
-            changes["account_balance"] = True
-        
-        # Check most recent bill change
-        new_bill = get_most_recent_bill(new_data)
-        old_bill = get_most_recent_bill(previous_data)
-        if new_bill and old_bill:
-            new_bill_date = new_bill.get("bill_cycle_date") or new_bill.get("bill_date")
-            old_bill_date = old_bill.get("bill_cycle_date") or old_bill.get("bill_date")
-            if new_bill_date != old_bill_date:
-                changes["most_recent_bill"] = True
-        elif new_bill and not old_bill:
-            changes["most_recent_bill"] = True
-        
-        # Check previous bill change
-        new_prev_bill = get_previous_bill(new_data)
-        old_prev_bill = get_previous_bill(previous_data)
-        if new_prev_bill and old_prev_bill:
-            new_prev_bill_date = new_prev_bill.get("bill_cycle_date") or new_prev_bill.get("bill_date")
-            old_prev_bill_date = old_prev_bill.get("bill_cycle_date") or old_prev_bill.get("bill_date")
-            if new_prev_bill_date != old_prev_bill_date:
-                changes["previous_bill"] = True
-        elif new_prev_bill and not old_prev_bill:
-            changes["previous_bill"] = True
-        
-        # Check last payment change
-        new_payment = get_last_payment(new_data)
-        old_payment = get_last_payment(previous_data)
-        if new_payment and old_payment:
-            new_payment_date = new_payment.get("bill_cycle_date")
-            old_payment_date = old_payment.get("bill_cycle_date")
-            if new_payment_date != old_payment_date:
-                changes["last_payment"] = True
-        elif new_payment and not old_payment:
-            changes["last_payment"] = True
+        old_view = LedgerView(previous_data)
+        changes["account_balance"] = new_view.account_balance != old_view.account_balance
+        changes["most_recent_bill"] = _entry_date_changed(
+            new_view.most_recent_bill, old_view.most_recent_bill, "bill_cycle_date", "bill_date")
+        changes["previous_bill"] = _entry_date_changed(
+            new_view.previous_bill, old_view.previous_bill, "bill_cycle_date", "bill_date")
+        changes["last_payment"] = _entry_date_changed(
+            new_view.last_payment, old_view.last_payment, "bill_cycle_date")
         
     except Exception as e:
         import logging
@@ -137,3 +191,11 @@ def detect_changes(new_data: Dict[str, Any], timestamp: str) -> Dict[str, bool]:
     
     return changes
 
+def detect_ledger_changes(new_data: Dict[str, Any], previous_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Field-level diff of new_data against the previous scrape (see diff_ledgers).
+    With no previous scrape everything in new_data counts as added.
+    """
+    if previous_data is None:
+        previous_data = get_previous_scrape()
+    return diff_ledgers(LedgerView(previous_data), LedgerView(new_data))
@@ -0,0 +1,186 @@
+"""
+Exercise the asyncio MQTT transport against an in-process stub broker.
+
+Checks: CONNECT/CONNACK, QoS 0/1/2 publish acks, subscriptions, and (through
+MQTTClient) queueing while the broker is down and draining on reconnect.
+The stub speaks just enough MQTT 3.1.1 for that; it is not a real broker.
+
+Usage: python check_mqtt_transport.py
+Uses a throwaway DATA_DIR for the outbound queue. Exits non-zero on failure.
+"""
+import asyncio
+import os
+import struct
+import sys
+import tempfile
+from typing import List, Optional, Set, Tuple
+
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="coned_check_")
+
+from mqtt_client import DiscoveryCache, MQTTClient, PublishStateCache  # noqa: E402  (after DATA_DIR is set)
+from mqtt_transport import (  # noqa: E402
+    AsyncioTransport, CONNACK, CONNECT, DISCONNECT, PINGREQ, PINGRESP, PUBACK, PUBCOMP, PUBLISH,
+    PUBREC, PUBREL, SUBACK, SUBSCRIBE, _encode_str, _packet,
+)
+
+
+class StubBroker:
+    """Accepts any client; acks every QoS level; fans PUBLISH out to exact-topic subscribers"""
+
+    def __init__(self, port: int = 0):
+        self.port = port
+        self.received: List[Tuple[str, bytes, int]] = []  # (topic, payload, qos)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Set[asyncio.StreamWriter] = set()
+        self._subscribers: List[Tuple[str, asyncio.StreamWriter]] = []
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Drop every client and stop listening (simulates a broker outage)"""
+        self._server.close()
+        for writer in list(self._clients):
+            writer.close()
+        await self._server.wait_closed()
+        self._clients.clear()
+        self._subscribers.clear()
+
+    def topics(self) -> List[str]:
+        return [topic for topic, _, _ in self.received]
+
+    @staticmethod
+    async def _read(reader: asyncio.StreamReader) -> Tuple[int, int, bytes]:
+        first = (await reader.readexactly(1))[0]
+        multiplier, length = 1, 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return first >> 4, first & 0x0F, await reader.readexactly(length) if length else b""
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._clients.add(writer)
+        try:
+            while True:
+                ptype, flags, body = await self._read(reader)
+                if ptype == CONNECT:
+                    writer.write(_packet(CONNACK << 4, b"\x00\x00"))
+                elif ptype == PUBLISH:
+                    qos = (flags >> 1) & 0x03
+                    topic_len = struct.unpack("!H", body[:2])[0]
+                    topic = body[2:2 + topic_len].decode()
+                    pos = 2 + topic_len + (2 if qos else 0)
+                    self.received.append((topic, body[pos:], qos))
+                    if qos:
+                        mid = body[2 + topic_len:pos]
+                        writer.write(_packet((PUBACK if qos == 1 else PUBREC) << 4, mid))
+                    for sub_topic, sub_writer in self._subscribers:
+                        if sub_topic == topic:
+                            sub_writer.write(_packet(PUBLISH << 4, _encode_str(topic) + body[pos:]))
+                elif ptype == PUBREL:
+                    writer.write(_packet(PUBCOMP << 4, body[:2]))
+                elif ptype == SUBSCRIBE:
+                    topic_len = struct.unpack("!H", body[2:4])[0]
+                    self._subscribers.append((body[4:4 + topic_len].decode(), writer))
+                    writer.write(_packet(SUBACK << 4, body[:2] + b"\x00"))
+                elif ptype == PINGREQ:
+                    writer.write(_packet(PINGRESP << 4))
+                elif ptype == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+
+async def wait_until(predicate, timeout: float) -> bool:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            return False
+        await asyncio.sleep(0.05)
+    return True
+
+
+async def check_transport(broker: StubBroker, failures: List[str]):
+    transport = AsyncioTransport("127.0.0.1", broker.port, use_tls=False)
+    received = asyncio.Queue()
+
+    async def on_message(topic: str, payload: bytes):
+        await received.put((topic, payload))
+
+    transport.subscribe("check/echo", on_message)
+    if not await transport.connect():
+        failures.append("transport: connect")
+        return
+    for qos in (0, 1, 2):
+        sent = await transport.publish([(f"check/qos{qos}/a", "1", False), (f"check/qos{qos}/b", "2", True)], qos)
+        acks = await asyncio.wait_for(asyncio.gather(*(future for _, future in sent)), 5)
+        if any(acked_at is None for acked_at in acks):
+            failures.append(f"transport: QoS {qos} not acked")
+    await asyncio.sleep(0.1)  # Let the SUBSCRIBE land before publishing to it
+    await transport.publish([("check/echo", "hello", False)], 1)
+    try:
+        topic, payload = await asyncio.wait_for(received.get(), 5)
+        if payload != b"hello":
+            failures.append(f"transport: subscription got {payload!r}")
+    except asyncio.TimeoutError:
+        failures.append("transport: subscription message not delivered")
+    await transport.disconnect()
+    print(f"transport: {len(broker.received)} publishes received, connected={transport.connected}")
+
+
+async def check_outage_queue(broker: StubBroker, failures: List[str]):
+    client = MQTTClient(f"mqtt://127.0.0.1:{broker.port}", transport="asyncio", discovery=False,
+                        state_cache=PublishStateCache(path=None), discovery_cache=DiscoveryCache(path=None))
+    await client.connect()
+    report = await client.publish_batch([("account_balance", "10.00", None)], timeout=5)
+    if report["published"] != 1:
+        failures.append(f"client: initial publish {report}")
+
+    await broker.stop()
+    await wait_until(lambda: not client.connected, 5)
+    report = await client.publish_batch([("account_balance", "20.00", None), ("last_payment", "5.00", None)], timeout=2)
+    if sorted(report["queued"]) != ["account_balance", "last_payment"]:
+        failures.append(f"client: expected both sensors queued during outage, got {report}")
+    print(f"outage: queued {report['queued']}, depth={(await client.queue_stats())['depth']}")
+
+    before = len(broker.received)
+    await broker.start()  # Same port; the transport's backoff reconnect finds it
+    drained = await wait_until(lambda: client._queue_depth == 0 and len(broker.received) > before, 15)
+    stats = await client.queue_stats()
+    after = [(topic, payload) for topic, payload, _ in broker.received[before:]]
+    if not drained or stats["depth"] != 0:
+        failures.append(f"client: queue not drained after reconnect (depth {stats['depth']})")
+    for expected in [("coned/account_balance", b"20.00"), ("coned/last_payment", b"5.00")]:
+        if expected not in after:
+            failures.append(f"client: {expected[0]} not delivered after reconnect")
+    print(f"reconnect: drained {stats['drained']} queued messages, depth={stats['depth']}")
+    await client.disconnect()
+
+
+async def main() -> int:
+    failures: List[str] = []
+    broker = StubBroker()
+    await broker.start()
+    await check_transport(broker, failures)
+    await check_outage_queue(broker, failures)
+    await broker.stop()
+
+    from async_database import shutdown
+    await shutdown()
+    if failures:
+        print("FAIL:\n  " + "\n  ".join(failures))
+        return 1
+    print("OK: asyncio transport connects, acks every QoS, queues during an outage and drains on reconnect")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
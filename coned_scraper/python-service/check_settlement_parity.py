@@ -0,0 +1,107 @@
+"""
+Check that settlement.calculate_all_payee_balances_vectorized() returns the
+same bill and payee summaries as database.calculate_all_payee_balances().
+
+Seeds two years of bills through sync_from_scrape, four payees (one at 0%),
+attributed, unattributed and orphan payments with under/over-payment so
+balances roll over, then changes an old bill total (incremental refresh)
+and compares both results field by field.
+
+Usage: python check_settlement_parity.py
+Uses a throwaway DATA_DIR, never the real database. Exits non-zero on failure.
+"""
+import os
+import sys
+import tempfile
+from typing import Any, List
+
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="coned_check_")
+
+import database  # noqa: E402  (must import after DATA_DIR is set)
+import settlement  # noqa: E402
+
+BILL_COUNT = 24
+PAYEES = {"Alice": 50.0, "Bob": 30.0, "Carol": 20.0, "Dave": 0.0}
+MONEY_TOLERANCE = 0.01 + 1e-9  # Both sides round to cents; allow one cent of float-sum drift
+
+
+def scrape(changed_total_bill: int = -1) -> dict:
+    """Monthly bills, each paid in parts by Alice/Bob/Carol plus the odd unattributed payment"""
+    ledger = []
+    for i in range(BILL_COUNT):
+        year, month = 2024 + i // 12, i % 12 + 1
+        total = 87.13 + i * 3.71 + (25.0 if i == changed_total_bill else 0.0)
+        ledger.append({"type": "bill", "bill_cycle_date": f"{month}/1/{year}",
+                       "month_range": f"parity {i}", "bill_total": f"${total:,.2f}"})
+        payments = [("Alice", total * 0.5), ("Bob", total * 0.3 - (7.5 if i % 3 == 0 else 0.0)),
+                    ("Carol", total * 0.2 + (4.25 if i % 4 == 1 else 0.0))]
+        if i % 5 == 2:
+            payments.append(("Unattributed", 12.34))
+        for day, (who, amount) in enumerate(payments, start=5):
+            ledger.append({"type": "payment", "bill_cycle_date": f"{month}/{day}/{year}",
+                           "description": f"Payment {who} {i}", "amount": f"${amount:,.2f}"})
+    return {"bill_history": {"ledger": ledger}}
+
+
+def seed():
+    payee_ids = {name: database.create_payee_user(name, is_default=(name == "Alice")) for name in PAYEES}
+    result = database.update_payee_responsibilities({payee_ids[n]: pct for n, pct in PAYEES.items()})
+    if result.get("success") is False:
+        raise RuntimeError(f"Could not set responsibilities: {result}")
+    database.sync_from_scrape(scrape())
+    payments = database.get_all_payments(limit=10000)
+    for payment in payments:
+        who = payment["description"].split()[1]
+        if who in payee_ids:
+            database.attribute_payment(payment["id"], payee_ids[who])
+    # One payment moved off its bill (orphan) - counts toward neither side's bill totals
+    database.update_payment_bill(payments[0]["id"], None)
+    # Old bill total corrected by a later scrape: balances refresh from that bill forward
+    database.sync_from_scrape(scrape(changed_total_bill=3))
+
+
+def compare(expected: Any, actual: Any, path: str, mismatches: List[str]):
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        if list(expected) != list(actual):
+            mismatches.append(f"{path}: keys {list(expected)} != {list(actual)}")
+            return
+        for key in expected:
+            compare(expected[key], actual[key], f"{path}.{key}", mismatches)
+    elif isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            mismatches.append(f"{path}: {len(expected)} items != {len(actual)}")
+            return
+        for i, (e, a) in enumerate(zip(expected, actual)):
+            compare(e, a, f"{path}[{i}]", mismatches)
+    elif isinstance(expected, float) or isinstance(actual, float):
+        if abs(float(expected) - float(actual)) > MONEY_TOLERANCE:
+            mismatches.append(f"{path}: {expected} != {actual}")
+    elif expected != actual:
+        mismatches.append(f"{path}: {expected!r} != {actual!r}")
+
+
+def main() -> int:
+    if not settlement.NUMPY_AVAILABLE:
+        print("SKIP: numpy not installed")
+        return 0
+    seed()
+    expected = database.calculate_all_payee_balances()
+    actual = settlement.calculate_all_payee_balances_vectorized()
+
+    mismatches: List[str] = []
+    compare(expected, actual, "balances", mismatches)
+    rollovers = sum(1 for bill in expected.values() for p in bill["payee_summaries"] if p["rollover_in"])
+    print(f"{len(expected)} bills x {len(PAYEES)} payees compared, {rollovers} non-zero rollovers")
+    if not rollovers:
+        mismatches.append("seed produced no rollover - nothing meaningful compared")
+    if mismatches:
+        print(f"FAIL: {len(mismatches)} mismatches")
+        for line in mismatches[:20]:
+            print("  " + line)
+        return 1
+    print("OK: vectorized settlement matches calculate_all_payee_balances")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
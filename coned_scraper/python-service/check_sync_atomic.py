@@ -0,0 +1,71 @@
+"""
+Check that a scrape whose normalized-table sync fails part-way leaves bills,
+payments and balance snapshots exactly as they were (the scrape snapshot
+itself is still saved).
+
+Usage: python check_sync_atomic.py
+Uses a throwaway DATA_DIR, never the real database. Exits non-zero on failure.
+"""
+import os
+import sys
+import tempfile
+
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="coned_check_")
+
+import database  # noqa: E402  (must import after DATA_DIR is set)
+from database import db_connection  # noqa: E402
+
+TABLES = ["bills", "payments", "bill_balance_snapshots", "payee_balance_snapshots"]
+
+
+def scrape(bill_count: int) -> dict:
+    """Scrape payload with bill_count monthly bills, each paid in full"""
+    ledger = []
+    for i in range(bill_count):
+        cycle = f"{i % 12 + 1}/15/{2024 + i // 12}"
+        ledger.append({"type": "bill", "bill_cycle_date": cycle, "month_range": f"check {i}", "bill_total": "$100.00"})
+        ledger.append({"type": "payment", "bill_cycle_date": cycle, "description": "Payment Received", "amount": "$100.00"})
+    return {"bill_history": {"ledger": ledger}}
+
+
+def table_state() -> dict:
+    with db_connection() as conn:
+        return {table: sorted(tuple(row) for row in conn.execute(f"SELECT * FROM {table}")) for table in TABLES}
+
+
+def main() -> int:
+    with db_connection() as conn:
+        conn.execute("INSERT INTO payee_users (name, is_default, created_at) VALUES ('Check', 1, '2020-01-01')")
+    database.save_scraped_data(scrape(2))
+    before = table_state()
+    scrapes_before = len(database.get_all_scraped_data(100))
+
+    # Fail after bills and payments have been written, before the balances are refreshed
+    original = database._refresh_payee_balances
+
+    def boom(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    database._refresh_payee_balances = boom
+    try:
+        database.save_scraped_data(scrape(3))
+    finally:
+        database._refresh_payee_balances = original
+    after = table_state()
+
+    failures = [table for table in TABLES if before[table] != after[table]]
+    for table in TABLES:
+        print(f"{table:26} {len(before[table]):3} -> {len(after[table]):3}")
+    if len(database.get_all_scraped_data(100)) != scrapes_before + 1:
+        failures.append("scraped_data (snapshot not saved)")
+    if not before["bill_balance_snapshots"]:
+        failures.append("bill_balance_snapshots (nothing to compare - first sync wrote none)")
+    if failures:
+        print("FAIL: " + ", ".join(failures))
+        return 1
+    print("OK: failed sync left the normalized tables unchanged")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
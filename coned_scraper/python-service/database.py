@@ -1,10 +1,15 @@
 import sqlite3
 import json
 import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 from typing import Optional, List, Dict, Any
 import hashlib
+import bisect
+import copy
+import snapshots
 
 def utc_now_iso() -> str:
     """Get current UTC time as ISO string"""
@@ -14,19 +19,123 @@ def utc_now_iso() -> str:
 from data_config import DATA_DIR
 DB_PATH = DATA_DIR / "scraper.db"
 
-def get_connection():
-    """Get database connection with row factory"""
-    conn = sqlite3.connect(DB_PATH)
+# ==========================================
+# CONNECTION MANAGEMENT
+# ==========================================
+#
+# One long-lived connection per thread instead of connect/close per call.
+# WAL lets the UI keep reading while a scrape is writing, and a persistent
+# connection keeps sqlite3's prepared-statement cache warm across calls.
+
+# Tuned for a small embedded DB on SD-card backed /config volumes
+DB_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",   # Safe with WAL; fsync only at checkpoints
+    "cache_size": -8000,       # ~8 MB page cache (negative = KiB)
+    "mmap_size": 67108864,     # 64 MB memory-mapped reads
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,      # ms to wait on a locked DB instead of failing
+}
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+_connections: List[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+_pool_generation = 0  # Bumped by close_all_connections() so threads reopen
+
+def _open_connection() -> sqlite3.Connection:
+    """Open a new connection with row factory and performance pragmas applied"""
+    conn = sqlite3.connect(DB_PATH, cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    for pragma, value in DB_PRAGMAS.items():
+        conn.execute(f'PRAGMA {pragma} = {value}')
+    return conn
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Get this thread's pooled database connection (opened on first use).
+    Do not close it - use db_connection() for commit/rollback handling.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'generation', None) != _pool_generation:
+        conn = _open_connection()
+        _local.conn = conn
+        _local.depth = 0
+        _local.generation = _pool_generation
+        with _connections_lock:
+            _connections.append(conn)
     return conn
 
+@contextmanager
+def db_connection():
+    """
+    Context manager around the thread's pooled connection.
+    Commits when the outermost block exits cleanly, rolls back on error.
+    Nested blocks (accessor calling accessor) run inside the outer transaction
+    as a savepoint: an error rolls back just the nested block's writes, so a
+    caller that catches it can't commit them half-done.
+    """
+    conn = get_connection()
+    depth = _local.depth
+    _local.depth = depth + 1
+    savepoint = f'sp_{depth}'
+    try:
+        if depth > 0:
+            if not conn.in_transaction:
+                # Outer block hasn't written yet - open its transaction so
+                # releasing the savepoint doesn't commit on its own
+                conn.execute('BEGIN')
+            conn.execute(f'SAVEPOINT {savepoint}')
+        yield conn
+        if depth == 0:
+            conn.commit()
+        else:
+            conn.execute(f'RELEASE {savepoint}')
+    except BaseException:
+        if depth == 0:
+            conn.rollback()
+        elif conn.in_transaction:
+            conn.execute(f'ROLLBACK TO {savepoint}')
+            conn.execute(f'RELEASE {savepoint}')
+        raise
+    finally:
+        _local.depth = depth
+
+def close_all_connections():
+    """Close every pooled connection (call on application shutdown)"""
+    global _pool_generation
+    with _connections_lock:
+        for conn in _connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _connections.clear()
+        _pool_generation += 1
+
 def init_database():
     """Initialize SQLite database with normalized schema"""
     DB_PATH.parent.mkdir(exist_ok=True)
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
+    with db_connection() as conn:
+        _enable_incremental_vacuum(conn)
+        cursor = conn.cursor()
+        _create_schema(cursor)
+        # Full rebuild once per start so snapshots always match the current rules
+        _refresh_payee_balances(cursor)
+
+def _enable_incremental_vacuum(conn: sqlite3.Connection):
+    """
+    Switch the file to auto_vacuum=INCREMENTAL so apply_retention() can hand freed
+    pages back to the filesystem. Existing files need one full VACUUM to convert.
+    """
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        return
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+
+def _create_schema(cursor: sqlite3.Cursor):
+    """Create tables, run column migrations and build indexes"""
     # ==========================================
     # LEGACY TABLES (keep for backward compat)
     # ==========================================
@@ -49,6 +158,25 @@ def init_database():
     except sqlite3.OperationalError:
         pass
     
+    # New rows keep data = '' and point at a compressed, content-addressed blob
+    try:
+        cursor.execute('ALTER TABLE scraped_data ADD COLUMN snapshot_hash TEXT')
+    except sqlite3.OperationalError:
+        pass
+    
+    # Snapshot blobs: a full keyframe, or a delta against a keyframe (base_hash)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS snapshot_blobs (
+            hash TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            base_hash TEXT,
+            codec TEXT NOT NULL,
+            payload BLOB NOT NULL,
+            raw_size INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    
     # Create logs table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS logs (
@@ -187,15 +315,65 @@ def init_database():
         )
     ''')
     
+    # Sortable ISO copies of the M/D/YYYY dates so ordering happens in SQL (migration + backfill)
+    for table, iso_column, date_column in (('bills', 'bill_cycle_iso', 'bill_cycle_date'),
+                                           ('payments', 'payment_date_iso', 'payment_date')):
+        try:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {iso_column} TEXT')
+        except sqlite3.OperationalError:
+            pass
+        cursor.execute(f'SELECT id, {date_column} FROM {table} WHERE {iso_column} IS NULL')
+        backfill = [(parse_us_date_to_sortable(row[1]), row[0]) for row in cursor.fetchall()]
+        cursor.executemany(f'UPDATE {table} SET {iso_column} = ? WHERE id = ?', backfill)
+    
+    # Materialized rollover balances, maintained by _refresh_payee_balances()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bill_balance_snapshots (
+            bill_id INTEGER PRIMARY KEY,
+            bill_total REAL NOT NULL,
+            total_paid REAL NOT NULL,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY (bill_id) REFERENCES bills(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payee_balance_snapshots (
+            bill_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            share_of_bill REAL NOT NULL,
+            amount_paid REAL NOT NULL,
+            rollover_in REAL NOT NULL,
+            total_balance REAL NOT NULL,
+            PRIMARY KEY (bill_id, user_id),
+            FOREIGN KEY (bill_id) REFERENCES bills(id) ON DELETE CASCADE,
+            FOREIGN KEY (user_id) REFERENCES payee_users(id) ON DELETE CASCADE
+        )
+    ''')
+    
+    # Outbound MQTT messages waiting for the broker (see mqtt_client.MQTTClient)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS mqtt_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            state_key TEXT NOT NULL,
+            fingerprint TEXT,
+            messages TEXT NOT NULL,
+            qos INTEGER NOT NULL,
+            retain INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    
     # Create indexes for performance
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_bills_cycle_date ON bills(bill_cycle_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_bills_cycle_iso ON bills(bill_cycle_iso, first_scraped_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_payments_date_iso ON payments(payment_date_iso)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_bill_documents_bill_id ON bill_documents(bill_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_payments_date ON payments(payment_date)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_payments_bill_id ON payments(bill_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_mqtt_outbox_state_key ON mqtt_outbox(state_key)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_payments_first_scraped ON payments(first_scraped_at)')
-    
-    conn.commit()
-    conn.close()
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scraped_data_timestamp ON scraped_data(timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scraped_data_snapshot ON scraped_data(snapshot_hash)')
 
 def parse_amount(amount_str: str) -> Optional[float]:
     """Parse amount string to float"""
@@ -219,47 +397,46 @@ def generate_payment_hash(payment_date: str, amount: str, description: str, bill
 
 def upsert_bill(bill_data: Dict[str, Any]) -> int:
     """Insert or update a bill, returns bill ID"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    bill_cycle_date = bill_data.get('bill_cycle_date', '')
-    month_range = bill_data.get('month_range', '')
-    bill_date = bill_data.get('bill_date', '')
-    bill_total = bill_data.get('bill_total', '')
-    amount_numeric = parse_amount(bill_total)
-    now = utc_now_iso()
-    
-    # Try to find existing bill
-    cursor.execute('''
-        SELECT id, scrape_count FROM bills 
-        WHERE bill_cycle_date = ? AND month_range = ?
-    ''', (bill_cycle_date, month_range))
-    
-    existing = cursor.fetchone()
+        bill_cycle_date = bill_data.get('bill_cycle_date', '')
+        month_range = bill_data.get('month_range', '')
+        bill_date = bill_data.get('bill_date', '')
+        bill_total = bill_data.get('bill_total', '')
+        amount_numeric = parse_amount(bill_total)
+        now = utc_now_iso()
     
-    if existing:
-        # Update existing bill
-        cursor.execute('''
-            UPDATE bills SET 
-                last_scraped_at = ?,
-                scrape_count = scrape_count + 1,
-                bill_date = COALESCE(?, bill_date),
-                bill_total = COALESCE(?, bill_total),
-                amount_numeric = COALESCE(?, amount_numeric)
-            WHERE id = ?
-        ''', (now, bill_date, bill_total, amount_numeric, existing['id']))
-        bill_id = existing['id']
-    else:
-        # Insert new bill
+        # Try to find existing bill
         cursor.execute('''
-            INSERT INTO bills (bill_cycle_date, bill_date, month_range, bill_total, amount_numeric, first_scraped_at, last_scraped_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (bill_cycle_date, bill_date, month_range, bill_total, amount_numeric, now, now))
-        bill_id = cursor.lastrowid
+            SELECT id, scrape_count FROM bills 
+            WHERE bill_cycle_date = ? AND month_range = ?
+        ''', (bill_cycle_date, month_range))
+    
+        existing = cursor.fetchone()
+    
+        if existing:
+            # Update existing bill
+            cursor.execute('''
+                UPDATE bills SET 
+                    last_scraped_at = ?,
+                    scrape_count = scrape_count + 1,
+                    bill_date = COALESCE(?, bill_date),
+                    bill_total = COALESCE(?, bill_total),
+                    amount_numeric = COALESCE(?, amount_numeric)
+                WHERE id = ?
+            ''', (now, bill_date, bill_total, amount_numeric, existing['id']))
+            bill_id = existing['id']
+        else:
+            # Insert new bill
+            cursor.execute('''
+                INSERT INTO bills (bill_cycle_date, bill_cycle_iso, bill_date, month_range, bill_total, amount_numeric, first_scraped_at, last_scraped_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (bill_cycle_date, parse_us_date_to_sortable(bill_cycle_date), bill_date, month_range, bill_total, amount_numeric, now, now))
+            bill_id = cursor.lastrowid
     
-    conn.commit()
-    conn.close()
-    return bill_id
+        _refresh_payee_balances(cursor, [bill_id])
+        return bill_id
 
 def parse_us_date_to_sortable(date_str: str) -> str:
     """
@@ -279,6 +456,9 @@ def parse_us_date_to_sortable(date_str: str) -> str:
         pass
     return date_str  # Return original if parsing fails
 
+# SQL equivalent of sort_bills_by_date(desc=True), backed by idx_bills_cycle_iso
+BILLS_NEWEST_FIRST = 'bill_cycle_iso DESC, first_scraped_at DESC'
+
 def sort_bills_by_date(bills: List[Dict[str, Any]], desc: bool = True) -> List[Dict[str, Any]]:
     """Sort bills by bill_cycle_date chronologically"""
     def get_sort_key(bill):
@@ -292,27 +472,23 @@ def sort_bills_by_date(bills: List[Dict[str, Any]], desc: bool = True) -> List[D
 
 def get_all_bills(limit: int = 100) -> List[Dict[str, Any]]:
     """Get all bills ordered by bill_cycle_date (newest first)"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('SELECT * FROM bills LIMIT ?', (limit,))
-    rows = cursor.fetchall()
-    conn.close()
+        cursor.execute(f'SELECT * FROM bills ORDER BY {BILLS_NEWEST_FIRST} LIMIT ?', (limit,))
+        rows = cursor.fetchall()
     
-    bills = [dict(row) for row in rows]
-    # Sort in Python to handle variable date formats (M/D/YYYY, MM/DD/YYYY, etc.)
-    return sort_bills_by_date(bills, desc=True)
+        return [dict(row) for row in rows]
 
 def get_bill_by_id(bill_id: int) -> Optional[Dict[str, Any]]:
     """Get a single bill by ID"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('SELECT * FROM bills WHERE id = ?', (bill_id,))
-    row = cursor.fetchone()
-    conn.close()
+        cursor.execute('SELECT * FROM bills WHERE id = ?', (bill_id,))
+        row = cursor.fetchone()
     
-    return dict(row) if row else None
+        return dict(row) if row else None
 
 # ==========================================
 # BILL DOCUMENTS (PDF per billing period)
@@ -320,11 +496,9 @@ def get_bill_by_id(bill_id: int) -> Optional[Dict[str, Any]]:
 
 def upsert_bill_document(bill_id: int, pdf_path: str, source_url: Optional[str] = None) -> bool:
     """Store or update PDF path for a bill"""
-    conn = get_connection()
-    cursor = conn.cursor()
     now = utc_now_iso()
-    try:
-        cursor.execute('''
+    with db_connection() as conn:
+        conn.execute('''
             INSERT INTO bill_documents (bill_id, pdf_path, source_url, created_at)
             VALUES (?, ?, ?, ?)
             ON CONFLICT(bill_id) DO UPDATE SET
@@ -332,56 +506,48 @@ def upsert_bill_document(bill_id: int, pdf_path: str, source_url: Optional[str]
                 source_url = COALESCE(excluded.source_url, source_url),
                 created_at = excluded.created_at
         ''', (bill_id, pdf_path, source_url, now))
-        conn.commit()
-        return True
-    finally:
-        conn.close()
+    return True
 
 def get_bill_document(bill_id: int) -> Optional[Dict[str, Any]]:
     """Get bill document record by bill_id"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM bill_documents WHERE bill_id = ?', (bill_id,))
-    row = cursor.fetchone()
-    conn.close()
-    return dict(row) if row else None
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM bill_documents WHERE bill_id = ?', (bill_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
 
 def get_all_bill_documents_with_periods() -> List[Dict[str, Any]]:
     """Get all bill documents with month_range for MQTT attributes. Caller builds hosted URLs."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT bd.bill_id, bd.pdf_path, b.month_range
-        FROM bill_documents bd
-        JOIN bills b ON bd.bill_id = b.id
-        ORDER BY b.bill_cycle_date DESC
-    ''')
-    rows = cursor.fetchall()
-    conn.close()
-    return [{"bill_id": r["bill_id"], "pdf_path": r["pdf_path"], "month_range": r["month_range"] or f"Bill {r['bill_id']}"} for r in rows]
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT bd.bill_id, bd.pdf_path, b.month_range
+            FROM bill_documents bd
+            JOIN bills b ON bd.bill_id = b.id
+            ORDER BY b.bill_cycle_iso DESC, b.first_scraped_at DESC
+        ''')
+        rows = cursor.fetchall()
+        return [{"bill_id": r["bill_id"], "pdf_path": r["pdf_path"], "month_range": r["month_range"] or f"Bill {r['bill_id']}"} for r in rows]
 
 def get_latest_bill_id_with_document() -> Optional[int]:
     """Get bill_id of the most recent bill that has a PDF"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT bd.bill_id FROM bill_documents bd
-        JOIN bills b ON bd.bill_id = b.id
-        ORDER BY b.bill_cycle_date DESC LIMIT 1
-    ''')
-    row = cursor.fetchone()
-    conn.close()
-    return row["bill_id"] if row else None
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT bd.bill_id FROM bill_documents bd
+            JOIN bills b ON bd.bill_id = b.id
+            ORDER BY b.bill_cycle_iso DESC, b.first_scraped_at DESC LIMIT 1
+        ''')
+        row = cursor.fetchone()
+        return row["bill_id"] if row else None
 
 def delete_bill_document(bill_id: int) -> bool:
     """Remove bill document record"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM bill_documents WHERE bill_id = ?', (bill_id,))
-    deleted = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return deleted
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM bill_documents WHERE bill_id = ?', (bill_id,))
+        deleted = cursor.rowcount > 0
+        return deleted
 
 def migrate_legacy_pdf() -> bool:
     """Migrate legacy latest_bill.pdf to bill_documents. Returns True if migrated."""
@@ -412,130 +578,124 @@ def migrate_legacy_pdf() -> bool:
 
 def upsert_payment(payment_data: Dict[str, Any], bill_id: Optional[int] = None, scrape_order: int = 0) -> int:
     """Insert or update a payment, returns payment ID"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    payment_date = payment_data.get('bill_cycle_date', '')  # ConEd uses bill_cycle_date for payment date
-    description = payment_data.get('description', 'Payment Received')
-    amount = payment_data.get('amount', '')
-    amount_numeric = parse_amount(amount)
-    now = utc_now_iso()
-    
-    # Generate unique hash for this payment
-    bill_cycle = ''
-    if bill_id:
-        bill = get_bill_by_id(bill_id)
-        if bill:
-            bill_cycle = bill.get('bill_cycle_date', '')
-    
-    payment_hash = generate_payment_hash(payment_date, amount, description, bill_cycle)
-    
-    # Try to find existing payment by hash
-    cursor.execute('SELECT id, scrape_count FROM payments WHERE payment_hash = ?', (payment_hash,))
-    existing = cursor.fetchone()
-    
-    if existing:
-        # Update existing payment
-        cursor.execute('''
-            UPDATE payments SET 
-                last_scraped_at = ?,
-                scrape_count = scrape_count + 1
-            WHERE id = ?
-        ''', (now, existing['id']))
-        payment_id = existing['id']
-    else:
-        # Insert new payment with 2-hour pending window for payee auto-assignment
-        pending_until = (datetime.now(timezone.utc) + timedelta(hours=2)).isoformat()
-        cursor.execute('''
-            INSERT INTO payments (bill_id, payment_date, description, amount, amount_numeric, 
-                                  first_scraped_at, last_scraped_at, scrape_order, payment_hash,
-                                  payee_status, payee_pending_until)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'pending', ?)
-        ''', (bill_id, payment_date, description, amount, amount_numeric, now, now, scrape_order, payment_hash, pending_until))
-        payment_id = cursor.lastrowid
-    
-    conn.commit()
-    conn.close()
-    return payment_id
+    with db_connection() as conn:
+        cursor = conn.cursor()
+    
+        payment_date = payment_data.get('bill_cycle_date', '')  # ConEd uses bill_cycle_date for payment date
+        description = payment_data.get('description', 'Payment Received')
+        amount = payment_data.get('amount', '')
+        amount_numeric = parse_amount(amount)
+        now = utc_now_iso()
+    
+        # Generate unique hash for this payment
+        bill_cycle = ''
+        if bill_id:
+            bill = get_bill_by_id(bill_id)
+            if bill:
+                bill_cycle = bill.get('bill_cycle_date', '')
+    
+        payment_hash = generate_payment_hash(payment_date, amount, description, bill_cycle)
+    
+        # Try to find existing payment by hash
+        cursor.execute('SELECT id, scrape_count FROM payments WHERE payment_hash = ?', (payment_hash,))
+        existing = cursor.fetchone()
+    
+        if existing:
+            # Update existing payment
+            cursor.execute('''
+                UPDATE payments SET 
+                    last_scraped_at = ?,
+                    scrape_count = scrape_count + 1
+                WHERE id = ?
+            ''', (now, existing['id']))
+            payment_id = existing['id']
+        else:
+            # Insert new payment with 2-hour pending window for payee auto-assignment
+            pending_until = (datetime.now(timezone.utc) + timedelta(hours=2)).isoformat()
+            cursor.execute('''
+                INSERT INTO payments (bill_id, payment_date, payment_date_iso, description, amount, amount_numeric, 
+                                      first_scraped_at, last_scraped_at, scrape_order, payment_hash,
+                                      payee_status, payee_pending_until)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'pending', ?)
+            ''', (bill_id, payment_date, parse_us_date_to_sortable(payment_date), description, amount, amount_numeric,
+                  now, now, scrape_order, payment_hash, pending_until))
+            payment_id = cursor.lastrowid
+            _refresh_payee_balances(cursor, [bill_id])
+    
+        return payment_id
 
 def get_all_payments(limit: int = 100, bill_id: Optional[int] = None) -> List[Dict[str, Any]]:
     """Get all payments ordered by payment_date (then first_scraped_at for same-day)"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    if bill_id:
-        cursor.execute('''
-            SELECT p.*, u.name as payee_name, b.month_range as bill_month, b.bill_cycle_date as bill_cycle
-            FROM payments p
-            LEFT JOIN payee_users u ON p.payee_user_id = u.id
-            LEFT JOIN bills b ON p.bill_id = b.id
-            WHERE p.bill_id = ?
-            ORDER BY p.payment_date DESC, p.first_scraped_at ASC
-            LIMIT ?
-        ''', (bill_id, limit))
-    else:
-        cursor.execute('''
-            SELECT p.*, u.name as payee_name, b.month_range as bill_month, b.bill_cycle_date as bill_cycle
-            FROM payments p
-            LEFT JOIN payee_users u ON p.payee_user_id = u.id
-            LEFT JOIN bills b ON p.bill_id = b.id
-            ORDER BY p.payment_date DESC, p.first_scraped_at ASC
-            LIMIT ?
-        ''', (limit,))
+    with db_connection() as conn:
+        cursor = conn.cursor()
+    
+        if bill_id:
+            cursor.execute('''
+                SELECT p.*, u.name as payee_name, b.month_range as bill_month, b.bill_cycle_date as bill_cycle
+                FROM payments p
+                LEFT JOIN payee_users u ON p.payee_user_id = u.id
+                LEFT JOIN bills b ON p.bill_id = b.id
+                WHERE p.bill_id = ?
+                ORDER BY p.payment_date_iso DESC, p.first_scraped_at ASC
+                LIMIT ?
+            ''', (bill_id, limit))
+        else:
+            cursor.execute('''
+                SELECT p.*, u.name as payee_name, b.month_range as bill_month, b.bill_cycle_date as bill_cycle
+                FROM payments p
+                LEFT JOIN payee_users u ON p.payee_user_id = u.id
+                LEFT JOIN bills b ON p.bill_id = b.id
+                ORDER BY p.payment_date_iso DESC, p.first_scraped_at ASC
+                LIMIT ?
+            ''', (limit,))
     
-    rows = cursor.fetchall()
-    conn.close()
+        rows = cursor.fetchall()
     
-    return [dict(row) for row in rows]
+        return [dict(row) for row in rows]
 
 def get_latest_payment() -> Optional[Dict[str, Any]]:
     """
     Get the most recent payment from the most recent billing cycle.
     Respects manual_order if set, otherwise uses payment_date + first_scraped_at.
     """
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    # Get all bills to find the most recent one
-    cursor.execute('SELECT * FROM bills')
-    bills = [dict(row) for row in cursor.fetchall()]
+        # Find the most recent bill
+        cursor.execute(f'SELECT id FROM bills ORDER BY {BILLS_NEWEST_FIRST} LIMIT 1')
+        most_recent_bill = cursor.fetchone()
     
-    if not bills:
-        # No bills, fall back to any payment
-        conn.close()
-        payments = get_all_payments(limit=1)
-        return payments[0] if payments else None
+        if not most_recent_bill:
+            # No bills, fall back to any payment
+            payments = get_all_payments(limit=1)
+            return payments[0] if payments else None
     
-    # Sort bills by date (most recent first)
-    bills = sort_bills_by_date(bills, desc=True)
-    most_recent_bill = bills[0]
-    bill_id = most_recent_bill['id']
+        bill_id = most_recent_bill['id']
     
-    # Get the "first" payment for this bill
-    # New unlocked payments first, then locked payments in their manual order
-    cursor.execute('''
-        SELECT p.*, u.name as payee_name, b.month_range as bill_month, b.bill_cycle_date as bill_cycle
-        FROM payments p
-        LEFT JOIN payee_users u ON p.payee_user_id = u.id
-        LEFT JOIN bills b ON p.bill_id = b.id
-        WHERE p.bill_id = ?
-        ORDER BY 
-            CASE WHEN p.manual_order IS NOT NULL THEN 1 ELSE 0 END,
-            p.payment_date DESC,
-            p.first_scraped_at DESC,
-            p.manual_order ASC
-        LIMIT 1
-    ''', (bill_id,))
+        # Get the "first" payment for this bill
+        # New unlocked payments first, then locked payments in their manual order
+        cursor.execute('''
+            SELECT p.*, u.name as payee_name, b.month_range as bill_month, b.bill_cycle_date as bill_cycle
+            FROM payments p
+            LEFT JOIN payee_users u ON p.payee_user_id = u.id
+            LEFT JOIN bills b ON p.bill_id = b.id
+            WHERE p.bill_id = ?
+            ORDER BY 
+                CASE WHEN p.manual_order IS NOT NULL THEN 1 ELSE 0 END,
+                p.payment_date_iso DESC,
+                p.first_scraped_at DESC,
+                p.manual_order ASC
+            LIMIT 1
+        ''', (bill_id,))
     
-    row = cursor.fetchone()
-    conn.close()
+        row = cursor.fetchone()
     
-    if row:
-        return dict(row)
+        if row:
+            return dict(row)
     
-    # No payments for this bill, try to get any payment
-    payments = get_all_payments(limit=1)
-    return payments[0] if payments else None
+        # No payments for this bill, try to get any payment
+        payments = get_all_payments(limit=1)
+        return payments[0] if payments else None
 
 def get_payments_for_bill(bill_id: int) -> List[Dict[str, Any]]:
     """Get all payments for a specific bill"""
@@ -543,253 +703,262 @@ def get_payments_for_bill(bill_id: int) -> List[Dict[str, Any]]:
 
 def get_payment_by_id(payment_id: int) -> Optional[Dict[str, Any]]:
     """Get a single payment by ID"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT p.*, u.name as payee_name, b.month_range as bill_month, b.bill_cycle_date as bill_cycle
-        FROM payments p
-        LEFT JOIN payee_users u ON p.payee_user_id = u.id
-        LEFT JOIN bills b ON p.bill_id = b.id
-        WHERE p.id = ?
-    ''', (payment_id,))
+        cursor.execute('''
+            SELECT p.*, u.name as payee_name, b.month_range as bill_month, b.bill_cycle_date as bill_cycle
+            FROM payments p
+            LEFT JOIN payee_users u ON p.payee_user_id = u.id
+            LEFT JOIN bills b ON p.bill_id = b.id
+            WHERE p.id = ?
+        ''', (payment_id,))
     
-    row = cursor.fetchone()
-    conn.close()
+        row = cursor.fetchone()
     
-    return dict(row) if row else None
+        return dict(row) if row else None
 
 def update_payment_bill(payment_id: int, bill_id: Optional[int], manual: bool = True) -> bool:
     """Update which bill a payment belongs to. If manual=True, marks as manually set."""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        previous_bill_ids = _payment_bill_ids(cursor, payment_id)
     
-    cursor.execute('''
-        UPDATE payments SET 
-            bill_id = ?,
-            bill_manually_set = ?
-        WHERE id = ?
-    ''', (bill_id, 1 if manual else 0, payment_id))
+        cursor.execute('''
+            UPDATE payments SET 
+                bill_id = ?,
+                bill_manually_set = ?
+            WHERE id = ?
+        ''', (bill_id, 1 if manual else 0, payment_id))
     
-    updated = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return updated
+        updated = cursor.rowcount > 0
+        if updated:
+            _refresh_payee_balances(cursor, previous_bill_ids + [bill_id])
+        return updated
 
 def update_payment_order(payment_id: int, bill_id: Optional[int], order: int) -> bool:
     """Update payment's bill and manual order position"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        previous_bill_ids = _payment_bill_ids(cursor, payment_id)
     
-    cursor.execute('''
-        UPDATE payments SET 
-            bill_id = ?,
-            bill_manually_set = 1,
-            manual_order = ?
-        WHERE id = ?
-    ''', (bill_id, order, payment_id))
-    
-    updated = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return updated
+        cursor.execute('''
+            UPDATE payments SET 
+                bill_id = ?,
+                bill_manually_set = 1,
+                manual_order = ?
+            WHERE id = ?
+        ''', (bill_id, order, payment_id))
+    
+        updated = cursor.rowcount > 0
+        if updated:
+            _refresh_payee_balances(cursor, previous_bill_ids + [bill_id])
+        return updated
 
 def clear_payment_manual_audit(payment_id: int) -> bool:
     """Clear/release the manual audit on a payment, allowing auto-logic to take over again"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('''
-        UPDATE payments SET 
-            bill_manually_set = 0,
-            manual_order = NULL
-        WHERE id = ?
-    ''', (payment_id,))
+        cursor.execute('''
+            UPDATE payments SET 
+                bill_manually_set = 0,
+                manual_order = NULL
+            WHERE id = ?
+        ''', (payment_id,))
     
-    updated = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return updated
+        updated = cursor.rowcount > 0
+        return updated
 
 def get_most_recent_bill_payment_count() -> Dict[str, Any]:
     """Get payment count for the most recent billing cycle"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    # Get all bills
-    cursor.execute('SELECT * FROM bills')
-    bills = [dict(row) for row in cursor.fetchall()]
+        # Find the most recent bill
+        cursor.execute(f'SELECT id, bill_cycle_date FROM bills ORDER BY {BILLS_NEWEST_FIRST} LIMIT 1')
+        most_recent_bill = cursor.fetchone()
     
-    if not bills:
-        conn.close()
-        return {"bill_id": None, "payment_count": 0, "last_payment": None}
+        if not most_recent_bill:
+            return {"bill_id": None, "payment_count": 0, "last_payment": None}
     
-    # Sort bills by date (most recent first)
-    bills = sort_bills_by_date(bills, desc=True)
-    most_recent_bill = bills[0]
-    bill_id = most_recent_bill['id']
+        bill_id = most_recent_bill['id']
     
-    # Count payments for this bill
-    cursor.execute('''
-        SELECT COUNT(*) as count FROM payments WHERE bill_id = ?
-    ''', (bill_id,))
-    count = cursor.fetchone()['count']
+        # Count payments for this bill
+        cursor.execute('''
+            SELECT COUNT(*) as count FROM payments WHERE bill_id = ?
+        ''', (bill_id,))
+        count = cursor.fetchone()['count']
     
-    # Get the "last" payment (first in order - most recent payment)
-    cursor.execute('''
-        SELECT p.*, u.name as payee_name
-        FROM payments p
-        LEFT JOIN payee_users u ON p.payee_user_id = u.id
-        WHERE p.bill_id = ?
-        ORDER BY 
-            CASE WHEN p.manual_order IS NOT NULL THEN 1 ELSE 0 END,
-            p.payment_date DESC,
-            p.first_scraped_at DESC,
-            p.manual_order ASC
-        LIMIT 1
-    ''', (bill_id,))
+        # Get the "last" payment (first in order - most recent payment)
+        cursor.execute('''
+            SELECT p.*, u.name as payee_name
+            FROM payments p
+            LEFT JOIN payee_users u ON p.payee_user_id = u.id
+            WHERE p.bill_id = ?
+            ORDER BY 
+                CASE WHEN p.manual_order IS NOT NULL THEN 1 ELSE 0 END,
+                p.payment_date_iso DESC,
+                p.first_scraped_at DESC,
+                p.manual_order ASC
+            LIMIT 1
+        ''', (bill_id,))
     
-    last_payment_row = cursor.fetchone()
-    last_payment = dict(last_payment_row) if last_payment_row else None
+        last_payment_row = cursor.fetchone()
+        last_payment = dict(last_payment_row) if last_payment_row else None
     
-    conn.close()
     
-    return {
-        "bill_id": bill_id,
-        "bill_cycle_date": most_recent_bill.get('bill_cycle_date', ''),
-        "payment_count": count,
-        "last_payment": last_payment
-    }
+        return {
+            "bill_id": bill_id,
+            "bill_cycle_date": most_recent_bill['bill_cycle_date'] or '',
+            "payment_count": count,
+            "last_payment": last_payment
+        }
 
 def get_payments_by_user(user_id: int) -> List[Dict[str, Any]]:
     """Get all payments assigned to a specific user"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT p.*, b.month_range as bill_month, b.bill_cycle_date as bill_cycle
-        FROM payments p
-        LEFT JOIN bills b ON p.bill_id = b.id
-        WHERE p.payee_user_id = ?
-        ORDER BY p.payment_date DESC
-    ''', (user_id,))
+        cursor.execute('''
+            SELECT p.*, b.month_range as bill_month, b.bill_cycle_date as bill_cycle
+            FROM payments p
+            LEFT JOIN bills b ON p.bill_id = b.id
+            WHERE p.payee_user_id = ?
+            ORDER BY p.payment_date_iso DESC
+        ''', (user_id,))
     
-    rows = cursor.fetchall()
-    conn.close()
+        rows = cursor.fetchall()
     
-    return [dict(row) for row in rows]
+        return [dict(row) for row in rows]
+
+# Per-bill payment order: new unlocked payments first, then locked ones in manual order
+_BILL_PAYMENT_ORDER = """
+    CASE WHEN p.manual_order IS NOT NULL THEN 1 ELSE 0 END,
+    p.payment_date_iso DESC,
+    p.first_scraped_at DESC,
+    p.manual_order ASC
+"""
+
+def _get_payments_grouped_by_bill(cursor: sqlite3.Cursor, bill_ids: Optional[List[int]] = None) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Fetch payments (with payee_name) for many bills in one query and group them by bill_id.
+    bill_ids=None fetches every assigned payment. Per-bill order matches _BILL_PAYMENT_ORDER.
+    """
+    if bill_ids is not None and not bill_ids:
+        return {}
+    where = 'p.bill_id IS NOT NULL'
+    params: tuple = ()
+    if bill_ids is not None:
+        where = f'p.bill_id IN ({",".join("?" * len(bill_ids))})'
+        params = tuple(bill_ids)
+    cursor.execute(f'''
+        SELECT p.*, u.name as payee_name FROM payments p
+        LEFT JOIN payee_users u ON p.payee_user_id = u.id
+        WHERE {where}
+        ORDER BY p.bill_id, {_BILL_PAYMENT_ORDER}
+    ''', params)
+    grouped: Dict[int, List[Dict[str, Any]]] = {}
+    for row in cursor.fetchall():
+        grouped.setdefault(row['bill_id'], []).append(dict(row))
+    return grouped
 
 def get_all_bills_with_payments() -> List[Dict[str, Any]]:
     """Get all bills with their payments for the Payments audit tab"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    # Get all bills (will be sorted in Python)
-    cursor.execute('SELECT * FROM bills')
-    bills = [dict(row) for row in cursor.fetchall()]
+        # Get all bills (newest first)
+        cursor.execute(f'SELECT * FROM bills ORDER BY {BILLS_NEWEST_FIRST}')
+        bills = [dict(row) for row in cursor.fetchall()]
     
-    # Get payments for each bill
-    for bill in bills:
+        # Payments for every bill in one query, grouped in memory
+        payments_by_bill = _get_payments_grouped_by_bill(cursor)
+        for bill in bills:
+            bill['payments'] = payments_by_bill.get(bill['id'], [])
+    
+        # Get orphan payments
         cursor.execute('''
             SELECT p.*, u.name as payee_name FROM payments p
             LEFT JOIN payee_users u ON p.payee_user_id = u.id
-            WHERE p.bill_id = ?
-            ORDER BY 
-                CASE WHEN p.manual_order IS NOT NULL THEN 1 ELSE 0 END,
-                p.payment_date DESC, 
-                p.first_scraped_at DESC,
-                p.manual_order ASC
-        ''', (bill['id'],))
-        bill['payments'] = [dict(row) for row in cursor.fetchall()]
-    
-    # Get orphan payments
-    cursor.execute('''
-        SELECT p.*, u.name as payee_name FROM payments p
-        LEFT JOIN payee_users u ON p.payee_user_id = u.id
-        WHERE p.bill_id IS NULL
-        ORDER BY p.payment_date DESC
-    ''')
-    orphan_payments = [dict(row) for row in cursor.fetchall()]
-    
-    conn.close()
+            WHERE p.bill_id IS NULL
+            ORDER BY p.payment_date_iso DESC
+        ''')
+        orphan_payments = [dict(row) for row in cursor.fetchall()]
     
-    # Sort bills by date (newest first) using Python to handle variable date formats
-    sorted_bills = sort_bills_by_date(bills, desc=True)
-    
-    return {'bills': sorted_bills, 'orphan_payments': orphan_payments}
+        return {'bills': bills, 'orphan_payments': orphan_payments}
 
 def auto_assign_expired_pending_payments() -> Dict[str, Any]:
     """
     Find payments that are past their 2-hour pending window and still unassigned.
     Auto-assign them to the default payee.
     """
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    now = datetime.now(timezone.utc).isoformat()
-    
-    # Find payments that are pending and past their window
-    cursor.execute('''
-        SELECT id, amount, payment_date FROM payments 
-        WHERE payee_status = 'pending' 
-        AND payee_user_id IS NULL
-        AND payee_pending_until IS NOT NULL
-        AND payee_pending_until < ?
-    ''', (now,))
-    
-    expired = cursor.fetchall()
-    conn.close()
-    
-    if not expired:
-        return {'assigned': 0, 'message': 'No expired pending payments'}
-    
-    # Get default payee
-    default_payee = get_default_payee()
-    if not default_payee:
-        return {'assigned': 0, 'message': 'No default payee configured'}
-    
-    # Assign expired payments to default payee
-    assigned = 0
-    for payment in expired:
-        try:
-            attribute_payment(
-                payment['id'],
-                default_payee['id'],
-                method='auto_timeout',
-                card_last_four=None
-            )
-            assigned += 1
-        except Exception as e:
-            logging.warning(f"Failed to auto-assign payment {payment['id']}: {e}")
+        now = datetime.now(timezone.utc).isoformat()
     
-    return {
-        'assigned': assigned,
-        'default_payee': default_payee['name'],
-        'message': f'Assigned {assigned} expired pending payments to {default_payee["name"]}'
-    }
+        # Find payments that are pending and past their window
+        cursor.execute('''
+            SELECT id, amount, payment_date FROM payments 
+            WHERE payee_status = 'pending' 
+            AND payee_user_id IS NULL
+            AND payee_pending_until IS NOT NULL
+            AND payee_pending_until < ?
+        ''', (now,))
+    
+        expired = cursor.fetchall()
+    
+        if not expired:
+            return {'assigned': 0, 'message': 'No expired pending payments'}
+    
+        # Get default payee
+        default_payee = get_default_payee()
+        if not default_payee:
+            return {'assigned': 0, 'message': 'No default payee configured'}
+    
+        # Assign expired payments to default payee
+        assigned = 0
+        for payment in expired:
+            try:
+                attribute_payment(
+                    payment['id'],
+                    default_payee['id'],
+                    method='auto_timeout',
+                    card_last_four=None
+                )
+                assigned += 1
+            except Exception as e:
+                logging.warning(f"Failed to auto-assign payment {payment['id']}: {e}")
+    
+        return {
+            'assigned': assigned,
+            'default_payee': default_payee['name'],
+            'message': f'Assigned {assigned} expired pending payments to {default_payee["name"]}'
+        }
 
 def wipe_bills_and_payments() -> Dict[str, int]:
     """Delete all bills and payments from the database"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    # Get counts before deletion
-    cursor.execute('SELECT COUNT(*) FROM payments')
-    payment_count = cursor.fetchone()[0]
+        # Get counts before deletion
+        cursor.execute('SELECT COUNT(*) FROM payments')
+        payment_count = cursor.fetchone()[0]
     
-    cursor.execute('SELECT COUNT(*) FROM bills')
-    bill_count = cursor.fetchone()[0]
+        cursor.execute('SELECT COUNT(*) FROM bills')
+        bill_count = cursor.fetchone()[0]
     
-    # Delete all payments first (foreign key constraint)
-    cursor.execute('DELETE FROM payments')
+        # Delete all payments first (foreign key constraint)
+        cursor.execute('DELETE FROM payments')
     
-    # Delete all bills
-    cursor.execute('DELETE FROM bills')
+        # Delete all bills
+        cursor.execute('DELETE FROM bills')
+        cursor.execute('DELETE FROM payee_balance_snapshots')
+        cursor.execute('DELETE FROM bill_balance_snapshots')
     
-    conn.commit()
-    conn.close()
     
-    return {'payments_deleted': payment_count, 'bills_deleted': bill_count}
+        return {'payments_deleted': payment_count, 'bills_deleted': bill_count}
 
 # ==========================================
 # ACCOUNT BALANCE FUNCTIONS
@@ -797,47 +966,44 @@ def wipe_bills_and_payments() -> Dict[str, int]:
 
 def record_account_balance(balance: str) -> bool:
     """Record account balance, returns True if it changed"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    balance_numeric = parse_amount(balance)
-    now = utc_now_iso()
+        balance_numeric = parse_amount(balance)
+        now = utc_now_iso()
     
-    # Get previous balance
-    cursor.execute('''
-        SELECT balance FROM account_balance_history
-        ORDER BY scraped_at DESC LIMIT 1
-    ''')
-    previous = cursor.fetchone()
+        # Get previous balance
+        cursor.execute('''
+            SELECT balance FROM account_balance_history
+            ORDER BY scraped_at DESC LIMIT 1
+        ''')
+        previous = cursor.fetchone()
     
-    changed = False
-    if previous is None or previous['balance'] != balance:
-        changed = True
+        changed = False
+        if previous is None or previous['balance'] != balance:
+            changed = True
     
-    # Always record if changed, or first entry
-    if changed or previous is None:
-        cursor.execute('''
-            INSERT INTO account_balance_history (balance, balance_numeric, scraped_at, changed_from_previous)
-            VALUES (?, ?, ?, ?)
-        ''', (balance, balance_numeric, now, 1 if (previous and changed) else 0))
-        conn.commit()
+        # Always record if changed, or first entry
+        if changed or previous is None:
+            cursor.execute('''
+                INSERT INTO account_balance_history (balance, balance_numeric, scraped_at, changed_from_previous)
+                VALUES (?, ?, ?, ?)
+            ''', (balance, balance_numeric, now, 1 if (previous and changed) else 0))
     
-    conn.close()
-    return changed
+        return changed
 
 def get_current_balance() -> Optional[Dict[str, Any]]:
     """Get the current account balance"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT * FROM account_balance_history
-        ORDER BY scraped_at DESC LIMIT 1
-    ''')
-    row = cursor.fetchone()
-    conn.close()
+        cursor.execute('''
+            SELECT * FROM account_balance_history
+            ORDER BY scraped_at DESC LIMIT 1
+        ''')
+        row = cursor.fetchone()
     
-    return dict(row) if row else None
+        return dict(row) if row else None
 
 # ==========================================
 # PAYEE USER FUNCTIONS
@@ -845,95 +1011,90 @@ def get_current_balance() -> Optional[Dict[str, Any]]:
 
 def create_payee_user(name: str, is_default: bool = False) -> int:
     """Create a new payee user"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    # If setting as default, clear other defaults
-    if is_default:
-        cursor.execute('UPDATE payee_users SET is_default = 0')
+        # If setting as default, clear other defaults
+        if is_default:
+            cursor.execute('UPDATE payee_users SET is_default = 0')
     
-    cursor.execute('''
-        INSERT INTO payee_users (name, is_default, created_at)
-        VALUES (?, ?, ?)
-    ''', (name, 1 if is_default else 0, utc_now_iso()))
+        cursor.execute('''
+            INSERT INTO payee_users (name, is_default, created_at)
+            VALUES (?, ?, ?)
+        ''', (name, 1 if is_default else 0, utc_now_iso()))
     
-    user_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return user_id
+        user_id = cursor.lastrowid
+        _refresh_payee_balances(cursor)
+        return user_id
 
 def get_payee_users() -> List[Dict[str, Any]]:
     """Get all payee users with their cards"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT u.*, GROUP_CONCAT(c.card_last_four) as cards
-        FROM payee_users u
-        LEFT JOIN user_cards c ON u.id = c.user_id
-        GROUP BY u.id
-        ORDER BY u.name
-    ''')
+        cursor.execute('''
+            SELECT u.*, GROUP_CONCAT(c.card_last_four) as cards
+            FROM payee_users u
+            LEFT JOIN user_cards c ON u.id = c.user_id
+            GROUP BY u.id
+            ORDER BY u.name
+        ''')
     
-    rows = cursor.fetchall()
-    conn.close()
+        rows = cursor.fetchall()
     
-    result = []
-    for row in rows:
-        user = dict(row)
-        user['cards'] = row['cards'].split(',') if row['cards'] else []
-        result.append(user)
+        result = []
+        for row in rows:
+            user = dict(row)
+            user['cards'] = row['cards'].split(',') if row['cards'] else []
+            result.append(user)
     
-    return result
+        return result
 
 def get_default_payee() -> Optional[Dict[str, Any]]:
     """Get the default payee user"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('SELECT * FROM payee_users WHERE is_default = 1 LIMIT 1')
-    row = cursor.fetchone()
-    conn.close()
+        cursor.execute('SELECT * FROM payee_users WHERE is_default = 1 LIMIT 1')
+        row = cursor.fetchone()
     
-    return dict(row) if row else None
+        return dict(row) if row else None
 
 def delete_payee_user(user_id: int) -> bool:
     """Delete a payee user"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('DELETE FROM payee_users WHERE id = ?', (user_id,))
-    deleted = cursor.rowcount > 0
+        cursor.execute('DELETE FROM payee_users WHERE id = ?', (user_id,))
+        deleted = cursor.rowcount > 0
+        # Other payees' rollover is independent, so only this payee's rows go
+        cursor.execute('DELETE FROM payee_balance_snapshots WHERE user_id = ?', (user_id,))
     
-    conn.commit()
-    conn.close()
-    return deleted
+        return deleted
 
 def update_payee_user(user_id: int, name: Optional[str] = None, is_default: Optional[bool] = None) -> bool:
     """Update a payee user"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    if is_default:
-        cursor.execute('UPDATE payee_users SET is_default = 0')
+        if is_default:
+            cursor.execute('UPDATE payee_users SET is_default = 0')
     
-    updates = []
-    params = []
+        updates = []
+        params = []
     
-    if name is not None:
-        updates.append('name = ?')
-        params.append(name)
-    if is_default is not None:
-        updates.append('is_default = ?')
-        params.append(1 if is_default else 0)
+        if name is not None:
+            updates.append('name = ?')
+            params.append(name)
+        if is_default is not None:
+            updates.append('is_default = ?')
+            params.append(1 if is_default else 0)
     
-    if updates:
-        params.append(user_id)
-        cursor.execute(f'UPDATE payee_users SET {", ".join(updates)} WHERE id = ?', params)
+        if updates:
+            params.append(user_id)
+            cursor.execute(f'UPDATE payee_users SET {", ".join(updates)} WHERE id = ?', params)
     
-    conn.commit()
-    conn.close()
-    return True
+        return True
 
 def update_payee_responsibilities(responsibilities: Dict[int, float]) -> Dict[str, Any]:
     """
@@ -941,165 +1102,186 @@ def update_payee_responsibilities(responsibilities: Dict[int, float]) -> Dict[st
     responsibilities: {user_id: percent}
     Total must equal 100% (or all 0 if not configured)
     """
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    total = sum(responsibilities.values())
+        total = sum(responsibilities.values())
     
-    # Validate: must be 100% or 0%
-    if total > 0 and abs(total - 100.0) > 0.01:
-        conn.close()
-        return {'success': False, 'error': f'Total must equal 100%, got {total:.1f}%'}
+        # Validate: must be 100% or 0%
+        if total > 0 and abs(total - 100.0) > 0.01:
+            return {'success': False, 'error': f'Total must equal 100%, got {total:.1f}%'}
     
-    # Update all users
-    for user_id, percent in responsibilities.items():
-        cursor.execute('''
-            UPDATE payee_users SET responsibility_percent = ? WHERE id = ?
-        ''', (percent, user_id))
-    
-    conn.commit()
-    conn.close()
+        # Update all users
+        for user_id, percent in responsibilities.items():
+            cursor.execute('''
+                UPDATE payee_users SET responsibility_percent = ? WHERE id = ?
+            ''', (percent, user_id))
     
-    return {'success': True, 'total': total}
+        # Shares change on every bill, so rebuild from the oldest
+        _refresh_payee_balances(cursor)
+        return {'success': True, 'total': total}
 
-def calculate_all_payee_balances() -> Dict[int, Dict[str, Any]]:
+# Chronological bill order used for rollover (oldest first); id breaks same-day ties
+_BILL_ROLLOVER_ORDER = 'bill_cycle_iso, first_scraped_at, id'
+
+def _refresh_payee_balances(cursor: sqlite3.Cursor, bill_ids: Optional[List[Optional[int]]] = None):
     """
-    Calculate payee balances for ALL bills at once, in chronological order.
-    This is efficient (single pass) and ensures correct rollover calculation.
-    
-    Returns: {bill_id: {payee_summaries, bill_total, total_paid, etc}}
+    Recompute the materialized balances from the earliest of bill_ids forward.
+    bill_ids=None rebuilds every bill. Rollover is seeded from the stored snapshot
+    of the bill just before the starting point, so earlier bills are not touched.
+    Must run inside the caller's transaction, after its writes.
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Get all bills
-    cursor.execute('SELECT * FROM bills')
-    bills = [dict(row) for row in cursor.fetchall()]
-    
-    if not bills:
-        conn.close()
-        return {}
-    
-    # Sort bills by date in chronological order (oldest first for correct rollover)
-    bills = sort_bills_by_date(bills, desc=False)  # desc=False means oldest first
-    
-    # Get all payees
-    cursor.execute('SELECT * FROM payee_users ORDER BY name')
-    payees = [dict(row) for row in cursor.fetchall()]
-    
-    # Get ALL payments grouped by bill and payee (single query)
-    cursor.execute('''
-        SELECT bill_id, payee_user_id, SUM(amount_numeric) as total_paid
-        FROM payments
-        WHERE bill_id IS NOT NULL AND payee_user_id IS NOT NULL
-        GROUP BY bill_id, payee_user_id
-    ''')
-    payments_map = {}
+    cursor.execute('SELECT id, responsibility_percent FROM payee_users')
+    payees = [(row['id'], row['responsibility_percent'] or 0) for row in cursor.fetchall()]
+    
+    start = None
+    if bill_ids is not None:
+        bill_ids = [bill_id for bill_id in bill_ids if bill_id is not None]
+        if not bill_ids:
+            return
+        cursor.execute(f'''
+            SELECT {_BILL_ROLLOVER_ORDER} FROM bills
+            WHERE id IN ({",".join("?" * len(bill_ids))})
+            ORDER BY {_BILL_ROLLOVER_ORDER} LIMIT 1
+        ''', bill_ids)
+        row = cursor.fetchone()
+        start = tuple(row) if row else None
+    
+    payee_rollover = {payee_id: 0.0 for payee_id, _ in payees}
+    if start is None:
+        # Full rebuild (also drops snapshots of deleted bills/payees)
+        where, params = '1', ()
+        cursor.execute('DELETE FROM payee_balance_snapshots')
+        cursor.execute('DELETE FROM bill_balance_snapshots')
+    else:
+        where, params = f'({_BILL_ROLLOVER_ORDER}) >= (?, ?, ?)', start
+        cursor.execute(f'''
+            SELECT s.user_id, s.total_balance FROM payee_balance_snapshots s
+            WHERE s.bill_id = (SELECT id FROM bills WHERE ({_BILL_ROLLOVER_ORDER}) < (?, ?, ?)
+                               ORDER BY bill_cycle_iso DESC, first_scraped_at DESC, id DESC LIMIT 1)
+        ''', start)
+        for row in cursor.fetchall():
+            if row['user_id'] in payee_rollover:
+                payee_rollover[row['user_id']] = row['total_balance']
+        cursor.execute(f'DELETE FROM payee_balance_snapshots WHERE bill_id IN (SELECT id FROM bills WHERE {where})', params)
+        cursor.execute(f'DELETE FROM bill_balance_snapshots WHERE bill_id IN (SELECT id FROM bills WHERE {where})', params)
+    
+    cursor.execute(f'SELECT id, bill_total FROM bills WHERE {where} ORDER BY {_BILL_ROLLOVER_ORDER}', params)
+    bills = cursor.fetchall()
+    
+    # Payment totals per (bill, payee) for the affected bills only; NULL payee counts toward the bill
+    cursor.execute(f'''
+        SELECT p.bill_id, p.payee_user_id, SUM(p.amount_numeric) as total_paid
+        FROM payments p
+        WHERE p.bill_id IN (SELECT id FROM bills WHERE {where})
+        GROUP BY p.bill_id, p.payee_user_id
+    ''', params)
+    payments_map: Dict[int, Dict[Optional[int], float]] = {}
     for row in cursor.fetchall():
-        bill_id = row['bill_id']
-        payee_id = row['payee_user_id']
-        if bill_id not in payments_map:
-            payments_map[bill_id] = {}
-        payments_map[bill_id][payee_id] = row['total_paid'] or 0
-    
-    # Get total payments per bill (for bill balance)
-    cursor.execute('''
-        SELECT bill_id, SUM(amount_numeric) as total_paid
-        FROM payments
-        WHERE bill_id IS NOT NULL
-        GROUP BY bill_id
-    ''')
-    bill_totals_paid = {row['bill_id']: row['total_paid'] or 0 for row in cursor.fetchall()}
-    
-    conn.close()
-    
-    # Initialize running rollover for each payee (starts at 0)
-    payee_rollover = {payee['id']: 0.0 for payee in payees}
+        payments_map.setdefault(row['bill_id'], {})[row['payee_user_id']] = row['total_paid'] or 0
     
-    # Result storage
-    results = {}
-    
-    # Process bills in chronological order (oldest to newest)
+    now = utc_now_iso()
+    bill_rows = []
+    payee_rows = []
     for bill in bills:
         bill_id = bill['id']
-        bill_total = parse_amount(bill.get('bill_total', '$0'))
+        bill_total = parse_amount(bill['bill_total']) or 0.0
         payments_for_bill = payments_map.get(bill_id, {})
-        total_paid = bill_totals_paid.get(bill_id, 0)
+        bill_rows.append((bill_id, bill_total, sum(payments_for_bill.values()), now))
         
-        payee_summaries = []
-        
-        for payee in payees:
-            payee_id = payee['id']
-            responsibility = payee.get('responsibility_percent', 0) or 0
-            
-            # Their share of THIS bill
+        for payee_id, responsibility in payees:
             share = bill_total * (responsibility / 100.0) if responsibility > 0 else 0
-            
-            # What they paid toward THIS bill
             paid = payments_for_bill.get(payee_id, 0)
-            
-            # Their rollover FROM previous bills (captured before we update it)
             rollover_in = payee_rollover[payee_id]
-            
-            # This period's result: positive = overpaid, negative = underpaid
-            period_balance = paid - share
-            
-            # Total balance including rollover (positive = credit, negative = owes)
-            total_balance = rollover_in + period_balance
-            
-            payee_summaries.append({
-                'user_id': payee_id,
-                'name': payee['name'],
-                'responsibility_percent': responsibility,
-                'share_of_bill': round(share, 2),
-                'amount_paid': round(paid, 2),
-                'rollover_in': round(rollover_in, 2),
-                'period_balance': round(period_balance, 2),
-                'total_balance': round(total_balance, 2),
-                'status': 'credit' if total_balance > 0.01 else ('settled' if abs(total_balance) <= 0.01 else 'owes')
-            })
-            
-            # Update rollover for next bill
+            total_balance = rollover_in + paid - share
+            payee_rows.append((bill_id, payee_id, share, paid, rollover_in, total_balance))
             payee_rollover[payee_id] = total_balance
-        
+    
+    cursor.executemany('''
+        INSERT INTO bill_balance_snapshots (bill_id, bill_total, total_paid, updated_at)
+        VALUES (?, ?, ?, ?)
+    ''', bill_rows)
+    cursor.executemany('''
+        INSERT INTO payee_balance_snapshots (bill_id, user_id, share_of_bill, amount_paid, rollover_in, total_balance)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', payee_rows)
+
+def _payment_bill_ids(cursor: sqlite3.Cursor, payment_id: int) -> List[Optional[int]]:
+    """Current bill of a payment (as a list for _refresh_payee_balances)"""
+    cursor.execute('SELECT bill_id FROM payments WHERE id = ?', (payment_id,))
+    row = cursor.fetchone()
+    return [row['bill_id']] if row else []
+
+def _read_payee_balances(cursor: sqlite3.Cursor, bill_id: Optional[int] = None) -> Dict[int, Dict[str, Any]]:
+    """Build bill summaries from the snapshot tables (one bill, or all bills oldest first)"""
+    where, params = ('WHERE s.bill_id = ?', (bill_id,)) if bill_id is not None else ('', ())
+    cursor.execute(f'''
+        SELECT s.* FROM bill_balance_snapshots s
+        JOIN bills b ON b.id = s.bill_id
+        {where}
+        ORDER BY b.bill_cycle_iso, b.first_scraped_at, b.id
+    ''', params)
+    results = {}
+    for row in cursor.fetchall():
+        bill_total = row['bill_total']
+        total_paid = row['total_paid']
         bill_balance = bill_total - total_paid
-        
-        results[bill_id] = {
-            'bill_id': bill_id,
+        results[row['bill_id']] = {
+            'bill_id': row['bill_id'],
             'bill_total': round(bill_total, 2),
             'total_paid': round(total_paid, 2),
             'bill_balance': round(bill_balance, 2),
             'bill_status': 'paid' if bill_balance <= 0.01 else ('partial' if total_paid > 0 else 'unpaid'),
-            'payee_summaries': payee_summaries
+            'payee_summaries': []
         }
     
+    cursor.execute(f'''
+        SELECT s.*, u.name, u.responsibility_percent FROM payee_balance_snapshots s
+        JOIN payee_users u ON u.id = s.user_id
+        {where}
+        ORDER BY u.name
+    ''', params)
+    for row in cursor.fetchall():
+        summary = results.get(row['bill_id'])
+        if summary is None:
+            continue
+        total_balance = row['total_balance']
+        summary['payee_summaries'].append({
+            'user_id': row['user_id'],
+            'name': row['name'],
+            'responsibility_percent': row['responsibility_percent'] or 0,
+            'share_of_bill': round(row['share_of_bill'], 2),
+            'amount_paid': round(row['amount_paid'], 2),
+            'rollover_in': round(row['rollover_in'], 2),
+            'period_balance': round(row['amount_paid'] - row['share_of_bill'], 2),
+            'total_balance': round(total_balance, 2),
+            'status': 'credit' if total_balance > 0.01 else ('settled' if abs(total_balance) <= 0.01 else 'owes')
+        })
+    
     return results
 
+def calculate_all_payee_balances() -> Dict[int, Dict[str, Any]]:
+    """
+    Payee balances for ALL bills, in chronological order.
+    Reads the materialized snapshots; writers keep them current via _refresh_payee_balances().
+    
+    Returns: {bill_id: {payee_summaries, bill_total, total_paid, etc}}
+    """
+    with db_connection() as conn:
+        return _read_payee_balances(conn.cursor())
+
 
 def get_bill_payee_summary(bill_id: int) -> Dict[str, Any]:
     """
     Get payee breakdown for a specific bill.
-    Uses the efficient all-at-once calculation.
+    Single indexed lookup on the snapshot tables.
     """
-    all_summaries = calculate_all_payee_balances()
-    return all_summaries.get(bill_id, {})
+    with db_connection() as conn:
+        return _read_payee_balances(conn.cursor(), bill_id).get(bill_id, {})
 
 def get_all_bill_summaries() -> List[Dict[str, Any]]:
     """Get summaries for all bills"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT id FROM bills')
-    bill_ids = [row['id'] for row in cursor.fetchall()]
-    conn.close()
-    
-    summaries = []
-    for bill_id in bill_ids:
-        summary = get_bill_payee_summary(bill_id)
-        if summary:
-            summaries.append(summary)
-    
-    return summaries
+    return list(calculate_all_payee_balances().values())
 
 # ==========================================
 # USER CARD FUNCTIONS
@@ -1107,73 +1289,65 @@ def get_all_bill_summaries() -> List[Dict[str, Any]]:
 
 def add_user_card(user_id: int, card_last_four: str, label: Optional[str] = None) -> int:
     """Add a card to a user"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    # Validate 4 digits
-    card_last_four = card_last_four.strip()[-4:]
+        # Validate 4 digits
+        card_last_four = card_last_four.strip()[-4:]
     
-    cursor.execute('''
-        INSERT INTO user_cards (user_id, card_last_four, card_label, created_at)
-        VALUES (?, ?, ?, ?)
-    ''', (user_id, card_last_four, label, utc_now_iso()))
+        cursor.execute('''
+            INSERT INTO user_cards (user_id, card_last_four, card_label, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', (user_id, card_last_four, label, utc_now_iso()))
     
-    card_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return card_id
+        card_id = cursor.lastrowid
+        return card_id
 
 def get_user_by_card(card_last_four: str) -> Optional[Dict[str, Any]]:
     """Find user by card last four digits"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT u.* FROM payee_users u
-        JOIN user_cards c ON u.id = c.user_id
-        WHERE c.card_last_four = ?
-    ''', (card_last_four,))
+        cursor.execute('''
+            SELECT u.* FROM payee_users u
+            JOIN user_cards c ON u.id = c.user_id
+            WHERE c.card_last_four = ?
+        ''', (card_last_four,))
     
-    row = cursor.fetchone()
-    conn.close()
+        row = cursor.fetchone()
     
-    return dict(row) if row else None
+        return dict(row) if row else None
 
 def get_user_cards(user_id: int) -> List[Dict[str, Any]]:
     """Get all cards for a payee user"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, user_id, card_last_four, card_label
-        FROM user_cards
-        WHERE user_id = ?
-        ORDER BY id
-    ''', (user_id,))
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, user_id, card_last_four, card_label
+            FROM user_cards
+            WHERE user_id = ?
+            ORDER BY id
+        ''', (user_id,))
+        rows = cursor.fetchall()
+        return [dict(row) for row in rows]
 
 def update_user_card(card_id: int, card_label: Optional[str] = None) -> bool:
     """Update a card's label"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE user_cards SET card_label = ? WHERE id = ?', (card_label or "", card_id))
-    updated = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return updated
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE user_cards SET card_label = ? WHERE id = ?', (card_label or "", card_id))
+        updated = cursor.rowcount > 0
+        return updated
 
 def delete_user_card(card_id: int) -> bool:
     """Delete a card"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('DELETE FROM user_cards WHERE id = ?', (card_id,))
-    deleted = cursor.rowcount > 0
+        cursor.execute('DELETE FROM user_cards WHERE id = ?', (card_id,))
+        deleted = cursor.rowcount > 0
     
-    conn.commit()
-    conn.close()
-    return deleted
+        return deleted
 
 # ==========================================
 # PAYMENT ATTRIBUTION FUNCTIONS
@@ -1181,59 +1355,58 @@ def delete_user_card(card_id: int) -> bool:
 
 def attribute_payment(payment_id: int, user_id: int, method: str = 'manual', card_last_four: Optional[str] = None) -> bool:
     """Attribute a payment to a user"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('''
-        UPDATE payments SET 
-            payee_user_id = ?,
-            payee_status = 'confirmed',
-            verification_method = ?,
-            card_last_four = ?
-        WHERE id = ?
-    ''', (user_id, method, card_last_four, payment_id))
-    
-    updated = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return updated
+        cursor.execute('''
+            UPDATE payments SET 
+                payee_user_id = ?,
+                payee_status = 'confirmed',
+                verification_method = ?,
+                card_last_four = ?
+            WHERE id = ?
+        ''', (user_id, method, card_last_four, payment_id))
+    
+        updated = cursor.rowcount > 0
+        if updated:
+            _refresh_payee_balances(cursor, _payment_bill_ids(cursor, payment_id))
+        return updated
 
 def clear_payment_attribution(payment_id: int) -> bool:
     """Clear payment attribution (unassign from user)"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('''
-        UPDATE payments SET 
-            payee_user_id = NULL,
-            payee_status = 'unverified',
-            verification_method = NULL,
-            card_last_four = NULL
-        WHERE id = ?
-    ''', (payment_id,))
-    
-    updated = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return updated
+        cursor.execute('''
+            UPDATE payments SET 
+                payee_user_id = NULL,
+                payee_status = 'unverified',
+                verification_method = NULL,
+                card_last_four = NULL
+            WHERE id = ?
+        ''', (payment_id,))
+    
+        updated = cursor.rowcount > 0
+        if updated:
+            _refresh_payee_balances(cursor, _payment_bill_ids(cursor, payment_id))
+        return updated
 
 def get_unverified_payments(limit: int = 50) -> List[Dict[str, Any]]:
     """Get payments that need verification"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT p.*, b.month_range as bill_month FROM payments p
-        LEFT JOIN bills b ON p.bill_id = b.id
-        WHERE p.payee_status = 'unverified'
-        ORDER BY p.payment_date DESC, p.first_scraped_at ASC
-        LIMIT ?
-    ''', (limit,))
+        cursor.execute('''
+            SELECT p.*, b.month_range as bill_month FROM payments p
+            LEFT JOIN bills b ON p.bill_id = b.id
+            WHERE p.payee_status = 'unverified'
+            ORDER BY p.payment_date_iso DESC, p.first_scraped_at ASC
+            LIMIT ?
+        ''', (limit,))
     
-    rows = cursor.fetchall()
-    conn.close()
+        rows = cursor.fetchall()
     
-    return [dict(row) for row in rows]
+        return [dict(row) for row in rows]
 
 # ==========================================
 # DATA SYNC FROM SCRAPE
@@ -1253,52 +1426,112 @@ def parse_date_for_comparison(date_str: str) -> Optional[datetime]:
         except ValueError:
             return None
 
-def find_bill_for_payment(payment_date_str: str, bills: List[Dict[str, Any]]) -> Optional[int]:
+class BillIntervalIndex:
     """
-    Find the appropriate bill for a payment based on payment date.
+    Bills sorted by parsed cycle date, for O(log B) payment-to-bill lookup.
     
     bill_cycle_date = END of billing cycle (date bill was issued)
     A payment belongs to a bill if:
       - payment_date >= this_bill.cycle_date (can't be before the bill was issued)
       - payment_date < next_bill.cycle_date (must be before the next bill)
+    Payments dated before every bill go to the oldest bill.
+    Build once per sync/re-assignment and reuse for every payment.
     """
-    payment_date = parse_date_for_comparison(payment_date_str)
-    if not payment_date:
-        return None
-    
-    # Sort bills by cycle date ascending (oldest first)
-    sorted_bills = []
-    for bill in bills:
-        cycle_date = parse_date_for_comparison(bill['bill_cycle_date'])
-        if cycle_date:
-            sorted_bills.append({
-                'bill_id': bill['bill_id'],
-                'cycle_date': cycle_date
-            })
-    
-    sorted_bills.sort(key=lambda x: x['cycle_date'])  # Ascending (oldest first)
     
-    if not sorted_bills:
-        return None
-    
-    # Find the bill where: bill.cycle_date <= payment_date < next_bill.cycle_date
-    for i, bill in enumerate(sorted_bills):
-        is_after_bill = payment_date >= bill['cycle_date']
+    def __init__(self, bills: List[Dict[str, Any]]):
+        """bills: [{'bill_id', 'bill_cycle_date'}]; unparseable dates are skipped"""
+        parsed = []
+        for bill in bills:
+            cycle_date = parse_date_for_comparison(bill['bill_cycle_date'])
+            if cycle_date:
+                parsed.append((cycle_date, bill['bill_id']))
+        parsed.sort(key=lambda x: x[0])  # Ascending (oldest first), stable for same-day bills
+        self.cycle_dates = [cycle_date for cycle_date, _ in parsed]
+        self.bill_ids = [bill_id for _, bill_id in parsed]
+    
+    @classmethod
+    def from_cursor(cls, cursor: sqlite3.Cursor) -> 'BillIntervalIndex':
+        """Index every bill in the database"""
+        cursor.execute('SELECT id as bill_id, bill_cycle_date FROM bills')
+        return cls([dict(row) for row in cursor.fetchall()])
+    
+    def __len__(self) -> int:
+        return len(self.bill_ids)
+    
+    def find(self, payment_date_str: str) -> Optional[int]:
+        """Bill ID for a payment date, or None if the date is unparseable or there are no bills"""
+        payment_date = parse_date_for_comparison(payment_date_str)
+        if not payment_date or not self.bill_ids:
+            return None
+        # Last bill with cycle_date <= payment_date (later bill wins on same-day ties)
+        position = bisect.bisect_right(self.cycle_dates, payment_date) - 1
+        return self.bill_ids[max(position, 0)]
+
+def find_bill_for_payment(payment_date_str: str, bills: List[Dict[str, Any]]) -> Optional[int]:
+    """
+    Find the appropriate bill for a payment based on payment date.
+    One-off helper; build a BillIntervalIndex when looking up many payments.
+    """
+    return BillIntervalIndex(bills).find(payment_date_str)
+
+def reassign_payment_bills(payment_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+    """
+    Re-bucket non-manual payments into bills by payment date, in a single pass.
+    payment_ids=None re-buckets every payment. Payment hashes follow the new bill so
+    the next scrape recognises them; a move that would collide with an existing
+    payment's hash is skipped.
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        bill_index = BillIntervalIndex.from_cursor(cursor)
         
-        # Check if before next bill (or no next bill)
-        if i + 1 < len(sorted_bills):
-            is_before_next = payment_date < sorted_bills[i + 1]['cycle_date']
-        else:
-            is_before_next = True  # No next bill, so this is the latest
+        cursor.execute('SELECT id, bill_cycle_date FROM bills')
+        bill_cycles = {row['id']: row['bill_cycle_date'] for row in cursor.fetchall()}
         
-        if is_after_bill and is_before_next:
-            return bill['bill_id']
-    
-    # If payment is before all bills, assign to the oldest bill
-    return sorted_bills[0]['bill_id']
+        where, params = 'bill_manually_set = 0', ()
+        if payment_ids is not None:
+            if not payment_ids:
+                return {'checked': 0, 'reassigned': 0, 'conflicts': 0}
+            where += f' AND id IN ({",".join("?" * len(payment_ids))})'
+            params = tuple(payment_ids)
+        cursor.execute(f'SELECT id, bill_id, payment_date, amount, description, payment_hash FROM payments WHERE {where}', params)
+        payments = cursor.fetchall()
+        
+        cursor.execute('SELECT payment_hash FROM payments WHERE payment_hash IS NOT NULL')
+        known_hashes = {row['payment_hash'] for row in cursor.fetchall()}
+        
+        updates = []
+        affected_bill_ids = []
+        conflicts = 0
+        for payment in payments:
+            new_bill_id = bill_index.find(payment['payment_date'])
+            if new_bill_id is None or new_bill_id == payment['bill_id']:
+                continue
+            payment_hash = generate_payment_hash(payment['payment_date'], payment['amount'] or '',
+                                                 payment['description'] or '', bill_cycles.get(new_bill_id, ''))
+            if payment_hash != payment['payment_hash'] and payment_hash in known_hashes:
+                conflicts += 1
+                continue
+            known_hashes.discard(payment['payment_hash'])
+            known_hashes.add(payment_hash)
+            updates.append((new_bill_id, payment_hash, payment['id']))
+            affected_bill_ids += [payment['bill_id'], new_bill_id]
+        
+        cursor.executemany('UPDATE payments SET bill_id = ?, payment_hash = ? WHERE id = ?', updates)
+        _refresh_payee_balances(cursor, affected_bill_ids)
+        
+        return {'checked': len(payments), 'reassigned': len(updates), 'conflicts': conflicts}
 
 def sync_from_scrape(scrape_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Sync scraped data to normalized tables, returns stats"""
+    """
+    Sync scraped data to normalized tables, returns stats.
+    
+    Runs as one transaction: existing bill and payment keys are prefetched,
+    inserts/updates are worked out in memory and applied with executemany.
+    A failure part-way through rolls back the whole sync - including when it
+    runs nested inside save_scraped_data's transaction, where it is a savepoint
+    (see check_sync_atomic.py).
+    """
     stats = {
         'bills_added': 0,
         'bills_updated': 0,
@@ -1307,56 +1540,126 @@ def sync_from_scrape(scrape_data: Dict[str, Any]) -> Dict[str, Any]:
         'balance_changed': False
     }
     
-    # Sync account balance
-    if 'account_balance' in scrape_data:
-        stats['balance_changed'] = record_account_balance(scrape_data['account_balance'])
-    
     # Sync bill history
     bill_history = scrape_data.get('bill_history', {})
     ledger = bill_history.get('ledger', [])
+    bill_items = [item for item in ledger if item.get('type') == 'bill']
+    payment_items = [item for item in ledger if item.get('type') == 'payment']
+    now = utc_now_iso()
     
-    # First pass: collect all bills
-    bills_info = []
-    for item in ledger:
-        if item.get('type') == 'bill':
-            bill_id = upsert_bill(item)
-            bills_info.append({
-                'bill_id': bill_id,
-                'bill_cycle_date': item.get('bill_cycle_date', '')
-            })
-    
-    # Second pass: process all payments
-    payment_order = 0
-    for item in ledger:
-        if item.get('type') == 'payment':
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        
+        # Sync account balance
+        if 'account_balance' in scrape_data:
+            stats['balance_changed'] = record_account_balance(scrape_data['account_balance'])
+        
+        # ---- Bills ----
+        cursor.execute('SELECT id, bill_cycle_date, month_range, bill_total FROM bills')
+        known_bills = {(row['bill_cycle_date'], row['month_range']): row['bill_total'] for row in cursor.fetchall()}
+        
+        bill_inserts = []
+        bill_updates = []
+        changed_bill_keys = []  # New bills or changed totals, for the balance refresh
+        for item in bill_items:
+            bill_cycle_date = item.get('bill_cycle_date', '')
+            month_range = item.get('month_range', '')
+            bill_date = item.get('bill_date', '')
+            bill_total = item.get('bill_total', '')
+            amount_numeric = parse_amount(bill_total)
+            key = (bill_cycle_date, month_range)
+            if key in known_bills:
+                bill_updates.append((now, bill_date, bill_total, amount_numeric, bill_cycle_date, month_range))
+                if known_bills[key] != bill_total:
+                    changed_bill_keys.append(key)
+            else:
+                known_bills[key] = bill_total
+                changed_bill_keys.append(key)
+                bill_inserts.append((bill_cycle_date, parse_us_date_to_sortable(bill_cycle_date), bill_date,
+                                     month_range, bill_total, amount_numeric, now, now))
+        
+        cursor.executemany('''
+            INSERT INTO bills (bill_cycle_date, bill_cycle_iso, bill_date, month_range, bill_total, amount_numeric, first_scraped_at, last_scraped_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', bill_inserts)
+        cursor.executemany('''
+            UPDATE bills SET 
+                last_scraped_at = ?,
+                scrape_count = scrape_count + 1,
+                bill_date = COALESCE(?, bill_date),
+                bill_total = COALESCE(?, bill_total),
+                amount_numeric = COALESCE(?, amount_numeric)
+            WHERE bill_cycle_date = ? AND month_range = ?
+        ''', bill_updates)
+        stats['bills_added'] = len(bill_inserts)
+        stats['bills_updated'] = len(bill_updates)
+        
+        # Resolve IDs (including freshly inserted bills) in one query
+        cursor.execute('SELECT id, bill_cycle_date, month_range FROM bills')
+        bill_ids = {(row['bill_cycle_date'], row['month_range']): row['id'] for row in cursor.fetchall()}
+        bill_cycles = {bill_id: key[0] for key, bill_id in bill_ids.items()}
+        bill_index = BillIntervalIndex([{
+            'bill_id': bill_ids[(item.get('bill_cycle_date', ''), item.get('month_range', ''))],
+            'bill_cycle_date': item.get('bill_cycle_date', '')
+        } for item in bill_items])
+        
+        # ---- Payments ----
+        cursor.execute('SELECT id, payment_hash, bill_manually_set FROM payments WHERE payment_hash IS NOT NULL')
+        known_payments = {row['payment_hash']: row for row in cursor.fetchall()}
+        
+        pending_until = (datetime.now(timezone.utc) + timedelta(hours=2)).isoformat()
+        payment_inserts = []
+        manual_updates = []
+        hash_updates = []
+        payment_order = 0
+        for item in payment_items:
             payment_order += 1
             payment_date = item.get('bill_cycle_date', '')  # ConEd uses bill_cycle_date for payment date too
-            
-            # Check if this payment already exists and is manually set
             description = item.get('description', 'Payment Received')
             amount = item.get('amount', '')
-            payment_hash = generate_payment_hash(payment_date, amount, description, '')
-            
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT id, bill_manually_set FROM payments WHERE payment_hash = ?', (payment_hash,))
-            existing = cursor.fetchone()
-            conn.close()
             
+            # Check if this payment already exists and is manually set
+            existing = known_payments.get(generate_payment_hash(payment_date, amount, description, ''))
             if existing and existing['bill_manually_set'] == 1:
                 # Payment has manually set bill, just update scrape timestamp
-                conn = get_connection()
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE payments SET last_scraped_at = ?, scrape_count = scrape_count + 1
-                    WHERE id = ?
-                ''', (utc_now_iso(), existing['id']))
-                conn.commit()
-                conn.close()
+                manual_updates.append((now, existing['id']))
+                continue
+            
+            # Find appropriate bill based on payment date
+            assigned_bill_id = bill_index.find(payment_date)
+            bill_cycle = bill_cycles.get(assigned_bill_id, '') if assigned_bill_id else ''
+            payment_hash = generate_payment_hash(payment_date, amount, description, bill_cycle)
+            
+            if payment_hash in known_payments:
+                hash_updates.append((now, payment_hash))
             else:
-                # Find appropriate bill based on payment date
-                assigned_bill_id = find_bill_for_payment(payment_date, bills_info)
-                upsert_payment(item, bill_id=assigned_bill_id, scrape_order=payment_order)
+                # New payment with 2-hour pending window for payee auto-assignment
+                known_payments[payment_hash] = {'id': None, 'bill_manually_set': 0}
+                payment_inserts.append((
+                    assigned_bill_id, payment_date, parse_us_date_to_sortable(payment_date), description, amount,
+                    parse_amount(amount), now, now, payment_order, payment_hash, pending_until
+                ))
+        
+        cursor.executemany('''
+            INSERT INTO payments (bill_id, payment_date, payment_date_iso, description, amount, amount_numeric, 
+                                  first_scraped_at, last_scraped_at, scrape_order, payment_hash,
+                                  payee_status, payee_pending_until)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'pending', ?)
+        ''', payment_inserts)
+        cursor.executemany('''
+            UPDATE payments SET last_scraped_at = ?, scrape_count = scrape_count + 1
+            WHERE id = ?
+        ''', manual_updates)
+        cursor.executemany('''
+            UPDATE payments SET last_scraped_at = ?, scrape_count = scrape_count + 1
+            WHERE payment_hash = ?
+        ''', hash_updates)
+        stats['payments_added'] = len(payment_inserts)
+        stats['payments_updated'] = len(manual_updates) + len(hash_updates)
+        
+        # Timestamp-only updates don't move balances; refresh from the earliest changed bill
+        affected_bill_ids = [bill_ids[key] for key in changed_bill_keys] + [row[0] for row in payment_inserts]
+        _refresh_payee_balances(cursor, affected_bill_ids)
     
     return stats
 
@@ -1364,269 +1667,530 @@ def sync_from_scrape(scrape_data: Dict[str, Any]) -> Dict[str, Any]:
 # LEDGER VIEW (for AccountLedger component)
 # ==========================================
 
+LEDGER_BILL_LIMIT = 50
+
 def get_ledger_data() -> Dict[str, Any]:
-    """Get complete ledger data for the frontend"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    """Get complete ledger data for the frontend (constant number of queries)"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    # Get current balance
-    balance = get_current_balance()
+        # Get current balance
+        balance = get_current_balance()
     
-    # Get all bills (will sort in Python to handle variable date formats like M/D/YYYY)
-    cursor.execute('SELECT * FROM bills LIMIT 50')
-    bills = [dict(row) for row in cursor.fetchall()]
+        # Newest bills first
+        cursor.execute(f'SELECT * FROM bills ORDER BY {BILLS_NEWEST_FIRST} LIMIT ?', (LEDGER_BILL_LIMIT,))
+        bills = [dict(row) for row in cursor.fetchall()]
     
-    # Sort bills by date (newest first)
-    bills = sort_bills_by_date(bills, desc=True)
+        cursor.execute('SELECT bill_id FROM bill_documents')
+        bills_with_pdf = {row['bill_id'] for row in cursor.fetchall()}
     
-    cursor.execute('SELECT bill_id FROM bill_documents')
-    bills_with_pdf = {row['bill_id'] for row in cursor.fetchall()}
+        payments_by_bill = _get_payments_grouped_by_bill(cursor, [bill['id'] for bill in bills])
+        for bill in bills:
+            bill['pdf_exists'] = bill['id'] in bills_with_pdf
+            bill['payments'] = payments_by_bill.get(bill['id'], [])
     
-    for bill in bills:
-        bill['pdf_exists'] = bill['id'] in bills_with_pdf
+        # Get orphan payments (no bill assigned) and add them to a special section
         cursor.execute('''
             SELECT p.*, u.name as payee_name FROM payments p
             LEFT JOIN payee_users u ON p.payee_user_id = u.id
-            WHERE p.bill_id = ?
+            WHERE p.bill_id IS NULL
             ORDER BY 
-                CASE WHEN p.manual_order IS NOT NULL THEN 1 ELSE 0 END,
-                p.payment_date DESC, 
-                p.first_scraped_at DESC,
-                p.manual_order ASC
-        ''', (bill['id'],))
-        bill['payments'] = [dict(row) for row in cursor.fetchall()]
-    
-    # Get orphan payments (no bill assigned) and add them to a special section
-    cursor.execute('''
-        SELECT p.*, u.name as payee_name FROM payments p
-        LEFT JOIN payee_users u ON p.payee_user_id = u.id
-        WHERE p.bill_id IS NULL
-        ORDER BY 
-            CASE WHEN p.manual_order IS NOT NULL THEN 0 ELSE 1 END,
-            p.manual_order ASC,
-            p.payment_date DESC, 
-            p.first_scraped_at ASC
-    ''')
-    orphan_payments = [dict(row) for row in cursor.fetchall()]
-    
-    # Get latest payment overall
-    latest_payment = get_latest_payment()
-    
-    # Get latest bill
-    latest_bill = bills[0] if bills else None
+                CASE WHEN p.manual_order IS NOT NULL THEN 0 ELSE 1 END,
+                p.manual_order ASC,
+                p.payment_date_iso DESC, 
+                p.first_scraped_at ASC
+        ''')
+        orphan_payments = [dict(row) for row in cursor.fetchall()]
+    
+        # Get latest bill
+        latest_bill = bills[0] if bills else None
+    
+        # Latest payment overall: first payment of the most recent bill (same rule as get_latest_payment)
+        latest_payment = None
+        if latest_bill and latest_bill['payments']:
+            latest_payment = dict(latest_bill['payments'][0],
+                                  bill_month=latest_bill['month_range'],
+                                  bill_cycle=latest_bill['bill_cycle_date'])
+        else:
+            payments = get_all_payments(limit=1)
+            latest_payment = payments[0] if payments else None
     
-    conn.close()
     
-    return {
-        'account_balance': balance['balance'] if balance else None,
-        'balance_updated_at': balance['scraped_at'] if balance else None,
-        'latest_payment': latest_payment,
-        'latest_bill': latest_bill,
-        'bills': bills,
-        'orphan_payments': orphan_payments
-    }
+        return {
+            'account_balance': balance['balance'] if balance else None,
+            'balance_updated_at': balance['scraped_at'] if balance else None,
+            'latest_payment': latest_payment,
+            'latest_bill': latest_bill,
+            'bills': bills,
+            'orphan_payments': orphan_payments
+        }
 
 # ==========================================
 # LEGACY FUNCTIONS (keep for backward compat)
 # ==========================================
 
-def save_scraped_data(data: Dict[str, Any], status: str = "success", error_message: Optional[str] = None, screenshot_path: Optional[str] = None):
-    """Save scraped data to database. Also syncs to normalized tables."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    timestamp = utc_now_iso()
-    
-    # Insert new data
-    cursor.execute('''
-        INSERT INTO scraped_data (timestamp, data, status, error_message, screenshot_path)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (timestamp, json.dumps(data), status, error_message, screenshot_path))
+def _store_snapshot(cursor: sqlite3.Cursor, data: Dict[str, Any], status: str) -> str:
+    """
+    Store data as a snapshot blob and return its content hash.
+    Identical content is stored once. Otherwise the new blob is a delta against the
+    keyframe of the latest same-status scrape when that compresses smaller, else a
+    new full keyframe (so error payloads never become the base for successes).
+    """
+    canonical = snapshots.canonical_json(data)
+    snapshot_hash = snapshots.content_hash(canonical)
+    cursor.execute('SELECT 1 FROM snapshot_blobs WHERE hash = ?', (snapshot_hash,))
+    if cursor.fetchone():
+        return snapshot_hash
     
-    # Keep only latest 2 entries
+    kind, base_hash, payload = 'full', None, snapshots.compress(data)
     cursor.execute('''
-        DELETE FROM scraped_data
-        WHERE id NOT IN (
-            SELECT id FROM scraped_data
-            ORDER BY timestamp DESC
-            LIMIT 2
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-    
-    # Sync to normalized tables
-    if status == "success":
-        try:
-            sync_from_scrape(data)
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.warning(f"Failed to sync to normalized tables: {e}")
-        
-        # Publish sensors to MQTT
-        try:
-            from sensor_publisher import publish_sensors
-            publish_sensors(data, timestamp)
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.warning(f"Failed to publish sensors: {e}")
-
-def get_latest_scraped_data(limit: int = 1) -> List[Dict[str, Any]]:
-    """Get latest scraped data"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+        SELECT b.kind, b.hash, b.base_hash FROM scraped_data s
+        JOIN snapshot_blobs b ON b.hash = s.snapshot_hash
+        WHERE s.status = ?
+        ORDER BY s.timestamp DESC, s.id DESC LIMIT 1
+    ''', (status,))
+    previous = cursor.fetchone()
+    if previous:
+        keyframe_hash = previous['hash'] if previous['kind'] == 'full' else previous['base_hash']
+        keyframe = _load_snapshot(cursor, keyframe_hash)
+        if isinstance(keyframe, dict) and isinstance(data, dict):
+            delta_payload = snapshots.compress(snapshots.diff(keyframe, data))
+            if len(delta_payload) < len(payload):
+                kind, base_hash, payload = 'delta', keyframe_hash, delta_payload
     
     cursor.execute('''
-        SELECT * FROM scraped_data
-        ORDER BY timestamp DESC
-        LIMIT ?
-    ''', (limit,))
-    
-    rows = cursor.fetchall()
-    conn.close()
-    
+        INSERT INTO snapshot_blobs (hash, kind, base_hash, codec, payload, raw_size, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (snapshot_hash, kind, base_hash, snapshots.CODEC, payload, len(canonical), utc_now_iso()))
+    return snapshot_hash
+
+def _load_snapshot(cursor: sqlite3.Cursor, snapshot_hash: str, cache: Optional[Dict[str, Any]] = None) -> Any:
+    """Rebuild a snapshot from its blob (applying its delta to the keyframe if needed)"""
+    if cache is not None and snapshot_hash in cache:
+        return cache[snapshot_hash]
+    cursor.execute('SELECT kind, base_hash, codec, payload FROM snapshot_blobs WHERE hash = ?', (snapshot_hash,))
+    blob = cursor.fetchone()
+    if blob is None:
+        raise KeyError(f"Snapshot blob {snapshot_hash} is missing")
+    data = snapshots.decompress(blob['payload'], blob['codec'])
+    if blob['kind'] == 'delta':
+        data = snapshots.apply(_load_snapshot(cursor, blob['base_hash'], cache), data)
+    if cache is not None:
+        cache[snapshot_hash] = data
+    return data
+
+def _decode_scraped_rows(cursor: sqlite3.Cursor, rows: List[sqlite3.Row]) -> List[Dict[str, Any]]:
+    """scraped_data rows -> API dicts; legacy rows carry their JSON inline"""
+    cache: Dict[str, Any] = {}
     result = []
     for row in rows:
-        screenshot_path = None
-        try:
-            if "screenshot_path" in row.keys():
-                screenshot_path = row["screenshot_path"]
-        except (KeyError, AttributeError):
-            pass
-        
+        if row['snapshot_hash']:
+            data = _load_snapshot(cursor, row['snapshot_hash'], cache)
+        else:
+            data = json.loads(row['data'])
         result.append({
             "id": row["id"],
             "timestamp": row["timestamp"],
-            "data": json.loads(row["data"]),
+            "data": data,
             "status": row["status"],
             "error_message": row["error_message"],
-            "screenshot_path": screenshot_path
+            "screenshot_path": row["screenshot_path"]
         })
-    
     return result
 
+# Write-through cache of the newest decoded scrapes (newest first) plus their
+# serialized API payloads, so polling and change detection skip decode/encode.
+SCRAPE_CACHE_SIZE = 5
+
+_scrape_cache_lock = threading.Lock()
+_scrape_cache: Optional[List[Dict[str, Any]]] = None
+_scrape_cache_complete = False   # True when no rows exist beyond the cached ones
+_scrape_cache_generation = 0     # Bumped on every write so in-flight loads don't repopulate stale data
+_scrape_json_cache: Dict[tuple, tuple] = {}  # (kind, limit) -> (etag, bytes)
+
+def _invalidate_scrape_cache():
+    global _scrape_cache, _scrape_cache_complete, _scrape_cache_generation
+    with _scrape_cache_lock:
+        _scrape_cache = None
+        _scrape_cache_complete = False
+        _scrape_cache_generation += 1
+        _scrape_json_cache.clear()
+
+def _push_scrape_cache(entry: Dict[str, Any]):
+    """Write-through for a newly saved scrape"""
+    global _scrape_cache, _scrape_cache_complete, _scrape_cache_generation
+    with _scrape_cache_lock:
+        _scrape_cache_generation += 1
+        _scrape_json_cache.clear()
+        if _scrape_cache is None:
+            return
+        rows = [entry] + _scrape_cache
+        _scrape_cache_complete = _scrape_cache_complete and len(rows) <= SCRAPE_CACHE_SIZE
+        _scrape_cache = rows[:SCRAPE_CACHE_SIZE]
+
+def save_scraped_data(data: Dict[str, Any], status: str = "success", error_message: Optional[str] = None, screenshot_path: Optional[str] = None):
+    """Save scraped data as a compressed snapshot. Also syncs to normalized tables."""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+    
+        timestamp = utc_now_iso()
+        snapshot_hash = _store_snapshot(cursor, data, status)
+    
+        cursor.execute('''
+            INSERT INTO scraped_data (timestamp, data, status, error_message, screenshot_path, snapshot_hash)
+            VALUES (?, '', ?, ?, ?, ?)
+        ''', (timestamp, status, error_message, screenshot_path, snapshot_hash))
+        scrape_id = cursor.lastrowid
+        # Old snapshots are trimmed by apply_retention() (see retention.py)
+    
+        # Sync to normalized tables
+        if status == "success":
+            try:
+                sync_from_scrape(data)
+            except Exception as e:
+                import logging
+                logger = logging.getLogger(__name__)
+                logger.warning(f"Failed to sync to normalized tables: {e}")
+        
+            # Publish sensors to MQTT
+            try:
+                from sensor_publisher import publish_sensors
+                publish_sensors(data, timestamp)
+            except Exception as e:
+                import logging
+                logger = logging.getLogger(__name__)
+                logger.warning(f"Failed to publish sensors: {e}")
+    
+    # Committed - write through to the read cache
+    _push_scrape_cache({
+        "id": scrape_id,
+        "timestamp": timestamp,
+        "data": copy.deepcopy(data),  # Caller keeps using its dict
+        "status": status,
+        "error_message": error_message,
+        "screenshot_path": screenshot_path
+    })
+
+def get_latest_scraped_data(limit: int = 1) -> List[Dict[str, Any]]:
+    """Get latest scraped data"""
+    return get_all_scraped_data(limit)
+
 def get_all_scraped_data(limit: int = 100) -> List[Dict[str, Any]]:
-    """Get all scraped data"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    """
+    Get all scraped data (newest first).
+    The newest SCRAPE_CACHE_SIZE entries come from the cache and are shared - treat as read-only.
+    """
+    global _scrape_cache, _scrape_cache_complete
+    with _scrape_cache_lock:
+        cached, complete, generation = _scrape_cache, _scrape_cache_complete, _scrape_cache_generation
+    if cached is not None and (limit <= len(cached) or complete):
+        return cached[:limit]
     
-    cursor.execute('''
-        SELECT * FROM scraped_data
-        ORDER BY timestamp DESC
-        LIMIT ?
-    ''', (limit,))
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    rows = cursor.fetchall()
-    conn.close()
+        cursor.execute('''
+            SELECT * FROM scraped_data
+            ORDER BY timestamp DESC
+            LIMIT ?
+        ''', (max(limit, SCRAPE_CACHE_SIZE),))
     
-    result = []
-    for row in rows:
-        screenshot_path = None
-        try:
-            if "screenshot_path" in row.keys():
-                screenshot_path = row["screenshot_path"]
-        except (KeyError, AttributeError):
-            pass
-        
-        result.append({
-            "id": row["id"],
-            "timestamp": row["timestamp"],
-            "data": json.loads(row["data"]),
-            "status": row["status"],
-            "error_message": row["error_message"],
-            "screenshot_path": screenshot_path
-        })
+        rows = _decode_scraped_rows(cursor, cursor.fetchall())
     
+    with _scrape_cache_lock:
+        if generation == _scrape_cache_generation:
+            _scrape_cache = rows[:SCRAPE_CACHE_SIZE]
+            _scrape_cache_complete = len(rows) < max(limit, SCRAPE_CACHE_SIZE)
+    return rows[:limit]
+
+def _scraped_data_payload(latest_only: bool, limit: int) -> Dict[str, Any]:
+    if latest_only:
+        rows = get_all_scraped_data(1)
+        return {"data": rows[0] if rows else None}
+    return {"data": get_all_scraped_data(limit)}
+
+def peek_scraped_data_json(latest_only: bool = False, limit: int = 100) -> Optional[tuple]:
+    """Cached (etag, JSON bytes) for the scraped-data endpoints, or None (no DB access)"""
+    with _scrape_cache_lock:
+        return _scrape_json_cache.get((latest_only, limit))
+
+def get_scraped_data_json(latest_only: bool = False, limit: int = 100) -> tuple:
+    """
+    (etag, JSON bytes) of {"data": ...} as served by /api/scraped-data[/latest].
+    Serialized once per write; the ETag is a hash of the bytes.
+    """
+    key = (latest_only, limit)
+    with _scrape_cache_lock:
+        cached = _scrape_json_cache.get(key)
+        generation = _scrape_cache_generation
+    if cached is not None:
+        return cached
+    body = json.dumps(_scraped_data_payload(latest_only, limit)).encode()
+    result = (f'"{hashlib.sha1(body).hexdigest()}"', body)
+    with _scrape_cache_lock:
+        if generation == _scrape_cache_generation:
+            # Small keyed set: latest + the few limits the UI asks for
+            if len(_scrape_json_cache) >= 8:
+                _scrape_json_cache.clear()
+            _scrape_json_cache[key] = result
     return result
 
+def get_scraped_data_by_id(scrape_id: int) -> Optional[Dict[str, Any]]:
+    """Reconstruct one historical scrape"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM scraped_data WHERE id = ?', (scrape_id,))
+        rows = _decode_scraped_rows(cursor, cursor.fetchall())
+        return rows[0] if rows else None
+
+def get_scraped_data_history(limit: int = 100) -> List[Dict[str, Any]]:
+    """List stored scrapes (metadata and storage sizes only, nothing decoded)"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT s.id, s.timestamp, s.status, s.error_message, s.snapshot_hash,
+                   b.kind, b.raw_size, LENGTH(COALESCE(b.payload, s.data)) as stored_size
+            FROM scraped_data s
+            LEFT JOIN snapshot_blobs b ON b.hash = s.snapshot_hash
+            ORDER BY s.timestamp DESC
+            LIMIT ?
+        ''', (limit,))
+        return [dict(row) for row in cursor.fetchall()]
+
+# ==========================================
+# LOGS (buffered)
+# ==========================================
+#
+# Log lines are held in memory and written in batches with executemany, so a
+# scrape's dozens of log calls cost a handful of commits instead of one each.
+# async_database adds a time-based flush; get_logs() flushes before reading.
+
+LOG_FLUSH_MAX_ENTRIES = 50   # Flush as soon as this many entries are buffered
+LOG_FLUSH_INTERVAL = 2.0     # Seconds an entry may wait (enforced by async_database)
+
+_log_buffer: List[tuple] = []
+_log_buffer_lock = threading.Lock()
+
+def buffer_log(level: str, message: str) -> int:
+    """Queue a log entry in memory (timestamped now), returns the buffered count"""
+    with _log_buffer_lock:
+        _log_buffer.append((utc_now_iso(), level, message))
+        return len(_log_buffer)
+
+def flush_logs() -> int:
+    """Write all buffered log entries in one transaction, returns how many were written"""
+    with _log_buffer_lock:
+        if not _log_buffer:
+            return 0
+        entries = _log_buffer[:]
+        _log_buffer.clear()
+    try:
+        with db_connection() as conn:
+            conn.executemany('INSERT INTO logs (timestamp, level, message) VALUES (?, ?, ?)', entries)
+    except Exception:
+        # Put them back (ahead of newer entries) so a later flush can retry
+        with _log_buffer_lock:
+            _log_buffer[:0] = entries
+        raise
+    return len(entries)
+
 def add_log(level: str, message: str):
-    """Add log entry"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT INTO logs (timestamp, level, message)
-        VALUES (?, ?, ?)
-    ''', (utc_now_iso(), level, message))
-    
-    conn.commit()
-    conn.close()
+    """Add log entry (buffered; flushed once LOG_FLUSH_MAX_ENTRIES are waiting)"""
+    if buffer_log(level, message) >= LOG_FLUSH_MAX_ENTRIES:
+        flush_logs()
 
 def get_logs(limit: int = 100) -> List[Dict[str, Any]]:
-    """Get log entries"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    """Get log entries (including ones still buffered)"""
+    flush_logs()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT * FROM logs
-        ORDER BY timestamp DESC
-        LIMIT ?
-    ''', (limit,))
+        cursor.execute('''
+            SELECT * FROM logs
+            ORDER BY timestamp DESC
+            LIMIT ?
+        ''', (limit,))
     
-    rows = cursor.fetchall()
-    conn.close()
+        rows = cursor.fetchall()
     
-    return [{"id": row["id"], "timestamp": row["timestamp"], "level": row["level"], "message": row["message"]} for row in rows]
+        return [{"id": row["id"], "timestamp": row["timestamp"], "level": row["level"], "message": row["message"]} for row in rows]
 
 def clear_logs():
-    """Clear all log entries"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM logs')
-    conn.commit()
-    conn.close()
+    """Clear all log entries (buffered ones too)"""
+    with _log_buffer_lock:
+        _log_buffer.clear()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM logs')
 
 def add_scrape_history(success: bool, error_message: Optional[str] = None, failure_step: Optional[str] = None, duration_seconds: Optional[float] = None):
     """Add scrape history entry"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('''
-        INSERT INTO scrape_history (timestamp, success, error_message, failure_step, duration_seconds)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (utc_now_iso(), 1 if success else 0, error_message, failure_step, duration_seconds))
-    
-    cursor.execute('''
-        DELETE FROM scrape_history
-        WHERE id NOT IN (
-            SELECT id FROM scrape_history
-            ORDER BY timestamp DESC
-            LIMIT 100
-        )
-    ''')
+        cursor.execute('''
+            INSERT INTO scrape_history (timestamp, success, error_message, failure_step, duration_seconds)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (utc_now_iso(), 1 if success else 0, error_message, failure_step, duration_seconds))
     
-    conn.commit()
-    conn.close()
 
 def get_scrape_history(limit: int = 50) -> List[Dict[str, Any]]:
     """Get scrape history entries"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT * FROM scrape_history
-        ORDER BY timestamp DESC
-        LIMIT ?
-    ''', (limit,))
-    
-    rows = cursor.fetchall()
-    conn.close()
-    
-    return [{
-        "id": row["id"],
-        "timestamp": row["timestamp"],
-        "success": bool(row["success"]),
-        "error_message": row["error_message"],
-        "failure_step": row["failure_step"],
-        "duration_seconds": row["duration_seconds"]
-    } for row in rows]
+        cursor.execute('''
+            SELECT * FROM scrape_history
+            ORDER BY timestamp DESC
+            LIMIT ?
+        ''', (limit,))
+    
+        rows = cursor.fetchall()
+    
+        return [{
+            "id": row["id"],
+            "timestamp": row["timestamp"],
+            "success": bool(row["success"]),
+            "error_message": row["error_message"],
+            "failure_step": row["failure_step"],
+            "duration_seconds": row["duration_seconds"]
+        } for row in rows]
+
+# ==========================================
+# MQTT OUTBOX
+# ==========================================
+
+def enqueue_mqtt_messages(entries: List[Dict[str, Any]], max_rows: int) -> Dict[str, int]:
+    """
+    Queue MQTT publishes until the broker is reachable again.
+    
+    entries: {state_key, fingerprint, messages: [[topic, payload, retain]], qos, retain}.
+    A retained entry supersedes any queued entry with the same state_key. The
+    oldest rows beyond max_rows are dropped. Returns {'depth', 'dropped'}.
+    """
+    now = utc_now_iso()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        for entry in entries:
+            if entry['retain']:
+                cursor.execute('DELETE FROM mqtt_outbox WHERE state_key = ? AND retain = 1', (entry['state_key'],))
+            cursor.execute('''
+                INSERT INTO mqtt_outbox (state_key, fingerprint, messages, qos, retain, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (entry['state_key'], entry.get('fingerprint'), json.dumps(entry['messages']),
+                  entry['qos'], 1 if entry['retain'] else 0, now))
+        cursor.execute('''
+            DELETE FROM mqtt_outbox WHERE id NOT IN (
+                SELECT id FROM mqtt_outbox ORDER BY id DESC LIMIT ?
+            )
+        ''', (max(max_rows, 1),))
+        dropped = cursor.rowcount
+        cursor.execute('SELECT COUNT(*) FROM mqtt_outbox')
+        return {'depth': cursor.fetchone()[0], 'dropped': dropped}
+
+def get_mqtt_outbox(limit: int = 50) -> List[Dict[str, Any]]:
+    """Oldest queued MQTT entries first"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM mqtt_outbox ORDER BY id LIMIT ?', (limit,))
+        return [{
+            'id': row['id'],
+            'state_key': row['state_key'],
+            'fingerprint': row['fingerprint'],
+            'messages': json.loads(row['messages']),
+            'qos': row['qos'],
+            'retain': bool(row['retain']),
+            'created_at': row['created_at'],
+        } for row in cursor.fetchall()]
+
+def delete_mqtt_outbox(ids: List[int]) -> int:
+    """Remove delivered entries; returns the remaining queue depth"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany('DELETE FROM mqtt_outbox WHERE id = ?', [(i,) for i in ids])
+        cursor.execute('SELECT COUNT(*) FROM mqtt_outbox')
+        return cursor.fetchone()[0]
+
+def get_mqtt_outbox_stats() -> Dict[str, Any]:
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*), MIN(created_at) FROM mqtt_outbox')
+        depth, oldest = cursor.fetchone()
+        return {'depth': depth, 'oldest_queued_at': oldest}
+
+# ==========================================
+# RETENTION / COMPACTION
+# ==========================================
+
+# Tables apply_retention() may trim, and the ISO timestamp column that ages them
+RETENTION_TABLES = {
+    'logs': 'timestamp',
+    'scrape_history': 'timestamp',
+    'account_balance_history': 'scraped_at',
+    'scraped_data': 'timestamp',
+}
+
+def apply_retention(rules: Dict[str, Dict[str, Any]], vacuum_pages: int = 0) -> Dict[str, Any]:
+    """
+    Trim history tables and return freed pages to the filesystem.
+    
+    rules: {table: {'max_rows': int|None, 'max_age_days': float|None}} for RETENTION_TABLES;
+    None/0 disables a limit. vacuum_pages caps the incremental vacuum (0 = all free pages).
+    Returns rows deleted per table and bytes reclaimed from the database file.
+    """
+    deleted = {}
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        page_size = cursor.execute('PRAGMA page_size').fetchone()[0]
+        pages_before = cursor.execute('PRAGMA page_count').fetchone()[0]
+        
+        for table, rule in rules.items():
+            column = RETENTION_TABLES.get(table)
+            if column is None:
+                continue
+            count = 0
+            max_age_days = rule.get('max_age_days')
+            if max_age_days:
+                cutoff = (datetime.now(timezone.utc) - timedelta(days=max_age_days)).isoformat()
+                cursor.execute(f'DELETE FROM {table} WHERE {column} < ?', (cutoff,))
+                count += cursor.rowcount
+            max_rows = rule.get('max_rows')
+            if max_rows:
+                cursor.execute(f'''
+                    DELETE FROM {table} WHERE id NOT IN (
+                        SELECT id FROM {table} ORDER BY {column} DESC LIMIT ?
+                    )
+                ''', (int(max_rows),))
+                count += cursor.rowcount
+            deleted[table] = count
+        
+        # Snapshot blobs no scrape refers to, directly or as a delta's keyframe
+        cursor.execute('''
+            DELETE FROM snapshot_blobs
+            WHERE hash NOT IN (SELECT snapshot_hash FROM scraped_data WHERE snapshot_hash IS NOT NULL)
+            AND hash NOT IN (
+                SELECT b.base_hash FROM snapshot_blobs b
+                JOIN scraped_data s ON s.snapshot_hash = b.hash
+                WHERE b.base_hash IS NOT NULL
+            )
+        ''')
+        deleted['snapshot_blobs'] = cursor.rowcount
+    
+    if deleted.get('scraped_data'):
+        _invalidate_scrape_cache()
+    # Outside the delete transaction: incremental_vacuum and checkpoint need it committed.
+    # executescript steps the pragma to completion (execute() frees a single page).
+    conn.executescript(f'PRAGMA incremental_vacuum({int(vacuum_pages)});' if vacuum_pages else 'PRAGMA incremental_vacuum;')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+    pages_after = conn.execute('PRAGMA page_count').fetchone()[0]
+    free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    
+    return {
+        'rows_deleted': deleted,
+        'bytes_reclaimed': max(pages_before - pages_after, 0) * page_size,
+        'database_bytes': pages_after * page_size,
+        'free_bytes': free_pages * page_size,
+    }
 
 # Initialize database on import
 init_database()
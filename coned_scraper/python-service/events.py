@@ -0,0 +1,121 @@
+"""
+In-process event bus for the post-scrape pipeline.
+Subscribers (MQTT, TTS, IMAP, auto-assign) run concurrently with bounded
+parallelism and a per-subscriber timeout, so one slow consumer doesn't hold
+up the others. Each call is timed and the totals are kept for /api/events/stats.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Type
+
+logger = logging.getLogger(__name__)
+
+
+class Event:
+    """Base class; subscribers register for a concrete subclass"""
+
+    def __init__(self, timestamp: Optional[str] = None):
+        self.timestamp = timestamp
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.__dict__})"
+
+
+class ScrapeCompleted(Event):
+    """A scrape finished (successfully or not); data is the scraped payload"""
+
+    def __init__(self, data: Dict[str, Any], success: bool, source: str, timestamp: Optional[str] = None):
+        super().__init__(timestamp)
+        self.data = data
+        self.success = success
+        self.source = source  # 'scheduled' or 'manual'
+
+
+class BalanceChanged(Event):
+    def __init__(self, old: Optional[str], new: Optional[str], timestamp: Optional[str] = None):
+        super().__init__(timestamp)
+        self.old = old
+        self.new = new
+
+
+class BillAdded(Event):
+    def __init__(self, bill: Dict[str, Any], timestamp: Optional[str] = None):
+        super().__init__(timestamp)
+        self.bill = bill
+
+
+class PaymentAdded(Event):
+    def __init__(self, payment: Dict[str, Any], balance: Optional[str] = None, timestamp: Optional[str] = None):
+        super().__init__(timestamp)
+        self.payment = payment
+        self.balance = balance  # Account balance from the same scrape
+
+
+Handler = Callable[[Event], Awaitable[None]]
+
+
+class EventBus:
+    """Typed pub/sub; publish() runs every matching subscriber concurrently and waits for all"""
+
+    def __init__(self, max_concurrency: int = 4, timeout: float = 120.0):
+        self.timeout = timeout
+        self._max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._subscribers: Dict[Type[Event], List[tuple]] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def subscribe(self, event_type: Type[Event], name: Optional[str] = None, timeout: Optional[float] = None):
+        """
+        Decorator registering an async handler for event_type.
+        timeout: seconds before the handler is cancelled (default: the bus timeout);
+        0 disables it, for handlers whose blocking work can't be cancelled anyway.
+        """
+        def register(handler: Handler) -> Handler:
+            sub_name = name or handler.__name__
+            sub_timeout = self.timeout if timeout is None else timeout
+            self._subscribers.setdefault(event_type, []).append((sub_name, handler, sub_timeout))
+            return handler
+        return register
+
+    async def _run(self, sub_name: str, handler: Handler, timeout: float, event: Event) -> Dict[str, Any]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        async with self._semaphore:
+            start = time.perf_counter()
+            error = None
+            try:
+                await asyncio.wait_for(handler(event), timeout or None)
+            except asyncio.TimeoutError:
+                error = f"timed out after {timeout:.0f}s"
+            except Exception as e:
+                error = str(e)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+        stats = self._stats.setdefault(sub_name, {"calls": 0, "failures": 0, "total_ms": 0.0, "last_ms": 0.0, "last_error": None})
+        stats["calls"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["last_ms"] = round(elapsed_ms, 1)
+        if error:
+            stats["failures"] += 1
+            stats["last_error"] = error
+            logger.warning(f"Subscriber {sub_name} failed on {type(event).__name__}: {error}")
+        return {"subscriber": sub_name, "event": type(event).__name__, "ms": round(elapsed_ms, 1), "error": error}
+
+    async def publish(self, *events: Event) -> List[Dict[str, Any]]:
+        """Deliver events to their subscribers concurrently; returns one timing record per call"""
+        calls = [self._run(sub_name, handler, timeout, event)
+                 for event in events
+                 for sub_name, handler, timeout in self._subscribers.get(type(event), [])]
+        if not calls:
+            return []
+        return list(await asyncio.gather(*calls))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-subscriber call counts, failures and timings"""
+        return {
+            sub_name: dict(s, avg_ms=round(s["total_ms"] / s["calls"], 1) if s["calls"] else 0.0, total_ms=round(s["total_ms"], 1))
+            for sub_name, s in self._stats.items()
+        }
+
+
+bus = EventBus()
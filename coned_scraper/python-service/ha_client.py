@@ -0,0 +1,194 @@
+"""
+Home Assistant REST client for the addon (Supervisor proxy).
+One pooled aiohttp session for the whole app, plus a short-lived cache of
+/api/states indexed by entity_id and domain. Concurrent callers asking for the
+same data share one in-flight request, so UI autocomplete and TTS idle polling
+are served from memory instead of each downloading the full state list.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HA_BASE = "http://supervisor/core"
+STATES_TTL = 10.0  # Full /api/states snapshot
+CONFIG_TTL = 3600.0  # /api/config (time zone, external URL) rarely changes
+REQUEST_TIMEOUT = 15
+
+
+class HAClient:
+    """Shared session + TTL-cached entity states for the Supervisor API"""
+
+    def __init__(self, base_url: str = HA_BASE, states_ttl: float = STATES_TTL):
+        self.base_url = base_url
+        self.states_ttl = states_ttl
+        self._session = None
+        self._states: Dict[str, Dict[str, Any]] = {}  # entity_id -> state object
+        self._fetched_at: Dict[str, float] = {}  # entity_id -> monotonic time
+        self._by_domain: Dict[str, List[str]] = {}
+        self._states_at = 0.0
+        self._config: Optional[Dict[str, Any]] = None
+        self._config_at = 0.0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def available(self) -> bool:
+        """Running as an addon with Supervisor access"""
+        return bool(os.environ.get("SUPERVISOR_TOKEN"))
+
+    def _get_session(self):
+        import aiohttp
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+                connector=aiohttp.TCPConnector(limit=10, keepalive_timeout=60),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def request(self, method: str, path: str, json_body: Optional[dict] = None) -> Tuple[int, Any]:
+        """Call the HA REST API. Returns (status_code, json_response); 401 without a token, 500 on errors."""
+        token = os.environ.get("SUPERVISOR_TOKEN")
+        if not token:
+            logger.warning("SUPERVISOR_TOKEN not set — not running as HA addon")
+            return 401, None
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+        kwargs = {"headers": headers}
+        if json_body is not None:
+            kwargs["json"] = json_body
+        try:
+            async with self._get_session().request(method, f"{self.base_url}{path}", **kwargs) as resp:
+                data = None
+                if resp.content_type and "json" in resp.content_type:
+                    try:
+                        data = await resp.json()
+                    except Exception:
+                        pass
+                return resp.status, data
+        except Exception as e:
+            logger.error(f"HA request {method} {path} failed: {e}")
+            return 500, None
+
+    async def _single_flight(self, key: str, fetch):
+        """Run fetch() once for all concurrent callers using the same key"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one caller giving up doesn't cancel the fetch for the others
+        return await asyncio.shield(task)
+
+    def _index(self, states: Iterable[Dict[str, Any]], fetched_at: float):
+        self._states = {}
+        self._by_domain = {}
+        for state in states:
+            if not isinstance(state, dict) or "entity_id" not in state:
+                continue
+            entity_id = state["entity_id"]
+            self._states[entity_id] = state
+            self._by_domain.setdefault(entity_id.split(".", 1)[0], []).append(entity_id)
+        for entity_ids in self._by_domain.values():
+            entity_ids.sort()
+        self._fetched_at = dict.fromkeys(self._states, fetched_at)
+        self._states_at = fetched_at
+
+    async def refresh_states(self, max_age: Optional[float] = None) -> bool:
+        """Make sure the full state snapshot is at most max_age (default: TTL) seconds old"""
+        max_age = self.states_ttl if max_age is None else max_age
+        if self._states_at and time.monotonic() - self._states_at < max_age:
+            return True
+
+        async def fetch():
+            status, data = await self.request("GET", "/api/states")
+            if status != 200 or not isinstance(data, list):
+                return False
+            self._index(data, time.monotonic())
+            return True
+
+        return await self._single_flight("/api/states", fetch)
+
+    async def entity_ids(self, *domains: str) -> List[str]:
+        """Sorted entity IDs in the given domains (e.g. 'media_player'); [] when HA is unreachable"""
+        if not await self.refresh_states():
+            return []
+        return sorted(entity_id for domain in domains for entity_id in self._by_domain.get(domain, []))
+
+    async def get_states(self, entity_ids: Iterable[str], default: Optional[str] = "unknown") -> Optional[Dict[str, Optional[str]]]:
+        """{entity_id: state} from the snapshot (missing -> default), or None when HA is unreachable"""
+        if not await self.refresh_states():
+            return None
+        return {entity_id: self._states[entity_id].get("state", "unknown") if entity_id in self._states else default
+                for entity_id in entity_ids}
+
+    async def get_state(self, entity_id: str, max_age: Optional[float] = None) -> Optional[str]:
+        """
+        State of one entity, no older than max_age seconds (default: TTL).
+        Stale entries are refreshed with a single-entity request, not the full list.
+        """
+        max_age = self.states_ttl if max_age is None else max_age
+        fetched_at = self._fetched_at.get(entity_id)
+        if fetched_at is not None and time.monotonic() - fetched_at < max_age:
+            return self._states[entity_id].get("state")
+
+        async def fetch():
+            status, data = await self.request("GET", f"/api/states/{entity_id}")
+            if status != 200 or not isinstance(data, dict):
+                return None
+            if entity_id not in self._states:
+                domain_ids = self._by_domain.setdefault(entity_id.split(".", 1)[0], [])
+                domain_ids.append(entity_id)
+                domain_ids.sort()
+            self._states[entity_id] = data
+            self._fetched_at[entity_id] = time.monotonic()
+            return data.get("state")
+
+        return await self._single_flight(f"/api/states/{entity_id}", fetch)
+
+    async def get_config(self) -> Optional[Dict[str, Any]]:
+        """/api/config (time_zone, external_url, ...), cached for an hour"""
+        if self._config is not None and time.monotonic() - self._config_at < CONFIG_TTL:
+            return self._config
+
+        async def fetch():
+            status, data = await self.request("GET", "/api/config")
+            if status != 200 or not isinstance(data, dict):
+                return None
+            self._config = data
+            self._config_at = time.monotonic()
+            return data
+
+        return await self._single_flight("/api/config", fetch)
+
+    def invalidate(self, entity_id: Optional[str] = None):
+        """Mark cached states stale (one entity, or all) after calling a service that changes them"""
+        if entity_id is None:
+            self._states_at = 0.0
+            self._fetched_at.clear()
+        else:
+            self._fetched_at.pop(entity_id, None)
+
+
+_ha_client: Optional[HAClient] = None
+
+
+def get_ha_client() -> HAClient:
+    """Application-wide HA client (created on first use)"""
+    global _ha_client
+    if _ha_client is None:
+        _ha_client = HAClient()
+    return _ha_client
+
+
+async def close_ha_client():
+    global _ha_client
+    if _ha_client is not None:
+        await _ha_client.close()
+        _ha_client = None
@@ -6,12 +6,12 @@ Waits for media player idle when configured.
 """
 import asyncio
 import logging
-import os
 from typing import Optional
 
+from ha_client import get_ha_client
+
 logger = logging.getLogger(__name__)
 
-HA_BASE = "http://supervisor/core"
 IDLE_STATES = ("idle",)  # unknown/unavailable = disconnected; only true idle is ready
 MAX_WAIT_SECONDS = 300
 POLL_INTERVAL = 2
@@ -23,40 +23,12 @@ async def _ha_request(
     json_body: Optional[dict] = None,
 ) -> tuple[int, Optional[dict]]:
     """Call Home Assistant REST API. Returns (status_code, json_response)."""
-    import aiohttp
-    token = os.environ.get("SUPERVISOR_TOKEN")
-    if not token:
-        logger.warning("SUPERVISOR_TOKEN not set — not running as HA addon")
-        return 401, None
-    url = f"{HA_BASE}{path}"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-    }
-    try:
-        async with aiohttp.ClientSession() as session:
-            kwargs = {"headers": headers}
-            if json_body is not None:
-                kwargs["json"] = json_body
-            async with session.request(method, url, **kwargs) as resp:
-                data = None
-                if resp.content_type and "json" in resp.content_type:
-                    try:
-                        data = await resp.json()
-                    except Exception:
-                        pass
-                return resp.status, data
-    except Exception as e:
-        logger.error(f"HA request failed: {e}")
-        return 500, None
-
-
-async def get_entity_state(entity_id: str) -> Optional[str]:
-    """Get current state of an entity from HA."""
-    status, data = await _ha_request("GET", f"/api/states/{entity_id}")
-    if status != 200 or not data:
-        return None
-    return data.get("state")
+    return await get_ha_client().request(method, path, json_body)
+
+
+async def get_entity_state(entity_id: str, max_age: float = POLL_INTERVAL) -> Optional[str]:
+    """Get current state of an entity from HA (cached for up to max_age seconds)."""
+    return await get_ha_client().get_state(entity_id, max_age=max_age)
 
 
 async def _wait_for_idle(media_player: str) -> bool:
@@ -125,6 +97,7 @@ async def send_tts(
             "cache": bool(cache),
         }
         status, resp = await _ha_request("POST", "/api/services/tts/speak", body)
+        get_ha_client().invalidate(entity_id)  # Player is about to leave idle
         if status in (200, 201):
             logger.info(f"TTS sent to {entity_id} via {tts_engine}")
         else:
@@ -15,6 +15,7 @@ import quopri
 import re
 import json
 import logging
+import threading
 from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Dict, Any
 from pathlib import Path
@@ -25,6 +26,9 @@ logger = logging.getLogger(__name__)
 from data_config import DATA_DIR
 IMAP_CONFIG_FILE = DATA_DIR / "imap_config.json"
 
+# One email sync at a time (post-scrape and /api/imap-config/sync share it)
+_sync_lock = threading.Lock()
+
 # STRICT: Only accept emails from this sender
 CONED_PAYMENT_SENDER = "DoNotReply@billmatrix.com"
 
@@ -516,7 +520,21 @@ def run_email_sync() -> Dict[str, Any]:
     - FROM: DoNotReply@billmatrix.com
     - SUBJECT: from config (e.g., "Con Edison Payment Processed")
     - LABEL: Gmail label from config
+    Returns without syncing if another sync is still running.
     """
+    if not _sync_lock.acquire(blocking=False):
+        logger.info("Email sync already running, skipping")
+        return {
+            'success': False,
+            'already_running': True,
+            'message': 'Email sync already running'
+        }
+    try:
+        return _run_email_sync()
+    finally:
+        _sync_lock.release()
+
+def _run_email_sync() -> Dict[str, Any]:
     config = load_imap_config()
     
     if not config.get('enabled') or not config.get('server'):
@@ -0,0 +1,242 @@
+"""
+Bill history ledger from the page's own JSON (XHR/fetch) responses.
+The bill-history page loads its ledger from ConEd's API; capturing those
+responses gives the ledger without walking the DOM. ConEd's payload shape
+isn't documented, so parse_ledger_json() is heuristic, and its output is
+only trusted once it has matched the DOM-parsed ledger exactly (same
+strings, so bills/payments keys stay stable). Until then, and on a
+periodic re-check, the DOM result is used and compared.
+"""
+import asyncio
+import json
+import logging
+import re
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from data_config import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+LEDGER_CAPTURE_STATE_FILE = DATA_DIR / "ledger_capture_state.json"
+REVERIFY_EVERY = 20  # JSON-sourced scrapes between DOM cross-checks
+LEDGER_FIELDS = ("type", "bill_cycle_date", "month_range", "bill_total", "bill_date",
+                 "description", "payment_date", "amount")
+
+
+class LedgerResponseCapture:
+    """Collects JSON bodies of coned.com XHR/fetch responses seen by a page"""
+
+    def __init__(self):
+        self.payloads: List[Tuple[str, Any]] = []
+        self.received = asyncio.Event()
+        self._reads: set = set()
+
+    def _on_response(self, response):
+        try:
+            if response.request.resource_type not in ("xhr", "fetch"):
+                return
+            host = urlsplit(response.url).hostname or ""
+            if not (host == "coned.com" or host.endswith(".coned.com")):
+                return
+            if "json" not in (response.headers.get("content-type") or ""):
+                return
+        except Exception:
+            return
+        task = asyncio.ensure_future(self._read(response))
+        self._reads.add(task)
+        task.add_done_callback(self._reads.discard)
+
+    async def _read(self, response):
+        try:
+            self.payloads.append((response.url, await response.json()))
+            self.received.set()
+        except Exception as e:
+            logger.debug(f"Unreadable JSON response {response.url[:80]}: {e}")
+
+    def attach(self, page):
+        page.on("response", self._on_response)
+
+    def detach(self, page):
+        try:
+            page.remove_listener("response", self._on_response)
+        except Exception:
+            pass
+
+    async def settle(self):
+        """Wait for bodies still being read"""
+        if self._reads:
+            await asyncio.gather(*list(self._reads), return_exceptions=True)
+
+
+# ==========================================
+# HEURISTIC JSON -> LEDGER
+# ==========================================
+
+def _walk(obj) -> Iterable[Dict[str, Any]]:
+    if isinstance(obj, dict):
+        yield obj
+        for value in obj.values():
+            yield from _walk(value)
+    elif isinstance(obj, list):
+        for value in obj:
+            yield from _walk(value)
+
+
+def _field(d: Dict[str, Any], *needles: str, exclude: Tuple[str, ...] = ()):
+    """Value of the first scalar key containing any needle (case-insensitive)"""
+    for key, value in d.items():
+        k = key.lower()
+        if isinstance(value, (dict, list)) or value in (None, ""):
+            continue
+        if any(n in k for n in needles) and not any(x in k for x in exclude):
+            return value
+    return None
+
+
+def _to_date(value) -> Optional[date]:
+    if isinstance(value, (int, float)) and value > 10**11:  # Epoch milliseconds
+        return datetime.fromtimestamp(value / 1000, tz=timezone.utc).date()
+    if not isinstance(value, str):
+        return None
+    m = re.search(r'(\d{4})-(\d{2})-(\d{2})', value)
+    if m:
+        return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    m = re.search(r'(\d{1,2})/(\d{1,2})/(\d{4})', value)
+    if m:
+        return date(int(m.group(3)), int(m.group(1)), int(m.group(2)))
+    return None
+
+
+def _to_amount(value) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        cleaned = value.replace("$", "").replace(",", "").strip()
+        try:
+            return float(cleaned)
+        except ValueError:
+            return None
+    return None
+
+
+def _fmt_date(d: Optional[date]) -> Optional[str]:
+    return f"{d.month}/{d.day}/{d.year}" if d else None
+
+
+def _fmt_amount(a: float) -> str:
+    return f"-${-a:,.2f}" if a < 0 else f"${a:,.2f}"
+
+
+def _fmt_month(d: date) -> str:
+    return d.strftime("%b %Y")
+
+
+def _ledger_entry(d: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Map one JSON object to a ledger entry, or None if it doesn't look like one"""
+    keys = " ".join(d.keys()).lower()
+    kind = str(_field(d, "type", "category", "kind") or "").lower()
+    is_payment = "payment" in kind or ("payment" in keys and "bill" not in kind)
+    is_bill = not is_payment and ("bill" in kind or "bill" in keys)
+    if not (is_payment or is_bill):
+        return None
+    cycle = _to_date(_field(d, "cycle", "billdate", "bill_date", "statementdate", "date", exclude=("due", "start", "from")))
+    if is_payment:
+        amount = _to_amount(_field(d, "amount", "total", exclude=("due", "balance")))
+        if cycle is None or amount is None:
+            return None
+        entry = {"type": "payment", "bill_cycle_date": _fmt_date(cycle)}
+        paid_on = _to_date(_field(d, "paymentdate", "payment_date", "receiveddate", "posted"))
+        entry["description"] = str(_field(d, "description", "desc") or "Payment Received")
+        if paid_on:
+            entry["payment_date"] = _fmt_date(paid_on)
+        entry["amount"] = _fmt_amount(abs(amount))
+        return entry
+    total = _to_amount(_field(d, "total", "amount", exclude=("payment", "balance")))
+    if cycle is None or total is None:
+        return None
+    entry = {"type": "bill", "bill_cycle_date": _fmt_date(cycle)}
+    start = _to_date(_field(d, "startdate", "start_date", "periodstart", "fromdate", "from_date"))
+    end = _to_date(_field(d, "enddate", "end_date", "periodend", "todate", "to_date")) or cycle
+    if start:
+        entry["month_range"] = f"{_fmt_month(start)} - {_fmt_month(end)}"
+    entry["bill_total"] = _fmt_amount(total)
+    bill_date = _to_date(_field(d, "billdate", "bill_date", "statementdate"))
+    if bill_date:
+        entry["bill_date"] = _fmt_date(bill_date)
+    return entry
+
+
+def parse_ledger_json(payloads: Iterable[Tuple[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Ledger entries (same shape as the DOM parser's) found in captured payloads; [] if none.
+    Every object in a response counts, so two identical same-day payments stay two
+    entries. A response repeating entries of an earlier one (the page refetching the
+    ledger) only adds copies beyond what the earlier response already had.
+    """
+    entries, counts = [], {}
+    for _url, payload in payloads:
+        in_payload: Dict[tuple, int] = {}
+        for obj in _walk(payload):
+            entry = _ledger_entry(obj)
+            if entry is None:
+                continue
+            key = ledger_signature([entry])[0]
+            in_payload[key] = in_payload.get(key, 0) + 1
+            if in_payload[key] > counts.get(key, 0):
+                counts[key] = in_payload[key]
+                entries.append(entry)
+    return entries
+
+
+def ledger_signature(entries: Iterable[Dict[str, Any]]) -> List[tuple]:
+    """Sorted comparable form of a ledger (every field both parsers produce)"""
+    return sorted(tuple(str(entry.get(f) or "") for f in LEDGER_FIELDS) for entry in entries)
+
+
+# ==========================================
+# TRUST STATE
+# ==========================================
+
+class LedgerCaptureState:
+    """Whether JSON parsing has been verified against the DOM, persisted across scrapes"""
+
+    def __init__(self, path=LEDGER_CAPTURE_STATE_FILE):
+        self.path = path
+        self.data = {"verified": False, "json_runs": 0, "checked_at": None, "last_mismatch": None}
+        try:
+            if self.path.exists():
+                self.data.update(json.loads(self.path.read_text()))
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable ledger capture state: {e}")
+
+    def use_json(self) -> bool:
+        """JSON is trusted and no DOM cross-check is due"""
+        return self.data["verified"] and self.data["json_runs"] < REVERIFY_EVERY
+
+    def json_used(self):
+        self.data["json_runs"] += 1
+        self._save()
+
+    def verify(self, json_ledger: List[Dict[str, Any]], dom_ledger: List[Dict[str, Any]]) -> bool:
+        """Compare both parsers' output; trust JSON from the next scrape only on an exact match"""
+        json_sig, dom_sig = ledger_signature(json_ledger), ledger_signature(dom_ledger)
+        matched = bool(dom_sig) and json_sig == dom_sig
+        self.data.update(verified=matched, json_runs=0, checked_at=datetime.now(timezone.utc).isoformat())
+        if matched:
+            self.data["last_mismatch"] = None
+        else:
+            only_json = len(set(json_sig) - set(dom_sig))
+            only_dom = len(set(dom_sig) - set(json_sig))
+            self.data["last_mismatch"] = f"{only_json} entries only in JSON, {only_dom} only in DOM"
+        self._save()
+        return matched
+
+    def _save(self):
+        try:
+            self.path.write_text(json.dumps(self.data))
+        except Exception as e:
+            logger.warning(f"Could not save ledger capture state: {e}")
@@ -1,7 +1,7 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 import pyotp
@@ -23,8 +23,8 @@ def utc_now() -> datetime:
 def utc_now_iso() -> str:
     """Get current UTC time as ISO string"""
     return datetime.now(timezone.utc).isoformat()
-from database import (
-    get_logs, get_latest_scraped_data, get_all_scraped_data, add_log, clear_logs,
+from async_database import (
+    get_logs, add_log, clear_logs,
     add_scrape_history, get_scrape_history,
     # New normalized data functions
     get_ledger_data, get_all_bills, get_bill_by_id, get_all_payments, get_latest_payment,
@@ -36,8 +36,11 @@ from database import (
     update_payee_responsibilities, get_bill_payee_summary, calculate_all_payee_balances,
     upsert_bill_document, get_bill_document, get_all_bill_documents_with_periods,
     get_latest_bill_id_with_document, delete_bill_document, migrate_legacy_pdf,
-    get_current_balance, parse_amount,
+    get_current_balance, run_db, run_db_read, shutdown as shutdown_database,
 )
+from database import parse_amount
+from change_detection import detect_ledger_changes, get_previous_successful_scrape
+from events import bus, ScrapeCompleted, BillAdded, PaymentAdded, BalanceChanged
 
 app = FastAPI(title="Con Edison API")
 
@@ -151,6 +154,195 @@ def update_last_scrape_time():
     schedule["updated_at"] = utc_now_iso()
     SCHEDULE_FILE.write_text(json.dumps(schedule))
 
+# ========== Post-scrape pipeline ==========
+# Every scrape publishes ScrapeCompleted plus one typed event per ledger change
+# (new bill, new payment, balance change). The subscribers below run
+# concurrently on the shared bus; see events.py.
+
+async def _publish_scrape_to_mqtt(scraped_data: dict, timestamp: str):
+    """Publish balance, bills, last payment and payee summary sensors as one batch"""
+    from mqtt_client import get_mqtt_client
+    mqtt_client = get_mqtt_client()
+    if not mqtt_client:
+        return
+
+    batch = []
+    if scraped_data.get("account_balance"):
+        batch.append(mqtt_client.account_balance_message(scraped_data["account_balance"], timestamp))
+
+    if scraped_data.get("bill_history"):
+        bill_history = scraped_data["bill_history"]
+        ledger = bill_history.get("ledger", [])
+        bills = [item for item in ledger if item.get("type") == "bill"]
+
+        if len(bills) > 0:
+            batch.append(mqtt_client.latest_bill_message(bills[0], timestamp))
+        if len(bills) >= 2:
+            batch.append(mqtt_client.previous_bill_message(bills[1], timestamp))
+
+        # Smart last payment detection: only publish when payment count increased
+        should_pub, last_payment, reason = await run_db(should_publish_last_payment)
+        if should_pub and last_payment:
+            add_log("info", f"Publishing last_payment to MQTT: {reason}")
+            batch.append(mqtt_client.last_payment_message(last_payment, timestamp))
+        else:
+            add_log("debug", f"Skipping last_payment MQTT: {reason if reason else 'no change'}")
+
+    # Payee summary for the most recent bill
+    try:
+        all_summaries = await calculate_all_payee_balances()
+        all_bills = await get_all_bills()
+        if all_bills and len(all_bills) > 0:
+            most_recent_bill = all_bills[0]
+            bill_id = most_recent_bill.get('id')
+            if bill_id and bill_id in all_summaries:
+                summary = all_summaries[bill_id]
+                bill_info = {
+                    'bill_cycle_date': most_recent_bill.get('bill_cycle_date', ''),
+                    'bill_total': summary.get('bill_total', 0),
+                    'total_paid': summary.get('total_paid', 0),
+                    'bill_balance': summary.get('bill_balance', 0),
+                    'bill_status': summary.get('bill_status', 'unknown')
+                }
+                payee_summaries = summary.get('payee_summaries', [])
+                await mqtt_client.update_payee_entities([p.get('name') for p in payee_summaries])
+                batch.append(mqtt_client.payee_summary_message(payee_summaries, bill_info, timestamp))
+    except Exception as e:
+        add_log("warning", f"Failed to build payee summary: {e}")
+
+    report = await mqtt_client.publish_batch(batch)
+    latencies = ", ".join(f"{topic.rsplit('/', 1)[-1]} {ms:.0f}ms" for topic, ms in report["latency_ms"].items())
+    skipped = f", {len(report['skipped'])} unchanged skipped" if report["skipped"] else ""
+    if report["queued"]:
+        add_log("warning", f"MQTT broker unavailable, queued {', '.join(report['queued'])} for delivery on reconnect")
+    add_log("info", f"Published {report['published']} MQTT messages in {report['elapsed_ms']:.0f}ms{skipped}")
+    if latencies:
+        add_log("debug", f"MQTT delivery latency: {latencies}")
+    if report["failed"]:
+        add_log("warning", f"MQTT messages not acknowledged: {', '.join(report['failed'])}")
+
+
+@bus.subscribe(ScrapeCompleted, name="mqtt")
+async def _on_scrape_mqtt(event: ScrapeCompleted):
+    if event.success and event.data:
+        await _publish_scrape_to_mqtt(event.data, event.timestamp)
+
+
+# No timeout: the IMAP sync runs in an executor thread that a timeout can't stop,
+# and auto-assign must not run until it has finished
+@bus.subscribe(ScrapeCompleted, name="payment_attribution", timeout=0)
+async def _on_scrape_attribution(event: ScrapeCompleted):
+    """IMAP attribution, then auto-assign of expired pending payments (order matters: IMAP claims first)"""
+    if not event.success:
+        return
+    try:
+        from imap_client import load_imap_config, run_imap_auto_attribution
+        imap_config = load_imap_config()
+        if imap_config.get('auto_assign_mode') == 'every_scrape' and imap_config.get('server'):
+            add_log("info", "Running IMAP payment attribution after scrape...")
+            result = await run_imap_auto_attribution()
+            if result.get('already_running'):
+                # That sync's own pipeline auto-assigns once it has claimed its payments
+                add_log("info", "IMAP sync already running, skipping attribution and auto-assign this time")
+                return
+    except Exception as imap_e:
+        add_log("warning", f"IMAP auto-attribution failed: {imap_e}")
+
+    # Auto-assign expired pending payments to default payee
+    try:
+        from async_database import auto_assign_expired_pending_payments
+        result = await auto_assign_expired_pending_payments()
+        if result.get('assigned', 0) > 0:
+            add_log("info", result.get('message', 'Auto-assigned expired pending payments'))
+    except Exception as auto_e:
+        add_log("warning", f"Auto-assign expired payments failed: {auto_e}")
+
+
+async def _speak(source: str, key: str, **kwargs):
+    """Queue a configured TTS message if TTS is enabled and set up"""
+    config = load_tts_config()
+    tts_engine = (config.get("tts_engine") or "").strip()
+    media_players = [p for p in (config.get("media_players") or [])
+                     if isinstance(p, dict) and (p.get("entity_id") or "").strip()]
+    if not config.get("enabled") or not tts_engine or not media_players:
+        return
+    message = build_tts_message(config, key, **kwargs)
+    if not message:
+        return
+    from tts_queue import enqueue_tts
+    await enqueue_tts(
+        source=source,
+        message=message,
+        media_players=media_players,
+        tts_engine=tts_engine,
+        cache=config.get("cache", True),
+        wait_for_idle=config.get("wait_for_idle", True),
+    )
+
+
+@bus.subscribe(BillAdded, name="tts_new_bill")
+async def _on_bill_added(event: BillAdded):
+    add_log("info", f"New bill detected: {event.bill.get('month_range', '')} {event.bill.get('bill_total', '')}")
+    await _speak("new_bill", "new_bill", month_range=event.bill.get("month_range", ""),
+                 amount=event.bill.get("bill_total", ""))
+
+
+@bus.subscribe(PaymentAdded, name="tts_payment_received")
+async def _on_payment_added(event: PaymentAdded):
+    add_log("info", f"New payment detected: {event.payment.get('amount', '')} on {event.payment.get('bill_cycle_date', '')}")
+    await _speak("payment_received", "payment_received", amount=event.payment.get("amount", ""),
+                 balance=event.balance or "")
+
+
+@bus.subscribe(BalanceChanged, name="balance_log")
+async def _on_balance_changed(event: BalanceChanged):
+    add_log("info", f"Account balance changed: {event.old} -> {event.new}")
+
+
+# Post-scrape pipelines still running (strong refs; cancelled on shutdown)
+_pipeline_tasks: set = set()
+
+async def publish_scrape_events(result: dict, source: str) -> asyncio.Task:
+    """
+    Start the post-scrape pipeline for a perform_login() result.
+    Ledger changes are detected before returning (against the scrape just before
+    this one); the subscribers then run in a background task, so the caller
+    doesn't wait on MQTT acks, TTS or an IMAP sync.
+    Ledger events are only derived when there is an earlier successful scrape
+    to diff against, so a first scrape doesn't announce the whole history.
+    """
+    success = result.get('success', False)
+    scraped_data = result.get('data') or {}
+    timestamp = scraped_data.get("timestamp") or utc_now_iso()
+    events = [ScrapeCompleted(scraped_data, success, source, timestamp)]
+
+    if success and scraped_data:
+        try:
+            previous = await run_db(get_previous_successful_scrape)
+            if previous:
+                changes = detect_ledger_changes(scraped_data, previous)
+                if changes["account_balance"]:
+                    events.append(BalanceChanged(*changes["account_balance"], timestamp=timestamp))
+                events += [BillAdded(bill, timestamp) for bill in changes["bills"]["added"]]
+                events += [PaymentAdded(payment, scraped_data.get("account_balance"), timestamp)
+                           for payment in changes["payments"]["added"]]
+        except Exception as e:
+            add_log("warning", f"Ledger change detection failed: {e}")
+
+    task = asyncio.create_task(_dispatch_scrape_events(events, source))
+    _pipeline_tasks.add(task)
+    task.add_done_callback(_pipeline_tasks.discard)
+    return task
+
+async def _dispatch_scrape_events(events: list, source: str) -> list:
+    timings = await bus.publish(*events)
+    for t in timings:
+        if t["error"]:
+            add_log("warning", f"Post-scrape subscriber {t['subscriber']} failed on {t['event']}: {t['error']}")
+    add_log("debug", "Post-scrape pipeline (" + source + "): " +
+            ", ".join(f"{t['subscriber']} {t['ms']:.0f}ms" for t in timings))
+    return timings
+
 async def run_scheduled_scrape():
     """Run a scheduled scrape"""
     global _scrape_running
@@ -162,7 +354,7 @@ async def run_scheduled_scrape():
         credentials = load_credentials()
         if not credentials:
             add_log("warning", "Scheduled scrape skipped: No credentials found")
-            add_scrape_history(False, "No credentials found", "credentials_check", 0)
+            await add_scrape_history(False, "No credentials found", "credentials_check", 0)
             return
         
         from browser_automation import perform_login
@@ -170,93 +362,20 @@ async def run_scheduled_scrape():
         username = credentials["username"]
         password = credentials["password"]
         totp = pyotp.TOTP(credentials["totp_secret"])
-        totp_code = totp.now()
         
         add_log("info", "Starting scheduled scrape...")
-        result = await perform_login(username, password, totp_code)
+        # TOTP is generated only if a full login is needed (saved session expired)
+        result = await perform_login(username, password, totp.now, cipher=cipher)
         success = result.get('success', False)
-        scraped_data = result.get('data', {})
-        
-        # Send notifications via MQTT
-        from mqtt_client import get_mqtt_client
-        mqtt_client = get_mqtt_client()
-        
-        if success and scraped_data:
-            timestamp = scraped_data.get("timestamp")
-            
-            # MQTT: Always publish after every successful scrape
-            if mqtt_client:
-                if scraped_data.get("account_balance"):
-                    await mqtt_client.publish_account_balance(scraped_data["account_balance"], timestamp)
-                
-                if scraped_data.get("bill_history"):
-                    bill_history = scraped_data["bill_history"]
-                    ledger = bill_history.get("ledger", [])
-                    bills = [item for item in ledger if item.get("type") == "bill"]
-                    
-                    if len(bills) > 0:
-                        await mqtt_client.publish_latest_bill(bills[0], timestamp)
-                    if len(bills) >= 2:
-                        await mqtt_client.publish_previous_bill(bills[1], timestamp)
-                    
-                    # Smart last payment detection: only publish when payment count increased
-                    should_pub, last_payment, reason = should_publish_last_payment()
-                    if should_pub and last_payment:
-                        add_log("info", f"Publishing last_payment to MQTT: {reason}")
-                        await mqtt_client.publish_last_payment(last_payment, timestamp)
-                    else:
-                        add_log("debug", f"Skipping last_payment MQTT: {reason if reason else 'no change'}")
-                
-                # Publish payee summary for the most recent bill (scheduled scrape)
-                try:
-                    from database import calculate_all_payee_balances, get_all_bills
-                    all_summaries = calculate_all_payee_balances()
-                    all_bills = get_all_bills()
-                    if all_bills and len(all_bills) > 0:
-                        most_recent_bill = all_bills[0]
-                        bill_id = most_recent_bill.get('id')
-                        if bill_id and bill_id in all_summaries:
-                            summary = all_summaries[bill_id]
-                            bill_info = {
-                                'bill_cycle_date': most_recent_bill.get('bill_cycle_date', ''),
-                                'bill_total': summary.get('bill_total', 0),
-                                'total_paid': summary.get('total_paid', 0),
-                                'bill_balance': summary.get('bill_balance', 0),
-                                'bill_status': summary.get('bill_status', 'unknown')
-                            }
-                            payee_summaries = summary.get('payee_summaries', [])
-                            await mqtt_client.publish_payee_summary(payee_summaries, bill_info, timestamp)
-                            add_log("info", "Published payee summary to MQTT")
-                except Exception as e:
-                    add_log("warning", f"Failed to publish payee summary: {e}")
-        
-        # Check IMAP for payment attribution if configured
-        if success:
-            try:
-                from imap_client import load_imap_config, run_imap_auto_attribution
-                imap_config = load_imap_config()
-                if imap_config.get('auto_assign_mode') == 'every_scrape' and imap_config.get('server'):
-                    add_log("info", "Running IMAP payment attribution after scrape...")
-                    await run_imap_auto_attribution()
-            except Exception as imap_e:
-                add_log("warning", f"IMAP auto-attribution failed: {imap_e}")
-            
-            # Auto-assign expired pending payments to default payee
-            try:
-                from database import auto_assign_expired_pending_payments
-                result = auto_assign_expired_pending_payments()
-                if result.get('assigned', 0) > 0:
-                    add_log("info", result.get('message', 'Auto-assigned expired pending payments'))
-            except Exception as auto_e:
-                add_log("warning", f"Auto-assign expired payments failed: {auto_e}")
         
         duration = time_module.time() - start_time
-        add_scrape_history(success, None if success else "Scrape failed", None, duration)
+        await add_scrape_history(success, None if success else "Scrape failed", None, duration)
         add_log("success", f"Scheduled scrape completed: {success}")
+        await publish_scrape_events(result, "scheduled")
     except Exception as e:
         duration = time_module.time() - start_time
         error_msg = f"Scheduled scrape failed: {str(e)}"
-        add_scrape_history(False, error_msg, "unknown", duration)
+        await add_scrape_history(False, error_msg, "unknown", duration)
         add_log("error", error_msg)
         logging.error(error_msg)
     finally:
@@ -342,6 +461,8 @@ async def startup_event():
                 mqtt_config.get("mqtt_qos", 1),
                 mqtt_config.get("mqtt_retain", True),
                 mqtt_config.get("mqtt_discovery", True),
+                mqtt_config.get("mqtt_transport", "paho"),
+                mqtt_config.get("mqtt_queue_max", 500),
             )
             add_log("info", "MQTT client initialized")
     except Exception as e:
@@ -364,6 +485,24 @@ async def startup_event():
     except Exception as e:
         add_log("warning", f"TTS bill summary scheduler failed to start: {e}")
 
+    try:
+        from retention import start_retention_task
+        start_retention_task()
+    except Exception as e:
+        add_log("warning", f"Retention task failed to start: {e}")
+
+    if CREDENTIALS_FILE.exists():
+        # Warm Chromium in the background so the first scrape skips the cold start
+        asyncio.create_task(_prewarm_browser())
+
+async def _prewarm_browser():
+    try:
+        from browser_manager import get_browser_manager
+        await get_browser_manager().start()
+        add_log("info", "Browser started")
+    except Exception as e:
+        add_log("warning", f"Browser prewarm failed (will launch on first scrape): {e}")
+
 @app.on_event("shutdown")
 async def shutdown_event():
     global _scheduler_task
@@ -373,6 +512,17 @@ async def shutdown_event():
             await _scheduler_task
         except asyncio.CancelledError:
             pass
+    for task in list(_pipeline_tasks):
+        task.cancel()
+    if _pipeline_tasks:
+        await asyncio.gather(*_pipeline_tasks, return_exceptions=True)
+    from retention import stop_retention_task
+    await stop_retention_task()
+    from ha_client import close_ha_client
+    await close_ha_client()
+    from browser_manager import shutdown_browser_manager
+    await shutdown_browser_manager()
+    await shutdown_database()
 
 class CredentialsModel(BaseModel):
     username: str
@@ -392,6 +542,8 @@ class MQTTConfigModel(BaseModel):
     mqtt_qos: int = 1
     mqtt_retain: bool = True
     mqtt_discovery: bool = True
+    mqtt_transport: str = "paho"  # "paho" or "asyncio"
+    mqtt_queue_max: int = 500  # Messages kept while the broker is unreachable
 
 class AppSettingsModel(BaseModel):
     time_offset_hours: float = 0.0
@@ -413,6 +565,9 @@ def save_credentials(username: str, password: str, totp_secret: str):
         "totp_secret": encrypt_data(totp_secret)
     }
     CREDENTIALS_FILE.write_text(json.dumps(credentials))
+    # A saved browser session belongs to the old account
+    from browser_session import clear_session_state
+    clear_session_state()
 
 def load_credentials() -> Optional[dict]:
     """Load and decrypt credentials"""
@@ -439,6 +594,8 @@ def save_mqtt_config(mqtt_config: dict):
         "mqtt_qos": mqtt_config.get("mqtt_qos", 1),
         "mqtt_retain": mqtt_config.get("mqtt_retain", True),
         "mqtt_discovery": mqtt_config.get("mqtt_discovery", True),
+        "mqtt_transport": mqtt_config.get("mqtt_transport", "paho"),
+        "mqtt_queue_max": mqtt_config.get("mqtt_queue_max", 500),
         "updated_at": utc_now_iso()
     }
     MQTT_CONFIG_FILE.write_text(json.dumps(config_data))
@@ -458,6 +615,8 @@ def load_mqtt_config() -> dict:
             "mqtt_qos": data.get("mqtt_qos", 1),
             "mqtt_retain": data.get("mqtt_retain", True),
             "mqtt_discovery": data.get("mqtt_discovery", True),
+            "mqtt_transport": data.get("mqtt_transport", "paho"),
+            "mqtt_queue_max": data.get("mqtt_queue_max", 500),
         }
     except Exception as e:
         add_log("warning", f"Failed to load MQTT config: {str(e)}")
@@ -494,6 +653,8 @@ def should_publish_last_payment() -> tuple:
     Does NOT publish when:
     - Just payee attribution changed (payee doesn't affect last_payment MQTT)
     - Order changed but same payment is still "last"
+
+    Blocking (DB + state file): call via run_db() from async code.
     """
     from database import get_most_recent_bill_payment_count
     
@@ -698,87 +859,34 @@ async def start_scraper():
     
     credentials = load_credentials()
     if not credentials:
-        add_scrape_history(False, "No credentials found", "credentials_check", 0)
+        await add_scrape_history(False, "No credentials found", "credentials_check", 0)
         raise HTTPException(status_code=404, detail="No credentials found. Please configure settings first.")
     
     # Clear previous logs when starting a new scrape
-    clear_logs()
+    await clear_logs()
     add_log("info", "Scraper started by user")
     
     # Use saved credentials
     username = credentials["username"]
     password = credentials["password"]
     
-    # Generate TOTP code
+    # TOTP code is generated at the MFA prompt, only if a full login is needed
     totp = pyotp.TOTP(credentials["totp_secret"])
-    totp_code = totp.now()
     
     try:
-        result = await perform_login(username, password, totp_code)
+        result = await perform_login(username, password, totp.now, cipher=cipher)
         success = result.get('success', False)
-        scraped_data = result.get('data', {})
-        
-        # Send notifications via MQTT
-        from mqtt_client import get_mqtt_client
-        mqtt_client = get_mqtt_client()
-        
-        if success and scraped_data:
-            timestamp = scraped_data.get("timestamp")
-            
-            # MQTT: Publish after every successful scrape
-            if mqtt_client:
-                if scraped_data.get("account_balance"):
-                    await mqtt_client.publish_account_balance(scraped_data["account_balance"], timestamp)
-                
-                if scraped_data.get("bill_history"):
-                    bill_history = scraped_data["bill_history"]
-                    ledger = bill_history.get("ledger", [])
-                    bills = [item for item in ledger if item.get("type") == "bill"]
-                    
-                    if len(bills) > 0:
-                        await mqtt_client.publish_latest_bill(bills[0], timestamp)
-                    if len(bills) >= 2:
-                        await mqtt_client.publish_previous_bill(bills[1], timestamp)
-                    
-                    # Smart last payment detection: only publish when payment count increased
-                    should_pub, last_payment, reason = should_publish_last_payment()
-                    if should_pub and last_payment:
-                        add_log("info", f"Publishing last_payment to MQTT: {reason}")
-                        await mqtt_client.publish_last_payment(last_payment, timestamp)
-                    else:
-                        add_log("debug", f"Skipping last_payment MQTT: {reason if reason else 'no change'}")
-                
-                # Publish payee summary for the most recent bill (manual scrape)
-                try:
-                    from database import calculate_all_payee_balances, get_all_bills
-                    all_summaries = calculate_all_payee_balances()
-                    all_bills = get_all_bills()
-                    if all_bills and len(all_bills) > 0:
-                        most_recent_bill = all_bills[0]
-                        bill_id = most_recent_bill.get('id')
-                        if bill_id and bill_id in all_summaries:
-                            summary = all_summaries[bill_id]
-                            bill_info = {
-                                'bill_cycle_date': most_recent_bill.get('bill_cycle_date', ''),
-                                'bill_total': summary.get('bill_total', 0),
-                                'total_paid': summary.get('total_paid', 0),
-                                'bill_balance': summary.get('bill_balance', 0),
-                                'bill_status': summary.get('bill_status', 'unknown')
-                            }
-                            payee_summaries = summary.get('payee_summaries', [])
-                            await mqtt_client.publish_payee_summary(payee_summaries, bill_info, timestamp)
-                            add_log("info", "Published payee summary to MQTT")
-                except Exception as e:
-                    add_log("warning", f"Failed to publish payee summary: {e}")
         
         duration = time_module.time() - start_time
-        add_scrape_history(success, None if success else "Scrape failed", None, duration)
+        await add_scrape_history(success, None if success else "Scrape failed", None, duration)
         add_log("success", f"Scraper completed: {success}")
+        # MQTT/TTS/IMAP run after the response is sent
+        await publish_scrape_events(result, "manual")
         return result
     except Exception as e:
         duration = time_module.time() - start_time
         error_msg = str(e)
-        add_scrape_history(False, error_msg, "unknown", duration)
+        await add_scrape_history(False, error_msg, "unknown", duration)
         add_log("error", f"Scraper failed: {error_msg}")
         raise HTTPException(status_code=500, detail=error_msg)
 
@@ -797,11 +905,19 @@ async def configure_mqtt(config: MQTTConfigModel):
             "mqtt_qos": config.mqtt_qos,
             "mqtt_retain": config.mqtt_retain,
             "mqtt_discovery": config.mqtt_discovery,
+            "mqtt_transport": config.mqtt_transport if config.mqtt_transport in ("paho", "asyncio") else "paho",
+            "mqtt_queue_max": max(1, config.mqtt_queue_max),
         }
         
         # Save to file for persistence
         save_mqtt_config(mqtt_config)
         
+        # Close the old connection (and its reconnect/keepalive tasks) before replacing the client
+        from mqtt_client import get_mqtt_client
+        old_client = get_mqtt_client()
+        if old_client:
+            await old_client.disconnect()
+        
         # Initialize MQTT client with new config
         if mqtt_config.get("mqtt_url"):
             init_mqtt_client(
@@ -812,10 +928,11 @@ async def configure_mqtt(config: MQTTConfigModel):
                 mqtt_config["mqtt_qos"],
                 mqtt_config["mqtt_retain"],
                 mqtt_config.get("mqtt_discovery", True),
+                mqtt_config["mqtt_transport"],
+                mqtt_config["mqtt_queue_max"],
             )
             add_log("success", "MQTT configured successfully")
             # Trigger connect + discovery so sensors appear immediately
-            from mqtt_client import get_mqtt_client
             mqtt_client = get_mqtt_client()
             if mqtt_client:
                 await mqtt_client.connect()
@@ -843,6 +960,8 @@ async def get_mqtt_config():
             "mqtt_qos": mqtt_config.get("mqtt_qos", 1),
             "mqtt_retain": mqtt_config.get("mqtt_retain", True),
             "mqtt_discovery": mqtt_config.get("mqtt_discovery", True),
+            "mqtt_transport": mqtt_config.get("mqtt_transport", "paho"),
+            "mqtt_queue_max": mqtt_config.get("mqtt_queue_max", 500),
         }
     except Exception as e:
         add_log("error", f"Failed to get MQTT config: {str(e)}")
@@ -854,8 +973,23 @@ async def get_mqtt_config():
             "mqtt_qos": 1,
             "mqtt_retain": True,
             "mqtt_discovery": True,
+            "mqtt_transport": "paho",
+            "mqtt_queue_max": 500,
         }
 
+@app.get("/api/mqtt/queue")
+async def get_mqtt_queue():
+    """Outbound MQTT queue depth and drain metrics"""
+    from mqtt_client import get_mqtt_client
+    mqtt_client = get_mqtt_client()
+    if not mqtt_client or not mqtt_client.enabled:
+        raise HTTPException(status_code=404, detail="MQTT not configured")
+    try:
+        return await mqtt_client.queue_stats()
+    except Exception as e:
+        add_log("error", f"Failed to get MQTT queue stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/app-settings")
 async def save_app_settings_endpoint(settings: AppSettingsModel):
     """Save app settings (time offset, password)"""
@@ -903,32 +1037,159 @@ async def verify_password_endpoint(data: PasswordVerifyModel):
 @app.get("/api/logs")
 async def get_logs_endpoint(limit: int = 100):
     """Get log entries"""
-    logs = get_logs(limit)
+    logs = await get_logs(limit)
     return {"logs": logs}
 
 @app.delete("/api/logs")
 async def clear_logs_endpoint():
     """Clear all log entries"""
-    clear_logs()
+    await clear_logs()
     return {"message": "Logs cleared successfully"}
 
 @app.get("/api/scrape-history")
 async def get_scrape_history_endpoint(limit: int = 50):
     """Get scrape history"""
-    history = get_scrape_history(limit)
+    history = await get_scrape_history(limit)
     return {"history": history}
 
+@app.get("/api/events/stats")
+async def get_event_stats():
+    """Post-scrape pipeline subscriber timings (calls, failures, last/avg ms)"""
+    return {"subscribers": bus.stats()}
+
+@app.get("/api/scrape/waits")
+async def get_scrape_wait_stats():
+    """Per-step page wait timings from recent scrapes and the timeouts the next scrape will use"""
+    from page_waits import get_wait_strategy
+    return {"steps": get_wait_strategy().stats()}
+
+@app.get("/api/scrape/ledger-source")
+async def get_ledger_source():
+    """Whether bill history comes from captured JSON responses or the DOM, and the last cross-check"""
+    from ledger_capture import LedgerCaptureState, REVERIFY_EVERY
+    state = LedgerCaptureState()
+    return dict(state.data, using_json=state.use_json(), reverify_every=REVERIFY_EVERY)
+
+class RequestPolicyModel(BaseModel):
+    enabled: Optional[bool] = None
+    deny_resource_types: Optional[list[str]] = None
+    deny_hosts: Optional[list[str]] = None
+    allow_hosts: Optional[list[str]] = None
+    live_preview_assets: Optional[bool] = None
+    screenshot_assets: Optional[bool] = None
+
+@app.get("/api/scrape/request-policy")
+async def get_request_policy():
+    """Get the scrape request blocking policy (resource types and hosts)"""
+    from request_policy import load_request_policy
+    return load_request_policy()
+
+@app.post("/api/scrape/request-policy")
+async def save_request_policy_endpoint(policy: RequestPolicyModel):
+    """Save the request blocking policy (omitted fields keep their current value); applies from the next scrape"""
+    from request_policy import load_request_policy, save_request_policy
+    current = load_request_policy()
+    current.update(policy.model_dump(exclude_none=True))
+    save_request_policy(current)
+    add_log("info", "Request blocking policy saved")
+    return {"success": True}
+
+@app.get("/api/browser/status")
+async def get_browser_status(check: bool = False):
+    """Shared Chromium status; check=true runs a health check (launching/relaunching if needed)"""
+    from browser_manager import get_browser_manager
+    manager = get_browser_manager()
+    status = manager.status()
+    if check:
+        try:
+            status["healthy"] = await manager.health_check()
+        except Exception as e:
+            add_log("warning", f"Browser health check failed: {e}")
+            status["healthy"] = False
+        status.update(manager.status())
+    return status
+
+# ========== Retention / Compaction ==========
+class RetentionRuleModel(BaseModel):
+    max_rows: Optional[int] = None
+    max_age_days: Optional[float] = None
+
+class RetentionConfigModel(BaseModel):
+    enabled: Optional[bool] = None
+    interval_hours: Optional[float] = None
+    vacuum_pages: Optional[int] = None
+    tables: Optional[Dict[str, RetentionRuleModel]] = None
+
+@app.get("/api/retention-config")
+async def get_retention_config():
+    """Get retention rules and the last compaction result"""
+    from retention import load_retention_config
+    return load_retention_config()
+
+@app.post("/api/retention-config")
+async def save_retention_config_endpoint(config: RetentionConfigModel):
+    """Save retention rules (omitted fields keep their current value)"""
+    from retention import load_retention_config, save_retention_config
+    from database import RETENTION_TABLES
+    current = load_retention_config()
+    updates = config.model_dump(exclude_none=True, exclude={"tables"})
+    current.update(updates)
+    for table, rule in (config.tables or {}).items():
+        if table not in RETENTION_TABLES:
+            raise HTTPException(status_code=400, detail=f"Unknown retention table: {table}")
+        # Explicit nulls are kept so a limit can be switched off
+        current["tables"][table] = rule.model_dump()
+    save_retention_config(current)
+    return {"success": True}
+
+@app.post("/api/retention/compact")
+async def run_retention_now():
+    """Apply retention rules immediately and report rows deleted and bytes reclaimed"""
+    try:
+        from retention import run_compaction
+        result = await run_compaction()
+        add_log("info", f"Compaction reclaimed {result['bytes_reclaimed']} bytes")
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _scraped_data_response(request: Request, latest_only: bool, limit: int) -> Response:
+    """Serve cached, pre-serialized scraped data with ETag / If-None-Match (304) support"""
+    import database
+    cached = database.peek_scraped_data_json(latest_only, limit)
+    if cached is None:
+        cached = await run_db_read(database.get_scraped_data_json, latest_only, limit)
+    etag, body = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @app.get("/api/scraped-data")
-async def get_scraped_data_endpoint(limit: int = 100):
+async def get_scraped_data_endpoint(request: Request, limit: int = 100):
     """Get scraped data"""
-    data = get_all_scraped_data(limit)
-    return {"data": data}
+    return await _scraped_data_response(request, False, limit)
 
 @app.get("/api/scraped-data/latest")
-async def get_latest_data():
+async def get_latest_data(request: Request):
     """Get latest scraped data"""
-    data = get_latest_scraped_data(1)
-    return {"data": data[0] if data else None}
+    return await _scraped_data_response(request, True, 1)
+
+@app.get("/api/scraped-data/history")
+async def get_scraped_data_history_endpoint(limit: int = 100):
+    """List stored scrape snapshots (metadata and storage sizes)"""
+    from async_database import get_scraped_data_history
+    history = await get_scraped_data_history(limit)
+    return {"history": history}
+
+@app.get("/api/scraped-data/{scrape_id:int}")
+async def get_scraped_data_by_id_endpoint(scrape_id: int):
+    """Reconstruct a historical scrape snapshot"""
+    from async_database import get_scraped_data_by_id
+    entry = await get_scraped_data_by_id(scrape_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Scrape not found")
+    return {"data": entry}
 
 @app.get("/api/screenshot/{filename}")
 async def get_screenshot(filename: str):
@@ -994,18 +1255,18 @@ async def get_bill_document_endpoint(bill_id: int = None):
     from fastapi.responses import JSONResponse
     
     if bill_id:
-        doc = get_bill_document(bill_id)
+        doc = await get_bill_document(bill_id)
         if not doc:
             return JSONResponse({"error": f"No PDF for bill {bill_id}"}, status_code=404)
         pdf_path = DATA_DIR / doc["pdf_path"]
     else:
-        latest_id = get_latest_bill_id_with_document()
+        latest_id = await get_latest_bill_id_with_document()
         if not latest_id:
             return JSONResponse(
                 {"error": "No bill PDF available. Add a PDF in Settings → App Settings."},
                 status_code=404
             )
-        doc = get_bill_document(latest_id)
+        doc = await get_bill_document(latest_id)
         pdf_path = DATA_DIR / doc["pdf_path"]
     
     if not os.path.exists(pdf_path):
@@ -1020,11 +1281,11 @@ async def get_latest_bill_pdf():
 @app.get("/api/latest-bill-pdf/status")
 async def get_pdf_status():
     """Check if any bill PDF exists (for backward compat)"""
-    exists = get_latest_bill_id_with_document() is not None
+    exists = await get_latest_bill_id_with_document() is not None
     size = 0
     if exists:
-        latest_id = get_latest_bill_id_with_document()
-        doc = get_bill_document(latest_id)
+        latest_id = await get_latest_bill_id_with_document()
+        doc = await get_bill_document(latest_id)
         if doc:
             import os
             pdf_path = DATA_DIR / doc["pdf_path"]
@@ -1041,7 +1302,7 @@ async def get_pdf_status():
 async def get_bill_pdf_status(bill_id: int):
     """Check if a specific bill has a PDF"""
     import os
-    doc = get_bill_document(bill_id)
+    doc = await get_bill_document(bill_id)
     if not doc:
         return {"exists": False, "size_bytes": 0, "size_kb": 0}
     pdf_path = DATA_DIR / doc["pdf_path"]
@@ -1064,7 +1325,7 @@ async def _download_and_store_pdf(pdf_url: str, bill_id: int) -> dict:
     if not ('blob.core.windows.net' in pdf_url or '.pdf' in pdf_url.lower() or 'cecony' in pdf_url.lower()):
         add_log("warning", f"URL doesn't look like a ConEd PDF: {pdf_url[:50]}...")
     
-    bill = get_bill_by_id(bill_id) if bill_id else None
+    bill = await get_bill_by_id(bill_id) if bill_id else None
     if bill_id and not bill:
         raise HTTPException(status_code=404, detail="Bill not found")
     
@@ -1084,7 +1345,7 @@ async def _download_and_store_pdf(pdf_url: str, bill_id: int) -> dict:
         os.remove(pdf_path)
     with open(pdf_path, 'wb') as f:
         f.write(pdf_content)
-    upsert_bill_document(bill_id, f"bills/bill_{bill_id}.pdf", source_url=pdf_url)
+    await upsert_bill_document(bill_id, f"bills/bill_{bill_id}.pdf", source_url=pdf_url)
     size_kb = round(len(pdf_content) / 1024, 1)
     add_log("success", f"PDF saved for bill {bill_id}: {size_kb} KB")
     return {"success": True, "message": f"PDF saved ({size_kb} KB)", "size_bytes": len(pdf_content)}
@@ -1092,7 +1353,7 @@ async def _download_and_store_pdf(pdf_url: str, bill_id: int) -> dict:
 @app.post("/api/bills/{bill_id}/pdf/download")
 async def download_bill_pdf_for_period(bill_id: int, request: PdfDownloadRequest):
     """Download PDF for a specific billing period"""
-    bill = get_bill_by_id(bill_id)
+    bill = await get_bill_by_id(bill_id)
     if not bill:
         raise HTTPException(status_code=404, detail="Bill not found")
     pdf_url = request.url.strip()
@@ -1108,7 +1369,7 @@ async def download_bill_pdf(request: PdfDownloadRequest):
     pdf_url = request.url.strip()
     if not pdf_url:
         raise HTTPException(status_code=400, detail="PDF URL is required")
-    bills = get_all_bills(limit=1)
+    bills = await get_all_bills(limit=1)
     if not bills:
         raise HTTPException(status_code=400, detail="No bills in ledger. Run scraper first.")
     bill_id = bills[0]['id']
@@ -1118,26 +1379,14 @@ async def download_bill_pdf(request: PdfDownloadRequest):
 
 async def _get_ha_external_base_url() -> str | None:
     """Get Home Assistant external URL when running as addon. Returns base URL for addon ingress or None."""
-    token = os.environ.get("SUPERVISOR_TOKEN")
-    if not token:
+    if not os.environ.get("SUPERVISOR_TOKEN"):
         return None
-    try:
-        import aiohttp
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                "http://supervisor/core/api/config",
-                headers={"Authorization": f"Bearer {token}"},
-            ) as resp:
-                if resp.status != 200:
-                    return None
-                data = await resp.json()
-                external = (data.get("external_url") or "").rstrip("/")
-                if not external:
-                    return None
-                return f"{external}/api/hassio_ingress/coned_scraper"
-    except Exception as e:
-        add_log("debug", f"Could not get HA external URL: {e}")
+    from ha_client import get_ha_client
+    config = await get_ha_client().get_config()
+    external = ((config or {}).get("external_url") or "").rstrip("/")
+    if not external:
         return None
+    return f"{external}/api/hassio_ingress/coned_scraper"
 
 
 async def _publish_bill_pdf_mqtt():
@@ -1155,7 +1404,7 @@ async def _publish_bill_pdf_mqtt():
 @app.post("/api/latest-bill-pdf/send-mqtt")
 async def send_pdf_url_mqtt():
     """Manually send bill PDF URLs to Home Assistant via MQTT"""
-    if get_latest_bill_id_with_document() is None:
+    if await get_latest_bill_id_with_document() is None:
         raise HTTPException(status_code=404, detail="No PDF available to send")
     try:
         await _publish_bill_pdf_mqtt()
@@ -1169,7 +1418,7 @@ async def send_pdf_url_mqtt():
 @app.delete("/api/latest-bill-pdf")
 async def delete_latest_bill_pdf():
     """Delete the latest bill PDF"""
-    latest_id = get_latest_bill_id_with_document()
+    latest_id = await get_latest_bill_id_with_document()
     if not latest_id:
         return {"success": True, "message": "No PDF to delete"}
     return await _delete_bill_pdf_by_id(latest_id)
@@ -1181,11 +1430,11 @@ async def delete_bill_pdf_by_id(bill_id: int):
 
 async def _delete_bill_pdf_by_id(bill_id: int):
     import os
-    doc = get_bill_document(bill_id)
+    doc = await get_bill_document(bill_id)
     if not doc:
         return {"success": True, "message": "No PDF to delete"}
     pdf_path = DATA_DIR / doc["pdf_path"]
-    delete_bill_document(bill_id)
+    await delete_bill_document(bill_id)
     if os.path.exists(pdf_path):
         os.remove(pdf_path)
         add_log("info", "Bill PDF deleted")
@@ -1310,7 +1559,7 @@ async def save_automated_schedule(schedule: ScheduleModel):
 async def get_ledger():
     """Get complete ledger data from normalized database tables"""
     try:
-        data = get_ledger_data()
+        data = await get_ledger_data()
         return data
     except Exception as e:
         add_log("error", f"Failed to get ledger: {str(e)}")
@@ -1320,7 +1569,7 @@ async def get_ledger():
 async def get_bills(limit: int = 50):
     """Get all bills from database"""
     try:
-        bills = get_all_bills(limit)
+        bills = await get_all_bills(limit)
         return {"bills": bills}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1329,7 +1578,7 @@ async def get_bills(limit: int = 50):
 async def get_payments(limit: int = 100, bill_id: Optional[int] = None):
     """Get all payments from database"""
     try:
-        payments = get_all_payments(limit, bill_id)
+        payments = await get_all_payments(limit, bill_id)
         return {"payments": payments}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1338,7 +1587,7 @@ async def get_payments(limit: int = 100, bill_id: Optional[int] = None):
 async def get_payments_unverified(limit: int = 50):
     """Get payments that need payee verification"""
     try:
-        payments = get_unverified_payments(limit)
+        payments = await get_unverified_payments(limit)
         return {"payments": payments}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1369,7 +1618,7 @@ class PaymentAttributionModel(BaseModel):
 async def list_payee_users():
     """Get all payee users with their cards"""
     try:
-        users = get_payee_users()
+        users = await get_payee_users()
         return {"users": users}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1378,7 +1627,7 @@ async def list_payee_users():
 async def create_user(user: PayeeUserModel):
     """Create a new payee user"""
     try:
-        user_id = create_payee_user(user.name, user.is_default)
+        user_id = await create_payee_user(user.name, user.is_default)
         add_log("info", f"Created payee user: {user.name}")
         return {"id": user_id, "name": user.name, "is_default": user.is_default}
     except Exception as e:
@@ -1406,7 +1655,7 @@ async def update_responsibilities(request: Request):
             except (ValueError, TypeError) as conv_err:
                 raise HTTPException(status_code=400, detail=f"Invalid data for user {k}: {v} - {conv_err}")
         
-        result = update_payee_responsibilities(responsibilities)
+        result = await update_payee_responsibilities(responsibilities)
         if result['success']:
             add_log("info", f"Updated payee responsibilities: {result['total']}% total")
             return result
@@ -1421,7 +1670,7 @@ async def update_responsibilities(request: Request):
 async def update_user(user_id: int, user: PayeeUserUpdateModel):
     """Update a payee user"""
     try:
-        update_payee_user(user_id, user.name, user.is_default)
+        await update_payee_user(user_id, user.name, user.is_default)
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1430,7 +1679,7 @@ async def update_user(user_id: int, user: PayeeUserUpdateModel):
 async def delete_user(user_id: int):
     """Delete a payee user"""
     try:
-        deleted = delete_payee_user(user_id)
+        deleted = await delete_payee_user(user_id)
         if deleted:
             add_log("info", f"Deleted payee user ID: {user_id}")
             return {"success": True}
@@ -1442,21 +1691,40 @@ async def delete_user(user_id: int):
 
 @app.get("/api/bills/all-summaries")
 async def get_all_bill_summaries():
-    """Get payee summaries for ALL bills at once (efficient - single pass calculation)"""
+    """Get payee summaries for ALL bills at once (read from the materialized balance snapshots)"""
     try:
         add_log("info", "Calculating all bill summaries...")
-        summaries = calculate_all_payee_balances()
+        summaries = await calculate_all_payee_balances()
         add_log("info", f"Calculated summaries for {len(summaries)} bills")
         return {"summaries": summaries}
     except Exception as e:
         add_log("error", f"Failed to calculate summaries: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+class WhatIfSplitModel(BaseModel):
+    scenarios: list[Dict[int, float]]
+    bill_ids: Optional[list[int]] = None
+
+@app.post("/api/bills/what-if")
+async def what_if_responsibility_splits(request: WhatIfSplitModel):
+    """Evaluate hypothetical responsibility splits against the real payment history"""
+    import settlement
+    if not settlement.NUMPY_AVAILABLE:
+        raise HTTPException(status_code=501, detail="numpy not installed")
+    if not request.scenarios:
+        raise HTTPException(status_code=400, detail="At least one scenario is required")
+    try:
+        outcomes = await run_db(settlement.simulate_responsibility_splits, request.scenarios, request.bill_ids)
+        return {"scenarios": outcomes}
+    except Exception as e:
+        add_log("error", f"Failed to simulate responsibility splits: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/bills/{bill_id}/summary")
 async def get_bill_summary(bill_id: int):
     """Get payee payment summary for a specific bill"""
     try:
-        summary = get_bill_payee_summary(bill_id)
+        summary = await get_bill_payee_summary(bill_id)
         return summary
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1465,7 +1733,7 @@ async def get_bill_summary(bill_id: int):
 async def list_user_cards(user_id: int):
     """Get all cards for a payee user"""
     try:
-        cards = get_user_cards(user_id)
+        cards = await get_user_cards(user_id)
         return {"cards": cards}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1474,7 +1742,7 @@ async def list_user_cards(user_id: int):
 async def add_card(card: UserCardModel):
     """Add a card to a user"""
     try:
-        card_id = add_user_card(card.user_id, card.card_last_four, card.label)
+        card_id = await add_user_card(card.user_id, card.card_last_four, card.label)
         add_log("info", f"Added card *{card.card_last_four} to user ID: {card.user_id}")
         return {"id": card_id}
     except Exception as e:
@@ -1489,7 +1757,7 @@ class UserCardUpdateModel(BaseModel):
 async def update_card(card_id: int, update: UserCardUpdateModel):
     """Update a card's label"""
     try:
-        updated = update_user_card(card_id, update.card_label)
+        updated = await update_user_card(card_id, update.card_label)
         if updated:
             return {"success": True}
         raise HTTPException(status_code=404, detail="Card not found")
@@ -1502,7 +1770,7 @@ async def update_card(card_id: int, update: UserCardUpdateModel):
 async def remove_card(card_id: int):
     """Remove a card"""
     try:
-        deleted = delete_user_card(card_id)
+        deleted = await delete_user_card(card_id)
         if deleted:
             return {"success": True}
         raise HTTPException(status_code=404, detail="Card not found")
@@ -1515,7 +1783,7 @@ async def remove_card(card_id: int):
 async def attribute_payment_to_user(attribution: PaymentAttributionModel):
     """Attribute a payment to a user"""
     try:
-        success = attribute_payment(attribution.payment_id, attribution.user_id, attribution.method)
+        success = await attribute_payment(attribution.payment_id, attribution.user_id, attribution.method)
         if success:
             add_log("info", f"Attributed payment {attribution.payment_id} to user {attribution.user_id}")
             return {"success": True}
@@ -1529,7 +1797,7 @@ async def attribute_payment_to_user(attribution: PaymentAttributionModel):
 async def clear_payment_attribution_endpoint(payment_id: int):
     """Clear payment attribution (unassign from user)"""
     try:
-        success = clear_payment_attribution(payment_id)
+        success = await clear_payment_attribution(payment_id)
         if success:
             add_log("info", f"Cleared attribution for payment {payment_id}")
             return {"success": True}
@@ -1543,7 +1811,7 @@ async def clear_payment_attribution_endpoint(payment_id: int):
 async def get_payment_endpoint(payment_id: int):
     """Get a single payment by ID"""
     try:
-        payment = get_payment_by_id(payment_id)
+        payment = await get_payment_by_id(payment_id)
         if payment:
             return {"payment": payment}
         raise HTTPException(status_code=404, detail="Payment not found")
@@ -1559,7 +1827,7 @@ class UpdatePaymentBillModel(BaseModel):
 async def update_payment_bill_endpoint(payment_id: int, data: UpdatePaymentBillModel):
     """Update which bill a payment belongs to (manual override)"""
     try:
-        success = update_payment_bill(payment_id, data.bill_id, manual=True)
+        success = await update_payment_bill(payment_id, data.bill_id, manual=True)
         if success:
             add_log("info", f"Manually assigned payment {payment_id} to bill {data.bill_id}")
             return {"success": True}
@@ -1569,11 +1837,25 @@ async def update_payment_bill_endpoint(payment_id: int, data: UpdatePaymentBillM
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+class ReassignPaymentBillsModel(BaseModel):
+    payment_ids: Optional[list[int]] = None
+
+@app.post("/api/payments/reassign-bills")
+async def reassign_payment_bills_endpoint(data: ReassignPaymentBillsModel):
+    """Re-bucket non-manual payments into bills by payment date (all payments if no IDs given)"""
+    try:
+        from async_database import reassign_payment_bills
+        result = await reassign_payment_bills(data.payment_ids)
+        add_log("info", f"Re-bucketed payments: {result['reassigned']} moved of {result['checked']} checked")
+        return {"success": True, **result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.delete("/api/data/wipe")
 async def wipe_all_data():
     """Wipe all bills and payments from database"""
     try:
-        result = wipe_bills_and_payments()
+        result = await wipe_bills_and_payments()
         add_log("warning", f"Database wiped: {result['bills_deleted']} bills, {result['payments_deleted']} payments deleted")
         return {"success": True, **result}
     except Exception as e:
@@ -1587,7 +1869,7 @@ class UpdatePaymentOrderModel(BaseModel):
 async def update_payment_order_endpoint(payment_id: int, data: UpdatePaymentOrderModel):
     """Update payment's bill assignment and order position (manual audit)"""
     try:
-        success = update_payment_order(payment_id, data.bill_id, data.order)
+        success = await update_payment_order(payment_id, data.bill_id, data.order)
         if success:
             add_log("info", f"Manually set payment {payment_id} to bill {data.bill_id} at position {data.order}")
             
@@ -1596,7 +1878,7 @@ async def update_payment_order_endpoint(payment_id: int, data: UpdatePaymentOrde
                 from mqtt_client import get_mqtt_client
                 mqtt_client = get_mqtt_client()
                 if mqtt_client:
-                    should_pub, last_payment, reason = should_publish_last_payment()
+                    should_pub, last_payment, reason = await run_db(should_publish_last_payment)
                     if should_pub and last_payment:
                         add_log("info", f"Manual audit triggered MQTT publish: {reason}")
                         await mqtt_client.publish_last_payment(last_payment, utc_now_iso())
@@ -1614,8 +1896,8 @@ async def update_payment_order_endpoint(payment_id: int, data: UpdatePaymentOrde
 async def clear_payment_manual_audit_endpoint(payment_id: int):
     """Clear/release the manual audit on a payment, allowing auto-logic to take over again"""
     try:
-        from database import clear_payment_manual_audit
-        success = clear_payment_manual_audit(payment_id)
+        from async_database import clear_payment_manual_audit
+        success = await clear_payment_manual_audit(payment_id)
         if success:
             add_log("info", f"Cleared manual audit for payment {payment_id}")
             return {"success": True}
@@ -1629,8 +1911,8 @@ async def clear_payment_manual_audit_endpoint(payment_id: int):
 async def get_recent_bill_payment_stats():
     """Get payment count and last payment for the most recent billing cycle"""
     try:
-        from database import get_most_recent_bill_payment_count
-        stats = get_most_recent_bill_payment_count()
+        from async_database import get_most_recent_bill_payment_count
+        stats = await get_most_recent_bill_payment_count()
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1639,7 +1921,7 @@ async def get_recent_bill_payment_stats():
 async def get_user_payments(user_id: int):
     """Get all payments assigned to a specific user"""
     try:
-        payments = get_payments_by_user(user_id)
+        payments = await get_payments_by_user(user_id)
         return {"payments": payments}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1648,7 +1930,7 @@ async def get_user_payments(user_id: int):
 async def get_bills_with_payments_endpoint():
     """Get all bills with their payments for the audit tab"""
     try:
-        data = get_all_bills_with_payments()
+        data = await get_all_bills_with_payments()
         return data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1881,110 +2163,41 @@ class TTSConfigModel(BaseModel):
 @app.get("/api/ha-tts-entities")
 async def get_ha_tts_entities():
     """Get list of TTS entity IDs (tts.*) from Home Assistant (addon only)."""
-    token = os.environ.get("SUPERVISOR_TOKEN")
-    if not token:
-        return {"tts_entities": []}
-    try:
-        import aiohttp
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                "http://supervisor/core/api/states",
-                headers={"Authorization": f"Bearer {token}"},
-            ) as resp:
-                if resp.status != 200:
-                    return {"tts_entities": []}
-                data = await resp.json()
-                entities = [
-                    s["entity_id"]
-                    for s in (data or [])
-                    if isinstance(s, dict) and s.get("entity_id", "").startswith("tts.")
-                ]
-                return {"tts_entities": sorted(entities)}
-    except Exception as e:
-        add_log("debug", f"Could not get HA TTS entities: {e}")
+    if not os.environ.get("SUPERVISOR_TOKEN"):
         return {"tts_entities": []}
+    from ha_client import get_ha_client
+    return {"tts_entities": await get_ha_client().entity_ids("tts")}
 
 
 @app.get("/api/ha-entity-states")
 async def get_ha_entity_states(entity_ids: str = ""):
     """Get current state of entities from HA. entity_ids comma-separated (e.g. media_player.a,media_player.b)."""
-    token = os.environ.get("SUPERVISOR_TOKEN")
-    if not token or not entity_ids.strip():
+    if not os.environ.get("SUPERVISOR_TOKEN") or not entity_ids.strip():
         return {}
     ids = {x.strip() for x in entity_ids.split(",") if x.strip()}
     if not ids:
         return {}
-    try:
-        import aiohttp
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                "http://supervisor/core/api/states",
-                headers={"Authorization": f"Bearer {token}"},
-            ) as resp:
-                if resp.status != 200:
-                    return {e: "unavailable" for e in ids}
-                data = await resp.json()
-                by_id = {s["entity_id"]: s.get("state", "unknown") for s in (data or []) if isinstance(s, dict) and "entity_id" in s}
-                return {e: by_id.get(e, "unavailable") for e in ids}
-    except Exception as e:
-        add_log("debug", f"Could not get entity states: {e}")
-        return {}
+    from ha_client import get_ha_client
+    states = await get_ha_client().get_states(ids, default="unavailable")
+    return states if states is not None else {e: "unavailable" for e in ids}
 
 
 @app.get("/api/ha-sensor-entities")
 async def get_ha_sensor_entities():
     """Get sensor/helper entity IDs from HA for autocomplete (sensor.*, input_number.*, number.*)."""
-    token = os.environ.get("SUPERVISOR_TOKEN")
-    if not token:
-        return {"entities": []}
-    prefixes = ("sensor.", "input_number.", "number.")
-    try:
-        import aiohttp
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                "http://supervisor/core/api/states",
-                headers={"Authorization": f"Bearer {token}"},
-            ) as resp:
-                if resp.status != 200:
-                    return {"entities": []}
-                data = await resp.json()
-                entities = [
-                    s["entity_id"]
-                    for s in (data or [])
-                    if isinstance(s, dict)
-                    and any(s.get("entity_id", "").startswith(p) for p in prefixes)
-                ]
-                return {"entities": sorted(entities)}
-    except Exception as e:
-        add_log("debug", f"Could not get HA sensor entities: {e}")
+    if not os.environ.get("SUPERVISOR_TOKEN"):
         return {"entities": []}
+    from ha_client import get_ha_client
+    return {"entities": await get_ha_client().entity_ids("sensor", "input_number", "number")}
 
 
 @app.get("/api/ha-media-players")
 async def get_ha_media_players():
     """Get list of media_player entity IDs from Home Assistant (addon only)."""
-    token = os.environ.get("SUPERVISOR_TOKEN")
-    if not token:
-        return {"media_players": []}
-    try:
-        import aiohttp
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                "http://supervisor/core/api/states",
-                headers={"Authorization": f"Bearer {token}"},
-            ) as resp:
-                if resp.status != 200:
-                    return {"media_players": []}
-                data = await resp.json()
-                players = [
-                    s["entity_id"]
-                    for s in (data or [])
-                    if isinstance(s, dict) and s.get("entity_id", "").startswith("media_player.")
-                ]
-                return {"media_players": sorted(players)}
-    except Exception as e:
-        add_log("debug", f"Could not get HA media players: {e}")
+    if not os.environ.get("SUPERVISOR_TOKEN"):
         return {"media_players": []}
+    from ha_client import get_ha_client
+    return {"media_players": await get_ha_client().entity_ids("media_player")}
 
 
 @app.get("/api/tts-logs")
@@ -2,30 +2,133 @@
 MQTT client for publishing updates to Home Assistant
 """
 import asyncio
+import hashlib
 import json
 import logging
 import re
-from typing import Optional, Dict, Any
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime, timezone
 
+from mqtt_transport import MQTT_AVAILABLE, TRANSPORTS, PahoTransport, AsyncioTransport
+from data_config import DATA_DIR
+
 def utc_now_iso() -> str:
     """Get current UTC time as ISO string"""
     return datetime.now(timezone.utc).isoformat()
-try:
-    import paho.mqtt.client as mqtt
-    MQTT_AVAILABLE = True
-except ImportError:
-    MQTT_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# (topic_suffix, payload, json_payload) as built by the *_message() helpers
+Message = Tuple[str, str, Optional[Dict[str, Any]]]
+
+PUBLISH_BATCH_TIMEOUT = 10.0  # Seconds to wait for broker acks in publish_batch()
+
+PUBLISH_STATE_FILE = DATA_DIR / "mqtt_publish_state.json"
+
+
+def _strip_timestamps(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _strip_timestamps(v) for k, v in value.items() if k != "timestamp"}
+    if isinstance(value, list):
+        return [_strip_timestamps(v) for v in value]
+    return value
+
+
+def payee_prefix(name: str) -> str:
+    """Safe attribute/entity prefix for a payee: lowercase, spaces to underscores, no special chars"""
+    return re.sub(r'[^a-z0-9_]', '', (name or '').lower().replace(' ', '_')) or 'unknown'
+
+
+DISCOVERY_STATE_FILE = DATA_DIR / "mqtt_discovery_state.json"
+
+
+class DiscoveryCache:
+    """
+    Content hash of every discovery config last published (retained on the broker),
+    plus the dynamic per-payee entity set, persisted across restarts.
+    """
+    
+    def __init__(self, path: Optional[Path] = DISCOVERY_STATE_FILE):
+        self.path = path
+        self.hashes: Dict[str, str] = {}
+        self.payees: List[str] = []
+        if path and path.exists():
+            try:
+                data = json.loads(path.read_text())
+                self.hashes = data.get("hashes", {})
+                self.payees = data.get("payees", [])
+            except Exception as e:
+                logger.warning(f"Failed to load MQTT discovery state: {e}")
+    
+    def save(self):
+        if not self.path:
+            return
+        try:
+            self.path.write_text(json.dumps({"hashes": self.hashes, "payees": self.payees}))
+        except Exception as e:
+            logger.warning(f"Failed to save MQTT discovery state: {e}")
+
+
+class PublishStateCache:
+    """
+    Last published state per sensor topic, persisted across restarts.
+    
+    Unchanged sensor values are skipped (the broker already retains them); the
+    stored payloads are replayed on broker reconnect and Home Assistant birth.
+    Fingerprints ignore "timestamp" fields, which change on every scrape.
+    """
+    
+    def __init__(self, path: Optional[Path] = PUBLISH_STATE_FILE):
+        self.path = path
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if path and path.exists():
+            try:
+                self._entries = json.loads(path.read_text())
+            except Exception as e:
+                logger.warning(f"Failed to load MQTT publish state: {e}")
+    
+    @staticmethod
+    def fingerprint(payload: str, json_payload: Optional[Dict[str, Any]] = None) -> str:
+        # The value payload is derived from json_payload when both are given
+        content = _strip_timestamps(json_payload) if json_payload else payload
+        return hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()
+    
+    def unchanged(self, key: str, fingerprint: str) -> bool:
+        entry = self._entries.get(key)
+        return bool(entry) and entry["hash"] == fingerprint
+    
+    def record(self, key: str, fingerprint: str, messages: List[Tuple[str, str, bool]]):
+        self._entries[key] = {"hash": fingerprint, "messages": [[topic, payload] for topic, payload, _ in messages]}
+    
+    def messages(self) -> List[Tuple[str, str]]:
+        """Every stored (topic, payload), for a full republish"""
+        return [(topic, payload) for entry in self._entries.values() for topic, payload in entry["messages"]]
+    
+    def clear(self):
+        self._entries = {}
+        self.save()
+    
+    def save(self):
+        if not self.path:
+            return
+        try:
+            self.path.write_text(json.dumps(self._entries))
+        except Exception as e:
+            logger.warning(f"Failed to save MQTT publish state: {e}")
+
+
 class MQTTClient:
     """MQTT client for publishing sensor data to Home Assistant"""
     
     DISCOVERY_PREFIX = "homeassistant"
+    HA_STATUS_TOPIC = f"{DISCOVERY_PREFIX}/status"  # HA birth/will messages ("online"/"offline")
     
     def __init__(self, mqtt_url: str, username: Optional[str] = None, password: Optional[str] = None,
-                 base_topic: str = "coned", qos: int = 1, retain: bool = True, discovery: bool = True):
+                 base_topic: str = "coned", qos: int = 1, retain: bool = True, discovery: bool = True,
+                 transport: str = "paho", state_cache: Optional[PublishStateCache] = None,
+                 queue_max: int = 500, discovery_cache: Optional[DiscoveryCache] = None):
         """
         Initialize MQTT client
         
@@ -36,8 +139,15 @@ class MQTTClient:
             base_topic: Base topic prefix (default: "coned")
             qos: Quality of Service level (0, 1, or 2, default: 1)
             retain: Whether to retain messages (default: True)
+            transport: "paho" (paho-mqtt network thread) or "asyncio" (native asyncio streams)
+            state_cache: Publish dedup cache (default: persisted in DATA_DIR)
+            queue_max: Max messages kept in the outbound queue while the broker is unreachable
+            discovery_cache: Published discovery hashes (default: persisted in DATA_DIR)
         """
-        if not MQTT_AVAILABLE:
+        if transport not in TRANSPORTS:
+            logger.warning(f"Unknown MQTT transport {transport!r}, using paho")
+            transport = "paho"
+        if transport == "paho" and not MQTT_AVAILABLE:
             logger.warning("paho-mqtt not installed. MQTT functionality disabled.")
             self.enabled = False
             return
@@ -47,9 +157,18 @@ class MQTTClient:
         self.qos = qos
         self.retain = retain
         self.discovery = discovery
-        self.client = None
-        self.connected = False
+        self.transport_name = transport
+        self.transport = None
+        self.state = state_cache or PublishStateCache()
+        self.discovery_state = discovery_cache or DiscoveryCache()
+        self._discovery_configs_cache: Optional[List[Dict[str, Any]]] = None
+        self._background_tasks: set = set()
+        self.queue_max = queue_max
+        self._queue_depth: Optional[int] = None  # None until the queue table has been checked
+        self._queue_metrics = {"enqueued": 0, "dropped": 0, "drained": 0,
+                               "last_drain_count": 0, "last_drain_ms": None, "last_drain_at": None}
         self._connect_lock = asyncio.Lock()
+        self._drain_lock = asyncio.Lock()
         
         # Parse MQTT URL
         if mqtt_url.startswith("mqtts://"):
@@ -80,40 +199,40 @@ class MQTTClient:
         self.username = username
         self.password = password
         
-        # Create MQTT client
-        self.client = mqtt.Client(client_id=f"coned_scraper_{datetime.now().timestamp()}")
-        self.client.on_connect = self._on_connect
-        self.client.on_disconnect = self._on_disconnect
-        
-        if self.username and self.password:
-            self.client.username_pw_set(self.username, self.password)
-        
-        if self.use_tls:
-            self.client.tls_set()
-    
-    def _on_connect(self, client, userdata, flags, rc):
-        """Callback for when MQTT client connects"""
-        if rc == 0:
-            self.connected = True
-            logger.info(f"MQTT connected to {self.host}:{self.port}")
-            # Schedule discovery publish after connect (paho is sync, use thread)
-            if self.discovery:
-                try:
-                    import threading
-                    t = threading.Thread(target=self._publish_discovery_sync)
-                    t.daemon = True
-                    t.start()
-                except Exception as e:
-                    logger.warning(f"Failed to schedule MQTT discovery: {e}")
-        else:
-            self.connected = False
-            logger.error(f"MQTT connection failed with code {rc}")
+        # Create transport; discovery is re-published on every (re)connect
+        transport_cls = AsyncioTransport if transport == "asyncio" else PahoTransport
+        self.transport = transport_cls(self.host, self.port, self.use_tls, self.username, self.password,
+                                       on_connect=self._on_connect)
+        self.transport.subscribe(self.HA_STATUS_TOPIC, self._on_ha_status)
     
-    def _on_disconnect(self, client, userdata, rc):
-        """Callback for when MQTT client disconnects"""
-        self.connected = False
-        if rc != 0:
-            logger.warning(f"MQTT disconnected unexpectedly (code {rc}). Will attempt to reconnect.")
+    @property
+    def connected(self) -> bool:
+        return bool(self.transport and self.transport.connected)
+    
+    async def _on_connect(self, force_discovery: bool = False):
+        """Runs on the event loop after each successful CONNACK: discovery changes, last known state, then the queue"""
+        await self.publish_discovery(force=force_discovery)
+        await self.republish_state()
+        await self.drain_queue()
+    
+    async def _on_ha_status(self, topic: str, payload: bytes):
+        """Home Assistant birth message: it restarted, so resend all discovery and state"""
+        if payload.strip().lower() != b"online":
+            return
+        logger.info("Home Assistant came online, republishing MQTT discovery and state")
+        await self._on_connect(force_discovery=True)
+    
+    async def republish_state(self):
+        """Resend every cached sensor payload, bypassing dedup"""
+        prefix = f"{self.base_topic}/"
+        messages = [(topic, payload, self.retain) for topic, payload in self.state.messages() if topic.startswith(prefix)]
+        if not messages or not self.connected:
+            return
+        try:
+            await self.transport.publish(messages, self.qos)
+            logger.info(f"MQTT republished {len(messages)} cached state messages")
+        except Exception as e:
+            logger.warning(f"MQTT state republish failed: {e}")
     
     async def connect(self):
         """Connect to MQTT broker"""
@@ -125,27 +244,18 @@ class MQTTClient:
                 return True
             
             try:
-                # Run connection in thread pool since paho-mqtt is synchronous
-                loop = asyncio.get_event_loop()
-                await loop.run_in_executor(None, self.client.connect, self.host, self.port, 60)
-                self.client.loop_start()
-                
-                # Wait a bit for connection to establish
-                await asyncio.sleep(0.5)
-                return self.connected
+                return await self.transport.connect()
             except Exception as e:
                 logger.error(f"Failed to connect to MQTT broker: {str(e)}")
                 return False
     
     async def disconnect(self):
         """Disconnect from MQTT broker"""
-        if not self.enabled or not self.client:
+        if not self.enabled or not self.transport:
             return
         
         try:
-            self.client.loop_stop()
-            self.client.disconnect()
-            self.connected = False
+            await self.transport.disconnect()
             logger.info("MQTT disconnected")
         except Exception as e:
             logger.error(f"Error disconnecting MQTT: {str(e)}")
@@ -159,12 +269,13 @@ class MQTTClient:
             return await self.connect()
         return True
 
-    def _publish_discovery_sync(self):
-        """Publish MQTT discovery configs (sync, called from connect callback)"""
-        if not self.enabled or not self.client or not self.connected or not self.discovery:
-            return
-        import time
-        time.sleep(0.3)  # Brief delay so connection is fully ready
+    def _discovery_configs(self) -> List[Dict[str, Any]]:
+        """Home Assistant discovery config topics and payloads (built once per entity set)"""
+        if self._discovery_configs_cache is None:
+            self._discovery_configs_cache = self._build_discovery_configs()
+        return self._discovery_configs_cache
+    
+    def _build_discovery_configs(self) -> List[Dict[str, Any]]:
         bt = self.base_topic
         dp = self.DISCOVERY_PREFIX
         device = {
@@ -255,26 +366,79 @@ class MQTTClient:
                 },
             },
         ]
-        try:
-            for cfg in configs:
-                self.client.publish(
-                    cfg["topic"],
-                    json.dumps(cfg["payload"]),
-                    qos=self.qos,
-                    retain=True,
-                )
-                logger.info(f"MQTT discovery published: {cfg['topic']}")
-        except Exception as e:
-            logger.warning(f"MQTT discovery publish failed: {e}")
+        # One balance sensor per payee (paid minus share of the latest bill), read from payee_summary
+        for name in self.discovery_state.payees:
+            prefix = payee_prefix(name)
+            configs.append({
+                "topic": f"{dp}/sensor/coned_payee_{prefix}_balance/config",
+                "payload": {
+                    "name": f"ConEd {name} Balance",
+                    "unique_id": f"coned_payee_{prefix}_balance",
+                    "state_topic": f"{bt}/payee_summary",
+                    "value_template": "{{ value_json.data.%s_difference | default(0) }}" % prefix,
+                    "device_class": "monetary",
+                    "unit_of_measurement": "USD",
+                    "device": device,
+                },
+            })
+        return configs
 
-    async def publish_discovery(self):
-        """Publish Home Assistant MQTT discovery configs to auto-register sensors."""
+    async def publish_discovery(self, force: bool = False):
+        """
+        Publish Home Assistant MQTT discovery configs to auto-register sensors.
+        Only configs whose content changed since the last publish are sent (all of them
+        with force), and entities that left the set are removed with an empty config.
+        """
         if not self.enabled or not self.discovery:
             return
         if not await self.ensure_connected():
             return
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, self._publish_discovery_sync)
+        configs = self._discovery_configs()
+        published = self.discovery_state.hashes
+        current = {cfg["topic"]: json.dumps(cfg["payload"], sort_keys=True) for cfg in configs}
+        hashes = {topic: hashlib.sha1(body.encode()).hexdigest() for topic, body in current.items()}
+        changed = [topic for topic in current if force or published.get(topic) != hashes[topic]]
+        removed = [topic for topic in published if topic not in current]
+        if not changed and not removed:
+            return
+        
+        messages = [(topic, current[topic], True) for topic in changed] + [(topic, "", True) for topic in removed]
+        try:
+            sent = await self.transport.publish(messages, self.qos)
+        except Exception as e:
+            logger.warning(f"MQTT discovery publish failed: {e}")
+            return
+        # Don't hold up the caller on acks; record each config once the broker has it
+        task = asyncio.create_task(self._confirm_discovery(messages, sent, hashes))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _confirm_discovery(self, messages, sent, hashes: Dict[str, str]):
+        futures = [future for _, future in sent]
+        await asyncio.wait(futures, timeout=PUBLISH_BATCH_TIMEOUT)
+        published = self.discovery_state.hashes
+        for (topic, body, _), future in zip(messages, futures):
+            if not future.done() or future.result() is None:
+                continue
+            if body:
+                published[topic] = hashes[topic]
+            else:
+                published.pop(topic, None)
+        self.transport.forget([future for future in futures if not future.done()])
+        self.discovery_state.save()
+        version = hashlib.sha1("".join(sorted(hashes.values())).encode()).hexdigest()[:8]
+        acked = sum(1 for future in futures if future.done() and future.result() is not None)
+        logger.info(f"MQTT discovery {version}: {acked}/{len(messages)} config changes acknowledged ({len(hashes)} entities)")
+    
+    async def update_payee_entities(self, names: List[str]):
+        """Add/remove per-payee sensors when the payee set changes (incremental discovery)"""
+        names = sorted(set(n for n in names if n))
+        if names == self.discovery_state.payees:
+            return
+        self.discovery_state.payees = names
+        self.discovery_state.save()
+        self._discovery_configs_cache = None
+        await self.publish_discovery()
     
     def _extract_numeric(self, value: str) -> str:
         """Extract numeric value from string (e.g., '$123.45' -> '123.45')"""
@@ -297,45 +461,161 @@ class MQTTClient:
             payload: String payload for numeric topic
             json_payload: Optional JSON payload for _json topic
         """
-        if not self.enabled:
-            return
+        await self.publish_batch([(topic_suffix, payload, json_payload)])
+    
+    def _serialize(self, topic_suffix: str, payload: str,
+                   json_payload: Optional[Dict[str, Any]] = None) -> List[Tuple[str, str, bool]]:
+        """Message -> [(topic, payload, retain)]: the value topic plus the _json topic if given"""
+        messages = [(f"{self.base_topic}/{topic_suffix}", payload, self.retain)]
+        if json_payload:
+            messages.append((f"{self.base_topic}/{topic_suffix}_json", json.dumps(json_payload), self.retain))
+        return messages
+    
+    async def publish_batch(self, batch: List[Message], timeout: float = PUBLISH_BATCH_TIMEOUT) -> Dict[str, Any]:
+        """
+        Publish several messages at once and wait (up to timeout) for the broker to ack them all.
+        Messages that can't be delivered go to the outbound queue and are sent on reconnect.
         
-        if not await self.ensure_connected():
-            logger.warning(f"MQTT not connected, skipping publish to {topic_suffix}")
-            return
+        Args:
+            batch: (topic_suffix, payload, json_payload) tuples, e.g. from account_balance_message()
+            timeout: Seconds to wait for acknowledgements
+        
+        Returns:
+            {"published": n, "skipped": [unchanged topic suffixes], "queued": [topic suffixes],
+             "failed": [topics], "latency_ms": {topic: ms}, "elapsed_ms": ms}
+        """
+        report = {"published": 0, "skipped": [], "queued": [], "failed": [], "latency_ms": {}, "elapsed_ms": 0.0}
+        if not self.enabled or not batch:
+            return report
         
+        # Drop sensors whose content hasn't changed since the last acknowledged publish
+        pending = []
+        for suffix, payload, json_payload in batch:
+            group = self._serialize(suffix, payload, json_payload)
+            fingerprint = self.state.fingerprint(payload, json_payload)
+            if self.state.unchanged(group[0][0], fingerprint):
+                report["skipped"].append(suffix)
+            else:
+                pending.append((suffix, group, fingerprint))
+        if not pending:
+            return report
+        
+        # Older queued messages go first; if they can't, queue behind them to keep order
+        if await self.ensure_connected() and self._queue_depth != 0:
+            await self.drain_queue()
+        if not self.connected or self._queue_depth:
+            logger.warning(f"MQTT not connected, queueing {len(pending)} messages")
+            await self._enqueue(pending)
+            report["queued"] = [suffix for suffix, _, _ in pending]
+            return report
+        
+        messages = [m for _, group, _ in pending for m in group]
+        start = time.monotonic()
         try:
-            # Publish numeric value
-            topic = f"{self.base_topic}/{topic_suffix}"
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                None,
-                self.client.publish,
-                topic,
-                payload,
-                self.qos,
-                self.retain
-            )
-            
-            # Publish JSON payload if provided
-            if json_payload:
-                json_topic = f"{self.base_topic}/{topic_suffix}_json"
-                json_str = json.dumps(json_payload)
-                await loop.run_in_executor(
-                    None,
-                    self.client.publish,
-                    json_topic,
-                    json_str,
-                    self.qos,
-                    self.retain
-                )
-            
-            logger.debug(f"MQTT published to {topic}: {payload}")
+            sent = await self.transport.publish(messages, self.qos)
+            await asyncio.wait([future for _, future in sent], timeout=timeout)
         except Exception as e:
-            logger.warning(f"Failed to publish MQTT message to {topic_suffix}: {str(e)}")
+            logger.warning(f"Failed to publish MQTT batch: {str(e)}")
+            sent = []
+        
+        for (topic, _, _), (sent_at, future) in zip(messages, sent):
+            acked_at = future.result() if future.done() else None
+            if acked_at is None:
+                report["failed"].append(topic)
+            else:
+                report["published"] += 1
+                report["latency_ms"][topic] = round((acked_at - sent_at) * 1000, 1)
+        report["failed"] += [topic for topic, _, _ in messages[len(sent):]]
+        if report["failed"]:
+            # Forget unacknowledged messages so late acks don't resolve stale futures
+            self.transport.forget([future for _, future in sent if not future.done()])
+            logger.warning(f"MQTT batch: no ack within {timeout}s for {', '.join(report['failed'])}")
+        
+        # Only fully acknowledged sensors count as published state; the rest are queued
+        failed = set(report["failed"])
+        undelivered = []
+        for suffix, group, fingerprint in pending:
+            if any(topic in failed for topic, _, _ in group):
+                undelivered.append((suffix, group, fingerprint))
+            else:
+                self.state.record(group[0][0], fingerprint, group)
+        self.state.save()
+        if undelivered:
+            await self._enqueue(undelivered)
+            report["queued"] = [suffix for suffix, _, _ in undelivered]
+        report["elapsed_ms"] = round((time.monotonic() - start) * 1000, 1)
+        logger.debug(f"MQTT batch published {report['published']}/{len(messages)} in {report['elapsed_ms']}ms")
+        return report
     
-    async def publish_account_balance(self, balance: str, timestamp: Optional[str] = None):
-        """Publish account balance update"""
+    async def _enqueue(self, pending: List[Tuple[str, List[Tuple[str, str, bool]], str]]):
+        from async_database import enqueue_mqtt_messages
+        entries = [{
+            "state_key": group[0][0],
+            "fingerprint": fingerprint,
+            "messages": [list(m) for m in group],
+            "qos": self.qos,
+            "retain": self.retain,
+        } for _, group, fingerprint in pending]
+        try:
+            result = await enqueue_mqtt_messages(entries, self.queue_max)
+        except Exception as e:
+            logger.error(f"Failed to queue MQTT messages, dropping them: {e}")
+            return
+        self._queue_depth = result["depth"]
+        self._queue_metrics["enqueued"] += len(entries)
+        if result["dropped"]:
+            self._queue_metrics["dropped"] += result["dropped"]
+            logger.warning(f"MQTT queue full ({self.queue_max}), dropped {result['dropped']} oldest messages")
+    
+    async def drain_queue(self, timeout: float = PUBLISH_BATCH_TIMEOUT) -> int:
+        """Send queued messages oldest first while connected; returns how many were delivered"""
+        from async_database import get_mqtt_outbox, delete_mqtt_outbox
+        async with self._drain_lock:
+            start = time.monotonic()
+            delivered = 0
+            try:
+                while self.connected:
+                    rows = await get_mqtt_outbox(50)
+                    if not rows:
+                        self._queue_depth = 0
+                        break
+                    sent = []
+                    for row in rows:
+                        messages = [(topic, payload, retain) for topic, payload, retain in row["messages"]]
+                        sent.append((row, await self.transport.publish(messages, row["qos"])))
+                    futures = [future for _, results in sent for _, future in results]
+                    await asyncio.wait(futures, timeout=timeout)
+                    done_ids = []
+                    for row, results in sent:
+                        if all(future.done() and future.result() is not None for _, future in results):
+                            done_ids.append(row["id"])
+                            if row["retain"] and row["fingerprint"]:
+                                self.state.record(row["state_key"], row["fingerprint"], row["messages"])
+                    self.transport.forget([future for future in futures if not future.done()])
+                    self._queue_depth = await delete_mqtt_outbox(done_ids) if done_ids else len(rows)
+                    delivered += len(done_ids)
+                    if len(done_ids) < len(rows):
+                        break
+            except Exception as e:
+                logger.warning(f"MQTT queue drain failed: {e}")
+            if delivered:
+                self.state.save()
+                elapsed_ms = round((time.monotonic() - start) * 1000, 1)
+                self._queue_metrics.update(drained=self._queue_metrics["drained"] + delivered,
+                                           last_drain_count=delivered, last_drain_ms=elapsed_ms,
+                                           last_drain_at=utc_now_iso())
+                logger.info(f"MQTT queue drained {delivered} messages in {elapsed_ms}ms")
+            return delivered
+    
+    async def queue_stats(self) -> Dict[str, Any]:
+        """Outbound queue depth, age and drain metrics"""
+        from async_database import get_mqtt_outbox_stats
+        stats = await get_mqtt_outbox_stats()
+        self._queue_depth = stats["depth"]
+        return {**stats, "max": self.queue_max, **self._queue_metrics}
+    
+    def account_balance_message(self, balance: str, timestamp: Optional[str] = None) -> Message:
+        """Build the account balance update message (see publish_batch)"""
         numeric_value = self._extract_numeric(balance)
         json_payload = {
             "event_type": "account_balance",
@@ -346,10 +626,14 @@ class MQTTClient:
                 "timestamp": timestamp or utc_now_iso()
             }
         }
-        await self.publish("account_balance", numeric_value, json_payload)
+        return ("account_balance", numeric_value, json_payload)
     
-    async def publish_latest_bill(self, bill_data: Dict[str, Any], timestamp: Optional[str] = None):
-        """Publish latest bill update"""
+    async def publish_account_balance(self, balance: str, timestamp: Optional[str] = None):
+        """Publish account balance update"""
+        await self.publish(*self.account_balance_message(balance, timestamp))
+    
+    def latest_bill_message(self, bill_data: Dict[str, Any], timestamp: Optional[str] = None) -> Message:
+        """Build the latest bill update message (see publish_batch)"""
         numeric_value = self._extract_numeric(bill_data.get("bill_total", "0"))
         json_payload = {
             "event_type": "latest_bill",
@@ -362,10 +646,14 @@ class MQTTClient:
                 "timestamp": timestamp or utc_now_iso()
             }
         }
-        await self.publish("latest_bill", numeric_value, json_payload)
+        return ("latest_bill", numeric_value, json_payload)
     
-    async def publish_previous_bill(self, bill_data: Dict[str, Any], timestamp: Optional[str] = None):
-        """Publish previous bill update"""
+    async def publish_latest_bill(self, bill_data: Dict[str, Any], timestamp: Optional[str] = None):
+        """Publish latest bill update"""
+        await self.publish(*self.latest_bill_message(bill_data, timestamp))
+    
+    def previous_bill_message(self, bill_data: Dict[str, Any], timestamp: Optional[str] = None) -> Message:
+        """Build the previous bill update message (see publish_batch)"""
         numeric_value = self._extract_numeric(bill_data.get("bill_total", "0"))
         json_payload = {
             "event_type": "previous_bill",
@@ -378,10 +666,14 @@ class MQTTClient:
                 "timestamp": timestamp or utc_now_iso()
             }
         }
-        await self.publish("previous_bill", numeric_value, json_payload)
+        return ("previous_bill", numeric_value, json_payload)
     
-    async def publish_last_payment(self, payment_data: Dict[str, Any], timestamp: Optional[str] = None):
-        """Publish last payment update"""
+    async def publish_previous_bill(self, bill_data: Dict[str, Any], timestamp: Optional[str] = None):
+        """Publish previous bill update"""
+        await self.publish(*self.previous_bill_message(bill_data, timestamp))
+    
+    def last_payment_message(self, payment_data: Dict[str, Any], timestamp: Optional[str] = None) -> Message:
+        """Build the last payment update message (see publish_batch)"""
         numeric_value = self._extract_numeric(payment_data.get("amount", "0"))
         json_payload = {
             "event_type": "last_payment",
@@ -394,7 +686,11 @@ class MQTTClient:
                 "timestamp": timestamp or utc_now_iso()
             }
         }
-        await self.publish("last_payment", numeric_value, json_payload)
+        return ("last_payment", numeric_value, json_payload)
+    
+    async def publish_last_payment(self, payment_data: Dict[str, Any], timestamp: Optional[str] = None):
+        """Publish last payment update"""
+        await self.publish(*self.last_payment_message(payment_data, timestamp))
     
     async def publish_tts_request(
         self,
@@ -421,12 +717,7 @@ class MQTTClient:
             "timestamp": utc_now_iso(),
         }
         try:
-            payload_str = json.dumps(payload)
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                None,
-                lambda: self.client.publish(topic, payload_str, self.qos, False),
-            )
+            await self.transport.publish([(topic, json.dumps(payload), False)], self.qos)
             logger.info(f"TTS request published to {topic}")
         except Exception as e:
             logger.warning(f"Failed to publish TTS request: {e}")
@@ -442,9 +733,9 @@ class MQTTClient:
 
     async def publish_bill_pdf_url_all(self, base_url: str, timestamp: Optional[str] = None):
         """Publish bill PDF URLs: state=latest, attributes=all period links"""
-        from database import get_all_bill_documents_with_periods, get_latest_bill_id_with_document
-        docs = get_all_bill_documents_with_periods()
-        latest_id = get_latest_bill_id_with_document()
+        from async_database import get_all_bill_documents_with_periods, get_latest_bill_id_with_document
+        docs = await get_all_bill_documents_with_periods()
+        latest_id = await get_latest_bill_id_with_document()
         latest_url = f"{base_url.rstrip('/')}/api/bill-document/{latest_id}" if latest_id else ""
         all_bills = {}
         for d in docs:
@@ -463,9 +754,9 @@ class MQTTClient:
         }
         await self.publish("bill_pdf_url", latest_url or "unknown", json_payload)
 
-    async def publish_payee_summary(self, payee_data: list, bill_info: Dict[str, Any], timestamp: Optional[str] = None):
+    def payee_summary_message(self, payee_data: list, bill_info: Dict[str, Any], timestamp: Optional[str] = None) -> Message:
         """
-        Publish payee summary for the most recent billing period
+        Build the payee summary message for the most recent billing period
         
         Args:
             payee_data: List of payee summaries with name, amount_paid, share_of_bill
@@ -484,11 +775,7 @@ class MQTTClient:
         
         # Add each payee's data with their name as prefix (lowercase, spaces to underscores)
         for p in payee_data:
-            name = p.get('name', 'Unknown')
-            # Create safe prefix: lowercase, replace spaces with underscores, remove special chars
-            prefix = re.sub(r'[^a-z0-9_]', '', name.lower().replace(' ', '_'))
-            if not prefix:
-                prefix = 'unknown'
+            prefix = payee_prefix(p.get('name', 'Unknown'))
             
             paid = p.get('amount_paid', 0) or 0
             share = p.get('share_of_bill', 0) or 0
@@ -515,7 +802,11 @@ class MQTTClient:
         }
         
         # Publish as JSON only (no simple numeric value makes sense here)
-        await self.publish("payee_summary", json.dumps(json_payload), json_payload)
+        return ("payee_summary", json.dumps(json_payload), json_payload)
+    
+    async def publish_payee_summary(self, payee_data: list, bill_info: Dict[str, Any], timestamp: Optional[str] = None):
+        """Publish payee summary for the most recent billing period"""
+        await self.publish(*self.payee_summary_message(payee_data, bill_info, timestamp))
 
 
 # Global MQTT client instance
@@ -523,7 +814,8 @@ _mqtt_client: Optional[MQTTClient] = None
 
 def init_mqtt_client(mqtt_url: str = "", username: str = "", password: str = "",
                      base_topic: str = "coned", qos: int = 1, retain: bool = True,
-                     discovery: bool = True) -> Optional[MQTTClient]:
+                     discovery: bool = True, transport: str = "paho",
+                     queue_max: int = 500) -> Optional[MQTTClient]:
     """Initialize MQTT client from configuration"""
     global _mqtt_client
     
@@ -541,8 +833,10 @@ def init_mqtt_client(mqtt_url: str = "", username: str = "", password: str = "",
             qos,
             retain,
             discovery,
+            transport or "paho",
+            queue_max=queue_max,
         )
-        logger.info(f"MQTT client initialized for {mqtt_url}")
+        logger.info(f"MQTT client initialized for {mqtt_url} ({_mqtt_client.transport_name if _mqtt_client.enabled else 'disabled'})")
         return _mqtt_client
     except Exception as e:
         logger.error(f"Failed to initialize MQTT client: {str(e)}")
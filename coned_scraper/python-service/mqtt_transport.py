@@ -0,0 +1,447 @@
+"""
+MQTT transports used by MQTTClient.
+
+PahoTransport wraps paho-mqtt (network thread + executor hops).
+AsyncioTransport speaks MQTT 3.1.1 directly over asyncio streams: awaited
+CONNACK/PUBACK, keepalive pings and exponential-backoff reconnect, no threads.
+
+Both expose the same interface: connect(), disconnect(), connected,
+publish(messages, qos) -> [(sent_at, ack_future)], where each future resolves
+to the time.monotonic() of the broker ack (or None if it failed), and
+subscribe(topic, handler) for exact-topic QoS 0 subscriptions that are
+renewed on every reconnect.
+"""
+import asyncio
+import logging
+import ssl
+import struct
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, List, Tuple, Callable, Awaitable
+
+try:
+    import paho.mqtt.client as mqtt
+    MQTT_AVAILABLE = True
+except ImportError:
+    MQTT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# (topic, payload, retain)
+OutMessage = Tuple[str, str, bool]
+PublishResult = List[Tuple[float, asyncio.Future]]
+OnConnect = Callable[[], Awaitable[None]]
+OnMessage = Callable[[str, bytes], Awaitable[None]]
+
+TRANSPORTS = ("paho", "asyncio")
+CONNECT_TIMEOUT = 10.0
+KEEPALIVE = 60
+
+
+def _resolve_ack(future: asyncio.Future, acked_at: Optional[float]):
+    if not future.done():
+        future.set_result(acked_at)
+
+
+def _client_id() -> str:
+    return f"coned_scraper_{datetime.now().timestamp()}"
+
+
+class PahoTransport:
+    """paho-mqtt client driven by its own network thread (loop_start)"""
+
+    def __init__(self, host: str, port: int, use_tls: bool, username: Optional[str] = None,
+                 password: Optional[str] = None, on_connect: Optional[OnConnect] = None):
+        self.host = host
+        self.port = port
+        self.connected = False
+        self._on_connect_cb = on_connect
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connack: Optional[asyncio.Future] = None
+        # Ack tracking: mid -> (loop, future). Acks that arrive before their
+        # mid is registered are parked in _early_acks (bounded).
+        self._ack_lock = threading.Lock()
+        self._ack_waiters: Dict[int, Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+        self._early_acks: "OrderedDict[int, float]" = OrderedDict()
+        self._subscriptions: Dict[str, OnMessage] = {}
+
+        self.client = mqtt.Client(client_id=_client_id())
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+        self.client.on_message = self._on_message
+        if username and password:
+            self.client.username_pw_set(username, password)
+        if use_tls:
+            self.client.tls_set()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        """Callback (network thread) for CONNACK, including paho's automatic reconnects"""
+        self.connected = rc == 0
+        if rc == 0:
+            logger.info(f"MQTT connected to {self.host}:{self.port}")
+        else:
+            logger.error(f"MQTT connection failed with code {rc}")
+        if rc == 0:
+            for topic in list(self._subscriptions):
+                self.client.subscribe(topic, 0)
+        if self._loop is None:
+            return
+        if self._connack is not None:
+            self._loop.call_soon_threadsafe(_resolve_ack, self._connack, rc)
+        if rc == 0 and self._on_connect_cb:
+            asyncio.run_coroutine_threadsafe(self._on_connect_cb(), self._loop)
+
+    def _on_disconnect(self, client, userdata, rc):
+        """Callback for when MQTT client disconnects"""
+        self.connected = False
+        if rc != 0:
+            logger.warning(f"MQTT disconnected unexpectedly (code {rc}). Will attempt to reconnect.")
+        # In-flight acks will never arrive on this session
+        with self._ack_lock:
+            waiters, self._ack_waiters = self._ack_waiters, {}
+        for loop, future in waiters.values():
+            loop.call_soon_threadsafe(_resolve_ack, future, None)
+
+    def _on_publish(self, client, userdata, mid):
+        """Callback (network thread) when a message is sent (QoS 0) or acknowledged (QoS 1/2)"""
+        acked_at = time.monotonic()
+        with self._ack_lock:
+            waiter = self._ack_waiters.pop(mid, None)
+            if waiter is None:
+                self._early_acks[mid] = acked_at
+                while len(self._early_acks) > 1024:
+                    self._early_acks.popitem(last=False)
+                return
+        loop, future = waiter
+        loop.call_soon_threadsafe(_resolve_ack, future, acked_at)
+
+    def _on_message(self, client, userdata, message):
+        """Callback (network thread) for subscribed topics; handlers run on the event loop"""
+        handler = self._subscriptions.get(message.topic)
+        if handler and self._loop:
+            asyncio.run_coroutine_threadsafe(handler(message.topic, message.payload), self._loop)
+
+    def subscribe(self, topic: str, handler: OnMessage):
+        self._subscriptions[topic] = handler
+        if self.connected:
+            self.client.subscribe(topic, 0)
+
+    async def connect(self) -> bool:
+        self._loop = asyncio.get_running_loop()
+        self._connack = self._loop.create_future()
+        try:
+            await self._loop.run_in_executor(None, self.client.connect, self.host, self.port, KEEPALIVE)
+            self.client.loop_start()
+            await asyncio.wait_for(asyncio.shield(self._connack), CONNECT_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"MQTT broker did not answer CONNECT within {CONNECT_TIMEOUT}s")
+        finally:
+            self._connack = None
+        return self.connected
+
+    async def disconnect(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+        self.connected = False
+
+    def _publish_sync(self, messages: List[OutMessage], qos: int, futures: List[asyncio.Future],
+                      loop: asyncio.AbstractEventLoop) -> List[float]:
+        """Hand every message to paho in one executor hop; returns send times"""
+        sent_at = []
+        for (topic, payload, retain), future in zip(messages, futures):
+            sent_at.append(time.monotonic())
+            info = self.client.publish(topic, payload, qos, retain)
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                loop.call_soon_threadsafe(_resolve_ack, future, None)
+                continue
+            # Never hold _ack_lock across client.publish: paho calls on_publish
+            # with its own message lock held
+            with self._ack_lock:
+                acked_at = self._early_acks.pop(info.mid, None)
+                if acked_at is None:
+                    self._ack_waiters[info.mid] = (loop, future)
+            if acked_at is not None:
+                loop.call_soon_threadsafe(_resolve_ack, future, acked_at)
+        return sent_at
+
+    async def publish(self, messages: List[OutMessage], qos: int) -> PublishResult:
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in messages]
+        sent_at = await loop.run_in_executor(None, self._publish_sync, messages, qos, futures, loop)
+        return list(zip(sent_at, futures))
+
+    def forget(self, futures: List[asyncio.Future]):
+        """Stop tracking acks for futures the caller gave up on"""
+        with self._ack_lock:
+            for mid in [mid for mid, (_, f) in self._ack_waiters.items() if f in futures]:
+                del self._ack_waiters[mid]
+
+
+# MQTT 3.1.1 control packet types (high nibble of the fixed header)
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK = 8, 9
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def _encode_length(length: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        out.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(out)
+
+
+def _encode_str(value: str) -> bytes:
+    data = value.encode()
+    return struct.pack("!H", len(data)) + data
+
+
+def _packet(first_byte: int, body: bytes = b"") -> bytes:
+    return bytes([first_byte]) + _encode_length(len(body)) + body
+
+
+class AsyncioTransport:
+    """Minimal MQTT 3.1.1 publisher on asyncio streams (no paho, no threads)"""
+
+    def __init__(self, host: str, port: int, use_tls: bool, username: Optional[str] = None,
+                 password: Optional[str] = None, on_connect: Optional[OnConnect] = None,
+                 keepalive: int = KEEPALIVE, max_backoff: float = 60.0):
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.max_backoff = max_backoff
+        self.connected = False
+        self._on_connect_cb = on_connect
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._tasks: List[asyncio.Task] = []
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._closing = False
+        self._next_mid = 0
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self._last_pingresp = 0.0
+        self._subscriptions: Dict[str, OnMessage] = {}
+
+    def _allocate_mid(self) -> int:
+        for _ in range(65535):
+            self._next_mid = self._next_mid % 65535 + 1
+            if self._next_mid not in self._inflight:
+                return self._next_mid
+        raise RuntimeError("No free MQTT packet identifiers")
+
+    def _connect_packet(self) -> bytes:
+        flags = 0x02  # Clean session
+        payload = _encode_str(_client_id())
+        if self.username:
+            flags |= 0x80
+            payload += _encode_str(self.username)
+            if self.password:
+                flags |= 0x40
+                payload += _encode_str(self.password)
+        header = _encode_str("MQTT") + bytes([4, flags]) + struct.pack("!H", self.keepalive)
+        return _packet(CONNECT << 4, header + payload)
+
+    async def _read_packet(self) -> Tuple[int, int, bytes]:
+        first = (await self._reader.readexactly(1))[0]
+        multiplier, length = 1, 0
+        while True:
+            byte = (await self._reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        body = await self._reader.readexactly(length) if length else b""
+        return first >> 4, first & 0x0F, body
+
+    async def _open(self) -> bool:
+        """One connection attempt: TCP/TLS, CONNECT, await CONNACK, start reader + keepalive"""
+        ssl_ctx = ssl.create_default_context() if self.use_tls else None
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=ssl_ctx), CONNECT_TIMEOUT)
+        self._writer.write(self._connect_packet())
+        await self._writer.drain()
+        ptype, _, body = await asyncio.wait_for(self._read_packet(), CONNECT_TIMEOUT)
+        if ptype != CONNACK or len(body) < 2 or body[1] != 0:
+            rc = body[1] if ptype == CONNACK and len(body) >= 2 else -1
+            logger.error(f"MQTT connection failed with code {rc}")
+            self._writer.close()
+            return False
+        self.connected = True
+        self._last_pingresp = time.monotonic()
+        for topic in self._subscriptions:
+            self._writer.write(self._subscribe_packet(topic))
+        self._tasks = [asyncio.create_task(self._read_loop()), asyncio.create_task(self._keepalive_loop())]
+        logger.info(f"MQTT connected to {self.host}:{self.port} (asyncio)")
+        if self._on_connect_cb:
+            self._tasks.append(asyncio.create_task(self._on_connect_cb()))
+        return True
+
+    def _subscribe_packet(self, topic: str) -> bytes:
+        # SUBSCRIBE ids share the PUBLISH id space; nothing waits on the SUBACK
+        mid = self._allocate_mid()
+        return _packet((SUBSCRIBE << 4) | 0x02, struct.pack("!H", mid) + _encode_str(topic) + b"\x00")
+
+    def subscribe(self, topic: str, handler: OnMessage):
+        self._subscriptions[topic] = handler
+        if self.connected:
+            self._writer.write(self._subscribe_packet(topic))
+
+    def _handle_incoming(self, flags: int, body: bytes):
+        """Inbound PUBLISH on a subscribed topic: ack per its QoS and dispatch"""
+        qos = (flags >> 1) & 0x03
+        topic_len = struct.unpack("!H", body[:2])[0]
+        topic = body[2:2 + topic_len].decode()
+        pos = 2 + topic_len
+        if qos:
+            mid = body[pos:pos + 2]
+            pos += 2
+            self._writer.write(_packet((PUBACK if qos == 1 else PUBREC) << 4, mid))
+        handler = self._subscriptions.get(topic)
+        if handler:
+            self._tasks = [t for t in self._tasks if not t.done()]
+            self._tasks.append(asyncio.create_task(handler(topic, body[pos:])))
+
+    async def connect(self) -> bool:
+        async with self._lock:
+            if self.connected:
+                return True
+            self._closing = False
+            try:
+                return await self._open()
+            except Exception as e:
+                logger.error(f"Failed to connect to MQTT broker: {str(e)}")
+                self._schedule_reconnect()
+                return False
+
+    def _schedule_reconnect(self):
+        if self._closing or (self._reconnect_task and not self._reconnect_task.done()):
+            return
+        self._reconnect_task = asyncio.create_task(self._reconnect_loop())
+
+    async def _reconnect_loop(self):
+        delay = 1.0
+        while not self._closing and not self.connected:
+            await asyncio.sleep(delay)
+            async with self._lock:
+                if self._closing or self.connected:
+                    return
+                try:
+                    if await self._open():
+                        return
+                except Exception as e:
+                    logger.warning(f"MQTT reconnect failed ({e}), retrying in {min(delay * 2, self.max_backoff):.0f}s")
+            delay = min(delay * 2, self.max_backoff)
+
+    def _connection_lost(self, reason: str):
+        if not self.connected:
+            return
+        self.connected = False
+        for task in self._tasks:
+            if task is not asyncio.current_task():
+                task.cancel()
+        self._tasks = []
+        if self._writer:
+            self._writer.close()
+        for future in self._inflight.values():
+            _resolve_ack(future, None)
+        self._inflight.clear()
+        if not self._closing:
+            logger.warning(f"MQTT disconnected unexpectedly ({reason}). Will attempt to reconnect.")
+            self._schedule_reconnect()
+
+    async def _read_loop(self):
+        try:
+            while True:
+                ptype, flags, body = await self._read_packet()
+                if ptype in (PUBACK, PUBCOMP):
+                    mid = struct.unpack("!H", body[:2])[0]
+                    future = self._inflight.pop(mid, None)
+                    if future:
+                        _resolve_ack(future, time.monotonic())
+                elif ptype == PUBREC:
+                    self._writer.write(_packet((PUBREL << 4) | 0x02, body[:2]))
+                elif ptype == PUBREL:
+                    self._writer.write(_packet(PUBCOMP << 4, body[:2]))
+                elif ptype == PUBLISH:
+                    self._handle_incoming(flags, body)
+                elif ptype == PINGRESP:
+                    self._last_pingresp = time.monotonic()
+        except asyncio.CancelledError:
+            raise
+        except asyncio.IncompleteReadError:
+            self._connection_lost("connection closed by broker")
+        except Exception as e:
+            self._connection_lost(str(e) or type(e).__name__)
+
+    async def _keepalive_loop(self):
+        interval = max(self.keepalive / 2, 1)
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                if time.monotonic() - self._last_pingresp > self.keepalive * 1.5:
+                    self._connection_lost("keepalive timeout")
+                    return
+                self._writer.write(_packet(PINGREQ << 4))
+                await self._writer.drain()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._connection_lost(str(e) or type(e).__name__)
+
+    async def disconnect(self):
+        self._closing = True
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+        if self.connected:
+            try:
+                self._writer.write(_packet(DISCONNECT << 4))
+                await self._writer.drain()
+            except Exception:
+                pass
+        self._connection_lost("disconnect")
+        self.connected = False
+
+    async def publish(self, messages: List[OutMessage], qos: int) -> PublishResult:
+        loop = asyncio.get_running_loop()
+        results = []
+        for topic, payload, retain in messages:
+            future = loop.create_future()
+            sent_at = time.monotonic()
+            if not self.connected:
+                _resolve_ack(future, None)
+                results.append((sent_at, future))
+                continue
+            body = _encode_str(topic)
+            if qos:
+                mid = self._allocate_mid()
+                self._inflight[mid] = future
+                body += struct.pack("!H", mid)
+            body += payload.encode() if isinstance(payload, str) else payload
+            self._writer.write(_packet((PUBLISH << 4) | (qos << 1) | int(bool(retain)), body))
+            results.append((sent_at, future))
+        delivered = self.connected
+        if delivered:
+            try:
+                await self._writer.drain()
+            except Exception as e:
+                delivered = False
+                self._connection_lost(str(e) or type(e).__name__)
+        if not qos:
+            # QoS 0 has no ack: done once written to the socket
+            drained_at = time.monotonic()
+            for _, future in results:
+                _resolve_ack(future, drained_at if delivered else None)
+        return results
+
+    def forget(self, futures: List[asyncio.Future]):
+        """Stop tracking acks for futures the caller gave up on"""
+        for mid in [mid for mid, f in self._inflight.items() if f in futures]:
+            del self._inflight[mid]
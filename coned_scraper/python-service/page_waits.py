@@ -0,0 +1,155 @@
+"""
+Condition-based waits for the scraping flow.
+Each step waits for whatever shows the page is actually ready (a selector,
+the URL, a network response, a JS predicate or an asyncio.Event) instead of
+sleeping a fixed time. Step timeouts adapt to recent runs: a bit over twice
+the slowest recent successful wait, never above the step's default. Every
+wait is recorded and persisted so the next scrape starts with what was learned.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from data_config import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+WAIT_TIMINGS_FILE = DATA_DIR / "scrape_wait_timings.json"
+DEFAULT_TIMEOUT_MS = 15000
+MIN_TIMEOUT_MS = 2000
+SLACK_MS = 1000
+HISTORY = 20  # Successful waits kept per step
+
+
+class WaitStrategy:
+    """Per-step adaptive waits; wait_for() returns whether the condition was met (never raises on timeout)"""
+
+    def __init__(self, path=WAIT_TIMINGS_FILE):
+        self.path = path
+        self._steps: Dict[str, Dict[str, Any]] = {}
+        try:
+            if self.path.exists():
+                for step, data in json.loads(self.path.read_text()).items():
+                    self._steps[step] = self._new_step(data)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable wait timings: {e}")
+
+    @staticmethod
+    def _new_step(data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        data = data or {}
+        return {
+            "samples": deque(data.get("samples", []), maxlen=HISTORY),
+            "misses": data.get("misses", 0),
+            "last_ms": data.get("last_ms"),
+            "last_met": data.get("last_met", True),
+            "default_ms": data.get("default_ms", DEFAULT_TIMEOUT_MS),
+        }
+
+    def timeout_for(self, step: str, default_ms: int = DEFAULT_TIMEOUT_MS) -> int:
+        """Learned timeout for step; the default until it has succeeded at least once"""
+        s = self._steps.get(step)
+        if not s or not s["samples"]:
+            return default_ms
+        return int(min(default_ms, max(MIN_TIMEOUT_MS, 2 * max(s["samples"]) + SLACK_MS)))
+
+    def record(self, step: str, elapsed_ms: float, met: bool, default_ms: int = DEFAULT_TIMEOUT_MS):
+        s = self._steps.setdefault(step, self._new_step())
+        s["default_ms"] = default_ms
+        s["last_ms"] = round(elapsed_ms)
+        s["last_met"] = met
+        if met:
+            s["samples"].append(round(elapsed_ms))
+        else:
+            s["misses"] += 1
+
+    async def _race(self, page, timeout_ms: float, selector, state, url, response, function, event, action) -> bool:
+        """True as soon as any condition holds; False when all failed or timed out"""
+        waiters = []
+        if selector:
+            waiters.append(page.locator(selector).first.wait_for(state=state, timeout=timeout_ms))
+        if url:
+            waiters.append(page.wait_for_url(url, wait_until="commit", timeout=timeout_ms))
+        if response:
+            waiters.append(page.wait_for_event("response", predicate=response, timeout=timeout_ms))
+        if function:
+            waiters.append(page.wait_for_function(function, timeout=timeout_ms))
+        if event is not None:
+            waiters.append(event.wait())
+        # Armed before the action, so a response it triggers can't be missed
+        pending = {asyncio.ensure_future(w) for w in waiters}
+        try:
+            if action is not None:
+                await action()
+            deadline = time.monotonic() + timeout_ms / 1000
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    return False
+                # Check every finished waiter so failed ones don't log "exception never retrieved"
+                succeeded = [not task.cancelled() and task.exception() is None for task in done]
+                if any(succeeded):
+                    return True
+            return False
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def wait_for(self, page, step: str, *, selector: Optional[str] = None, state: str = "visible",
+                       url: Any = None, response: Optional[Callable] = None, function: Optional[str] = None,
+                       event: Optional[asyncio.Event] = None, action: Optional[Callable] = None,
+                       default_ms: int = DEFAULT_TIMEOUT_MS, optional: bool = False) -> bool:
+        """
+        Wait until any given condition holds: selector reaches state, URL matches
+        (string/glob/regex/callable), a response matches the predicate, the JS
+        function returns truthy, or event is set. action (an async callable) runs
+        after the waiters are armed, for conditions it triggers.
+        Waits up to the learned timeout; required steps then keep waiting up to
+        default_ms, optional steps (the condition may never happen) give up.
+        """
+        timeout_ms = self.timeout_for(step, default_ms)
+        start = time.perf_counter()
+        met = await self._race(page, timeout_ms, selector, state, url, response, function, event, action)
+        if not met and not optional and timeout_ms < default_ms:
+            logger.info(f"Wait '{step}' slower than usual ({timeout_ms} ms), allowing up to {default_ms} ms")
+            met = await self._race(page, default_ms - timeout_ms, selector, state, url, response, function, event, None)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.record(step, elapsed_ms, met, default_ms)
+        logger.debug(f"Wait '{step}': {'ready' if met else 'timed out'} after {elapsed_ms:.0f} ms")
+        return met
+
+    def save(self):
+        try:
+            data = {step: dict(s, samples=list(s["samples"])) for step, s in self._steps.items()}
+            self.path.write_text(json.dumps(data, indent=2))
+        except Exception as e:
+            logger.warning(f"Could not save wait timings: {e}")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-step last/avg/max wait, misses and the timeout the next run will use"""
+        return {
+            step: {
+                "last_ms": s["last_ms"],
+                "last_met": s["last_met"],
+                "avg_ms": round(sum(s["samples"]) / len(s["samples"])) if s["samples"] else None,
+                "max_ms": max(s["samples"]) if s["samples"] else None,
+                "samples": len(s["samples"]),
+                "misses": s["misses"],
+                "next_timeout_ms": self.timeout_for(step, s["default_ms"]),
+            }
+            for step, s in self._steps.items()
+        }
+
+
+_wait_strategy: Optional[WaitStrategy] = None
+
+
+def get_wait_strategy() -> WaitStrategy:
+    """Shared wait strategy (timings loaded from disk on first use)"""
+    global _wait_strategy
+    if _wait_strategy is None:
+        _wait_strategy = WaitStrategy()
+    return _wait_strategy
@@ -0,0 +1,118 @@
+"""
+Request blocking for scrape browser contexts.
+Images, fonts, media and third-party trackers are aborted through
+context.route before they are fetched; the scrape only needs a few DOM
+nodes. Stylesheets and scripts are kept: the login flow relies on real
+visibility and on the site's own JS. Screenshots can opt back in to
+images/fonts (see RequestBlocker.allow_visuals).
+"""
+import json
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+from data_config import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+REQUEST_POLICY_FILE = DATA_DIR / "request_policy.json"
+
+# Resource types a screenshot needs to look right
+VISUAL_RESOURCE_TYPES = ("image", "font", "media")
+
+DEFAULT_REQUEST_POLICY = {
+    "enabled": True,
+    "deny_resource_types": ["image", "font", "media"],
+    "deny_hosts": [
+        "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googleadservices.com",
+        "googlesyndication.com", "facebook.net", "facebook.com", "connect.facebook.net",
+        "bat.bing.com", "clarity.ms", "hotjar.com", "quantummetric.com", "newrelic.com",
+        "nr-data.net", "demdex.net", "omtrdc.net", "everesttech.net", "linkedin.com",
+        "ads.linkedin.com", "pinterest.com", "tiktok.com", "twitter.com", "t.co",
+        "scorecardresearch.com", "adsrvr.org", "criteo.com", "taboola.com", "outbrain.com",
+    ],
+    # Always let through, even if a deny rule matches (e.g. a CDN the login needs)
+    "allow_hosts": [],
+    # Load images/fonts for the whole scrape so live previews look like the real page
+    "live_preview_assets": False,
+    # Reload the account page with images/fonts before the balance screenshot
+    "screenshot_assets": False,
+}
+
+
+def load_request_policy() -> dict:
+    policy = json.loads(json.dumps(DEFAULT_REQUEST_POLICY))  # Deep copy
+    if not REQUEST_POLICY_FILE.exists():
+        return policy
+    try:
+        policy.update(json.loads(REQUEST_POLICY_FILE.read_text()))
+    except Exception as e:
+        logger.warning(f"Failed to load request policy: {e}")
+    return policy
+
+
+def save_request_policy(policy: dict):
+    REQUEST_POLICY_FILE.write_text(json.dumps(policy))
+
+
+def _host_matches(host: str, domains) -> bool:
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+
+class RequestBlocker:
+    """Route handler for one browser context; counts what it blocks"""
+
+    def __init__(self, policy: Optional[dict] = None):
+        policy = policy or load_request_policy()
+        self.enabled = bool(policy.get("enabled", True))
+        self.deny_types = set(policy.get("deny_resource_types") or [])
+        self.deny_hosts = [h.strip().lower().lstrip(".") for h in policy.get("deny_hosts") or [] if h.strip()]
+        self.allow_hosts = [h.strip().lower().lstrip(".") for h in policy.get("allow_hosts") or [] if h.strip()]
+        self.screenshot_assets = bool(policy.get("screenshot_assets", False))
+        self._visuals = bool(policy.get("live_preview_assets", False))
+        self.allowed = 0
+        self.blocked: Dict[str, int] = {}
+
+    def should_block(self, url: str, resource_type: str) -> Optional[str]:
+        """Reason to block the request ('tracker' or its resource type), or None to let it through"""
+        host = (urlsplit(url).hostname or "").lower()
+        if not host or _host_matches(host, self.allow_hosts):
+            return None
+        if _host_matches(host, self.deny_hosts):
+            return "tracker"
+        if resource_type in self.deny_types and not (self._visuals and resource_type in VISUAL_RESOURCE_TYPES):
+            return resource_type
+        return None
+
+    async def _handle(self, route):
+        request = route.request
+        reason = self.should_block(request.url, request.resource_type)
+        try:
+            if reason:
+                self.blocked[reason] = self.blocked.get(reason, 0) + 1
+                await route.abort("blockedbyclient")
+            else:
+                self.allowed += 1
+                await route.continue_()
+        except Exception as e:
+            # Page/context closed while the request was in flight
+            logger.debug(f"Route for {request.url[:80]} not handled: {e}")
+
+    async def install(self, context):
+        if not self.enabled:
+            return
+        await context.route("**/*", self._handle)
+
+    @contextmanager
+    def allow_visuals(self):
+        """Let images/fonts/media through for requests made inside the block"""
+        previous, self._visuals = self._visuals, True
+        try:
+            yield self
+        finally:
+            self._visuals = previous
+
+    def stats(self) -> Dict[str, Any]:
+        return {"allowed": self.allowed, "blocked": dict(self.blocked), "blocked_total": sum(self.blocked.values())}
+
@@ -0,0 +1,117 @@
+"""
+Retention and compaction for the history tables (logs, scrape_history,
+account_balance_history, scraped_data). Runs periodically in the background,
+trims by row count and age, then incrementally vacuums the database file.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+from data_config import DATA_DIR
+RETENTION_CONFIG_FILE = DATA_DIR / "retention_config.json"
+
+DEFAULT_RETENTION_CONFIG = {
+    "enabled": True,
+    "interval_hours": 6,
+    "vacuum_pages": 0,  # Pages freed per run (0 = all free pages)
+    "tables": {
+        "logs": {"max_rows": 5000, "max_age_days": 14},
+        "scrape_history": {"max_rows": 100, "max_age_days": None},
+        "account_balance_history": {"max_rows": None, "max_age_days": None},
+        "scraped_data": {"max_rows": None, "max_age_days": 180},  # Compressed/delta snapshots
+    },
+    "last_run": None,
+    "last_result": None,
+}
+
+
+def load_retention_config() -> dict:
+    defaults = json.loads(json.dumps(DEFAULT_RETENTION_CONFIG))  # Deep copy
+    if not RETENTION_CONFIG_FILE.exists():
+        return defaults
+    try:
+        data = json.loads(RETENTION_CONFIG_FILE.read_text())
+        tables = data.pop("tables", {}) or {}
+        defaults.update(data)
+        for table, rule in tables.items():
+            if table in defaults["tables"]:
+                defaults["tables"][table].update(rule)
+        return defaults
+    except Exception as e:
+        logger.warning(f"Failed to load retention config: {e}")
+        return defaults
+
+
+def save_retention_config(config: dict):
+    RETENTION_CONFIG_FILE.write_text(json.dumps(config))
+
+
+async def run_compaction() -> Dict[str, Any]:
+    """Apply the configured rules now and record the result in the config file."""
+    from async_database import run_db
+    from database import apply_retention
+    cfg = load_retention_config()
+    result = await run_db(apply_retention, cfg["tables"], cfg.get("vacuum_pages") or 0)
+    result["ran_at"] = datetime.now(timezone.utc).isoformat()
+    cfg = load_retention_config()  # Re-read in case settings changed meanwhile
+    cfg["last_run"] = result["ran_at"]
+    cfg["last_result"] = result
+    save_retention_config(cfg)
+    logger.info(f"Retention: deleted {sum(result['rows_deleted'].values())} rows, "
+                f"reclaimed {result['bytes_reclaimed']} bytes")
+    return result
+
+
+def _seconds_until_due(cfg: dict) -> float:
+    last_run = cfg.get("last_run")
+    if not last_run:
+        return 0
+    try:
+        due = datetime.fromisoformat(last_run) + timedelta(hours=float(cfg.get("interval_hours") or 6))
+    except ValueError:
+        return 0
+    return (due - datetime.now(timezone.utc)).total_seconds()
+
+
+_retention_task: Optional[asyncio.Task] = None
+
+
+def start_retention_task():
+    """Start the background compaction loop (checks at least hourly)."""
+    global _retention_task
+
+    async def _loop():
+        while True:
+            try:
+                cfg = load_retention_config()
+                if not cfg.get("enabled"):
+                    await asyncio.sleep(3600)
+                    continue
+                wait_secs = _seconds_until_due(cfg)
+                if wait_secs > 0:
+                    await asyncio.sleep(min(wait_secs, 3600))
+                    continue
+                await run_compaction()
+            except asyncio.CancelledError:
+                break
+            except Exception:
+                logger.exception("Retention task error")
+                await asyncio.sleep(3600)
+
+    _retention_task = asyncio.create_task(_loop())
+    logger.info("Retention task started")
+
+
+async def stop_retention_task():
+    global _retention_task
+    if _retention_task and not _retention_task.done():
+        _retention_task.cancel()
+        try:
+            await _retention_task
+        except asyncio.CancelledError:
+            pass
+    _retention_task = None
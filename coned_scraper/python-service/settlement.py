@@ -0,0 +1,189 @@
+"""
+Vectorized payee settlement engine (NumPy).
+
+Same rules as database.calculate_all_payee_balances(), computed on a
+bills x payees matrix in one pass: rollover is a cumsum along the time axis.
+Also evaluates many "what-if" responsibility splits at once.
+"""
+from typing import Optional, List, Dict, Any
+
+from database import db_connection, parse_amount
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+SETTLED_TOLERANCE = 0.01
+
+
+def _require_numpy():
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("numpy not installed. Install with: pip install numpy")
+
+
+def load_settlement_inputs(cursor) -> Dict[str, Any]:
+    """
+    Load the engine inputs in three queries.
+
+    Returns bill_ids (B), payee ids/names (P), bill_totals (B), percents (P),
+    paid (B x P, attributed payments) and bill_paid (B, all payments incl. unattributed).
+    """
+    _require_numpy()
+    cursor.execute('SELECT id, bill_total FROM bills ORDER BY bill_cycle_iso, first_scraped_at, id')
+    bills = cursor.fetchall()
+    cursor.execute('SELECT id, name, responsibility_percent FROM payee_users ORDER BY name')
+    payees = cursor.fetchall()
+    cursor.execute('''
+        SELECT bill_id, payee_user_id, SUM(amount_numeric) as total_paid
+        FROM payments
+        WHERE bill_id IS NOT NULL
+        GROUP BY bill_id, payee_user_id
+    ''')
+    payment_rows = cursor.fetchall()
+
+    bill_index = {row['id']: i for i, row in enumerate(bills)}
+    payee_index = {row['id']: j for j, row in enumerate(payees)}
+    paid = np.zeros((len(bills), len(payees)))
+    bill_paid = np.zeros(len(bills))
+    for row in payment_rows:
+        i = bill_index.get(row['bill_id'])
+        if i is None:
+            continue
+        amount = row['total_paid'] or 0
+        bill_paid[i] += amount
+        j = payee_index.get(row['payee_user_id'])
+        if j is not None:
+            paid[i, j] += amount
+
+    return {
+        'bill_ids': [row['id'] for row in bills],
+        'payee_ids': [row['id'] for row in payees],
+        'payee_names': [row['name'] for row in payees],
+        'bill_totals': np.array([parse_amount(row['bill_total']) or 0.0 for row in bills], dtype=float),
+        'percents': np.array([row['responsibility_percent'] or 0 for row in payees], dtype=float),
+        'paid': paid,
+        'bill_paid': bill_paid,
+    }
+
+
+def compute_settlement(bill_totals, paid, percents) -> Dict[str, Any]:
+    """
+    Settle every bill for one or many responsibility splits.
+
+    bill_totals: (B,), paid: (B, P), percents: (P,) or (S, P) for S scenarios.
+    Returned arrays are (B, P), or (S, B, P) when percents is 2-D.
+    """
+    _require_numpy()
+    percents = np.asarray(percents, dtype=float)
+    # Non-positive percentages carry no share (matches the row-by-row rule)
+    fractions = np.where(percents > 0, percents, 0.0) / 100.0
+    share = bill_totals[:, None] * fractions[..., None, :]
+    period_balance = paid - share
+    total_balance = np.cumsum(period_balance, axis=-2)
+    # Rollover into bill i is the running balance after bill i-1
+    rollover_in = np.zeros_like(total_balance)
+    rollover_in[..., 1:, :] = total_balance[..., :-1, :]
+    return {
+        'share_of_bill': share,
+        'amount_paid': np.broadcast_to(paid, share.shape),
+        'rollover_in': rollover_in,
+        'period_balance': period_balance,
+        'total_balance': total_balance,
+    }
+
+
+def _payee_status(balance) -> str:
+    if balance > SETTLED_TOLERANCE:
+        return 'credit'
+    return 'settled' if abs(balance) <= SETTLED_TOLERANCE else 'owes'
+
+
+def calculate_all_payee_balances_vectorized() -> Dict[int, Dict[str, Any]]:
+    """Drop-in equivalent of database.calculate_all_payee_balances() using the matrix engine."""
+    with db_connection() as conn:
+        inputs = load_settlement_inputs(conn.cursor())
+    if not inputs['bill_ids']:
+        return {}
+
+    result = compute_settlement(inputs['bill_totals'], inputs['paid'], inputs['percents'])
+    rounded = {key: [[round(x, 2) for x in row] for row in value.tolist()] for key, value in result.items()}
+    total_balance = result['total_balance']
+    bill_balance = inputs['bill_totals'] - inputs['bill_paid']
+
+    summaries = {}
+    for i, bill_id in enumerate(inputs['bill_ids']):
+        total_paid = inputs['bill_paid'][i]
+        payee_summaries = [{
+            'user_id': payee_id,
+            'name': inputs['payee_names'][j],
+            'responsibility_percent': float(inputs['percents'][j]),
+            'share_of_bill': rounded['share_of_bill'][i][j],
+            'amount_paid': rounded['amount_paid'][i][j],
+            'rollover_in': rounded['rollover_in'][i][j],
+            'period_balance': rounded['period_balance'][i][j],
+            'total_balance': rounded['total_balance'][i][j],
+            'status': _payee_status(total_balance[i, j]),
+        } for j, payee_id in enumerate(inputs['payee_ids'])]
+        summaries[bill_id] = {
+            'bill_id': bill_id,
+            'bill_total': round(float(inputs['bill_totals'][i]), 2),
+            'total_paid': round(float(total_paid), 2),
+            'bill_balance': round(float(bill_balance[i]), 2),
+            'bill_status': 'paid' if bill_balance[i] <= 0.01 else ('partial' if total_paid > 0 else 'unpaid'),
+            'payee_summaries': payee_summaries,
+        }
+    return summaries
+
+
+def simulate_responsibility_splits(scenarios: List[Dict[int, float]],
+                                   bill_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    """
+    Evaluate "what-if" splits against the real payment history, all scenarios in one pass.
+
+    scenarios: [{user_id: percent}], payees left out get 0%.
+    bill_ids: optionally also return per-bill balances for these bills.
+    Returns one entry per scenario with each payee's final balance (after the newest bill).
+    """
+    with db_connection() as conn:
+        inputs = load_settlement_inputs(conn.cursor())
+
+    payee_ids = inputs['payee_ids']
+    percents = np.zeros((len(scenarios), len(payee_ids)))
+    for s, scenario in enumerate(scenarios):
+        for j, payee_id in enumerate(payee_ids):
+            percents[s, j] = scenario.get(payee_id, 0) or 0
+
+    result = compute_settlement(inputs['bill_totals'], inputs['paid'], percents)
+    total_balance = result['total_balance']  # (S, B, P)
+    if inputs['bill_ids']:
+        final = total_balance[:, -1, :]
+        total_share = result['share_of_bill'].sum(axis=1)
+    else:
+        final = np.zeros((len(scenarios), len(payee_ids)))
+        total_share = final
+    bill_positions = [(bill_id, inputs['bill_ids'].index(bill_id))
+                      for bill_id in (bill_ids or []) if bill_id in inputs['bill_ids']]
+
+    outcomes = []
+    for s, scenario in enumerate(scenarios):
+        outcome = {
+            'responsibilities': {payee_id: float(percents[s, j]) for j, payee_id in enumerate(payee_ids)},
+            'total': float(percents[s].sum()),
+            'payees': [{
+                'user_id': payee_id,
+                'name': inputs['payee_names'][j],
+                'total_share': round(float(total_share[s, j]), 2),
+                'total_paid': round(float(inputs['paid'][:, j].sum()), 2),
+                'final_balance': round(float(final[s, j]), 2),
+                'status': _payee_status(final[s, j]),
+            } for j, payee_id in enumerate(payee_ids)],
+        }
+        if bill_positions:
+            outcome['bills'] = {
+                bill_id: {payee_id: round(float(total_balance[s, i, j]), 2) for j, payee_id in enumerate(payee_ids)}
+                for bill_id, i in bill_positions
+            }
+        outcomes.append(outcome)
+    return outcomes
@@ -0,0 +1,69 @@
+"""
+Codec for raw scrape snapshots: canonical JSON, content hash, zlib compression
+and a small structural JSON delta (dict keys set/deleted/patched, lists and
+scalars replaced whole). Storage lives in database.py (snapshot_blobs table).
+"""
+import hashlib
+import json
+import zlib
+from typing import Any, Dict
+
+CODEC = "zlib"
+COMPRESSION_LEVEL = 6
+
+
+def canonical_json(data: Any) -> str:
+    """Stable serialization so equal content always hashes the same"""
+    return json.dumps(data, sort_keys=True, separators=(",", ":"))
+
+
+def content_hash(canonical: str) -> str:
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def compress(data: Any) -> bytes:
+    return zlib.compress(canonical_json(data).encode(), COMPRESSION_LEVEL)
+
+
+def decompress(payload: bytes, codec: str = CODEC) -> Any:
+    if codec != CODEC:
+        raise ValueError(f"Unsupported snapshot codec: {codec}")
+    return json.loads(zlib.decompress(payload))
+
+
+def diff(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Delta that turns dict old into dict new:
+    {'set': {key: value}, 'del': [key], 'sub': {key: nested delta}} (empty parts omitted)
+    """
+    set_keys = {}
+    sub = {}
+    for key, value in new.items():
+        if key not in old:
+            set_keys[key] = value
+        elif old[key] == value:
+            continue
+        elif isinstance(old[key], dict) and isinstance(value, dict):
+            sub[key] = diff(old[key], value)
+        else:
+            set_keys[key] = value
+    delta = {}
+    if set_keys:
+        delta["set"] = set_keys
+    deleted = [key for key in old if key not in new]
+    if deleted:
+        delta["del"] = deleted
+    if sub:
+        delta["sub"] = sub
+    return delta
+
+
+def apply(base: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Inverse of diff(): apply(old, diff(old, new)) == new. base is not modified."""
+    result = dict(base)
+    for key in delta.get("del", []):
+        result.pop(key, None)
+    result.update(delta.get("set", {}))
+    for key, nested in delta.get("sub", {}).items():
+        result[key] = apply(result.get(key) or {}, nested)
+    return result
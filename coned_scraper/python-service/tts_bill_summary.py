@@ -13,6 +13,7 @@ from zoneinfo import ZoneInfo
 logger = logging.getLogger(__name__)
 
 from data_config import DATA_DIR
+from ha_client import get_ha_client
 TTS_BILL_SUMMARY_CONFIG_FILE = DATA_DIR / "tts_bill_summary_config.json"
 
 DEFAULT_BILL_SUMMARY_CONFIG = {
@@ -92,31 +93,10 @@ def _format_kwh(val) -> str:
 
 async def _get_ha_sensor_values(entity_ids: list) -> Dict[str, str]:
     """Fetch HA entity states. Returns {entity_id: state}."""
-    token = os.environ.get("SUPERVISOR_TOKEN")
-    if not token or not entity_ids:
-        return {}
-    ids = [e.strip() for e in entity_ids if e and isinstance(e, str)]
-    if not ids:
-        return {}
-    try:
-        import aiohttp
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                "http://supervisor/core/api/states",
-                headers={"Authorization": f"Bearer {token}"},
-            ) as resp:
-                if resp.status != 200:
-                    return {}
-                data = await resp.json()
-                by_id = {
-                    s["entity_id"]: s.get("state", "unknown")
-                    for s in (data or [])
-                    if isinstance(s, dict) and "entity_id" in s
-                }
-                return {e: by_id.get(e, "unknown") for e in ids}
-    except Exception as e:
-        logger.debug(f"Could not get HA sensor values: {e}")
+    ids = [e.strip() for e in (entity_ids or []) if e and isinstance(e, str)]
+    if not ids or not os.environ.get("SUPERVISOR_TOKEN"):
         return {}
+    return await get_ha_client().get_states(ids) or {}
 
 
 def _format_currency(val: float) -> str:
@@ -193,8 +173,8 @@ async def build_bill_summary_message(bill_summary_config: dict, tts_config: dict
     prefix = f"{prefix} " if not prefix.endswith(".") and not prefix.endswith(" ") else prefix
 
     # Latest bill
-    from database import get_all_bills, get_current_balance
-    bills = get_all_bills(limit=1)
+    from async_database import get_all_bills, get_current_balance
+    bills = await get_all_bills(limit=1)
     bill_amt = 0.0
     bill_str = "$0"
     if bills:
@@ -203,7 +183,7 @@ async def build_bill_summary_message(bill_summary_config: dict, tts_config: dict
         bill_str = _format_currency(bill_amt)
 
     # Account balance
-    bal_row = get_current_balance()
+    bal_row = await get_current_balance()
     balance_str = "$0"
     if bal_row and bal_row.get("balance"):
         balance_str = str(bal_row["balance"])
@@ -289,43 +269,19 @@ async def build_bill_summary_message(bill_summary_config: dict, tts_config: dict
     return f"{prefix} {msg}".strip()
 
 
-_cached_ha_timezone: Optional[str] = None
-_cached_ha_timezone_at: Optional[datetime] = None
-_CACHE_TTL_SECONDS = 3600  # 1 hour
-
-
 async def _get_ha_timezone() -> Optional[str]:
-    """Fetch timezone from Home Assistant /api/config. Cached for 1 hour."""
-    global _cached_ha_timezone, _cached_ha_timezone_at
-    now = datetime.now(timezone.utc)
-    if _cached_ha_timezone is not None and _cached_ha_timezone_at is not None:
-        if (now - _cached_ha_timezone_at).total_seconds() < _CACHE_TTL_SECONDS:
-            return _cached_ha_timezone
-    token = os.environ.get("SUPERVISOR_TOKEN")
-    if not token:
+    """Fetch timezone from Home Assistant /api/config (cached by the HA client)."""
+    if not os.environ.get("SUPERVISOR_TOKEN"):
         return None
-    try:
-        import aiohttp
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                "http://supervisor/core/api/config",
-                headers={"Authorization": f"Bearer {token}"},
-            ) as resp:
-                if resp.status != 200:
-                    return None
-                data = await resp.json()
-                tz = (data.get("time_zone") or "").strip()
-                if tz:
-                    # Validate it's a known zone
-                    try:
-                        ZoneInfo(tz)
-                        _cached_ha_timezone = tz
-                        _cached_ha_timezone_at = now
-                        return tz
-                    except Exception:
-                        pass
-    except Exception as e:
-        logger.debug(f"Could not get HA timezone: {e}")
+    config = await get_ha_client().get_config()
+    tz = ((config or {}).get("time_zone") or "").strip()
+    if tz:
+        # Validate it's a known zone
+        try:
+            ZoneInfo(tz)
+            return tz
+        except Exception:
+            pass
     return None
 
 